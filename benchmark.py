@@ -0,0 +1,529 @@
+"""
+Benchmarks for the union find drawing demo.
+
+    python benchmark.py engines --size 400
+    python benchmark.py render --size 800
+    python benchmark.py freehand --size 800
+    python benchmark.py fill --size 800
+    python benchmark.py lines --segments 2000
+    python benchmark.py sessions --sizes 200 800 2000 4000
+    python benchmark.py startup --sizes 800x800 1920x1080 3840x2160
+    python benchmark.py label --sizes 1000 4000 --workers 1 4
+    python benchmark.py templates --shapes 2000 --sizes 8 32
+
+engines: memory and throughput of the dict-of-sets UnionFind against the flat ArrayUnionFind
+         for the same stream of shapes, committed with per node unions and with union_many.
+render:  full repaint (update_arr) and normalize_brightness on a canvas covered by horizontal bands, and
+         merging the two groups that cover the halves of the canvas (union_many across the seam and update_arr).
+freehand: milliseconds per freehand stroke segment on an empty canvas and on a canvas covered by bands.
+fill:    right click fill of an empty canvas and polygon fill of a large star, against the original BFS fills,
+         and adding the fill to each engine as a raster.Mask and as an array of (x, y) nodes.
+lines:   DDA line rasterizer (one call per segment and all segments in one call) against the original
+         recursive Shape.get_line.
+sessions: headless drawing sessions (many small stars, one giant fill, dense freehand scribbles, mass erases,
+         erasing a group that covers the whole canvas)
+         replayed through Session, reporting per operation latency percentiles and peak memory per canvas size.
+startup: time to construct Game and draw its first frame, and to reset (Escape) a canvas covered by shapes,
+         per window size.  Runs without a window unless --window is given.
+label:   importing a bitmap of random filled shapes: connected component labelling (raster.label, 4 and 8
+         connectivity, serial and in parallel stripes) and loading the groups into each engine, against a union
+         per pixel on the smaller sizes.
+templates: rasterizing shapes stamped with a few distinct box sizes, as on release, with and without the
+         ShapeTemplates cache, and the hit rate.
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+import tracemalloc
+
+import numpy as np
+import pygame
+
+import raster
+import settings
+from union_find import UnionFind, ArrayUnionFind, TiledUnionFind, Shape, ShapeTemplates, create_vertices, rasterize
+from union_find_drawing_demo import Session, Game
+
+ENGINES = {"dict": UnionFind, "array": ArrayUnionFind, "tiled": TiledUnionFind}
+TOOLS = ["line", "rectangle", "triangle1", "triangle2", "triangle3", "triangle4", "pentagon", "star"]
+
+
+def random_shapes(size, count, seed = 0):
+    """Returns a reproducible list of shapes scattered over a size x size canvas."""
+    rng = random.Random(seed)
+    shapes = []
+    for _ in range(count):
+        x0, y0 = rng.randrange(1, size - 2), rng.randrange(1, size - 2)
+        w, h = rng.randrange(2, size // 3), rng.randrange(2, size // 3)
+        x1, y1 = min(size - 2, x0 + w), min(size - 2, y0 + h)
+        shapes.append(Shape(create_vertices(x0, y0, x1, y1, name = rng.choice(TOOLS))))
+    return shapes
+
+
+def commit(uf, shape, bulk = False):
+    """
+    Adds a shape to uf like a left click release in Game.run.
+    bulk: use union_many instead of the original per node union loop
+    """
+    if bulk:
+        uf.union_many(raster.thicken(shape.coords(), 3))
+        uf.update_arr()
+        return
+    for node in shape.nodes:
+        node = (int(node[0]), int(node[1]))
+        uf.union(node, node)
+        for neighbor in Shape.get_neighbors(*node):
+            uf.union(node, neighbor)
+    uf.update_arr()
+
+
+def bench_engine(engine, size, shapes, bulk = False):
+    """Returns (seconds, unions per second, retained MB, peak MB) for committing shapes on a fresh engine."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    uf = ENGINES[engine]((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+    unions = 0
+    for shape in shapes:
+        commit(uf, shape, bulk = bulk)
+        unions += 5 * len(shape.nodes)
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, unions / seconds, current / 2**20, peak / 2**20
+
+
+def cmd_engines(args):
+    shapes = random_shapes(args.size, args.shapes, seed = args.seed)
+    print(f"{args.shapes} shapes on a {args.size}x{args.size} canvas")
+    print(f"{'engine':>8} {'commit':>8} {'seconds':>10} {'unions/s':>12} {'retained MB':>12} {'peak MB':>10}")
+    for engine in args.engine:
+        for bulk in (False, True):
+            seconds, rate, retained, peak = bench_engine(engine, args.size, shapes, bulk = bulk)
+            mode = "bulk" if bulk else "per node"
+            print(f"{engine:>8} {mode:>8} {seconds:>10.3f} {rate:>12,.0f} {retained:>12.1f} {peak:>10.1f}")
+
+
+def banded(uf, bands):
+    """Covers the whole canvas of uf with horizontal bands, each band is one group."""
+    height = max(1, uf.C // bands)
+    for y0 in range(0, uf.C, height):
+        uf.union_many(raster.Mask(np.ones((uf.R, min(height, uf.C - y0)), dtype = bool), (0, y0)))
+
+
+def repaint(uf):
+    """Forces a full repaint, the array engines would otherwise only repaint what changed."""
+    if isinstance(uf, (ArrayUnionFind, TiledUnionFind)):
+        uf.invalidate()
+    uf.update_arr()
+    if isinstance(uf, TiledUnionFind):
+        uf.render_box([0, 0, uf.R, uf.C]) # tiles are only rendered when they are shown
+
+
+def halves(uf):
+    """Covers the canvas of uf with two groups, the columns before and after the middle one, which stays empty."""
+    mid = uf.C // 2
+    uf.union_many(raster.Mask(np.ones((uf.R, mid), dtype = bool), (0, 0)))
+    uf.union_many(raster.Mask(np.ones((uf.R, uf.C - mid - 1), dtype = bool), (0, mid + 1)))
+    uf.update_arr()
+    return np.array([(0, mid - 1), (0, mid), (0, mid + 1)])
+
+
+def timed(func, repeat):
+    """Returns the best of repeat wall clock timings of func() in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return 1000 * best
+
+
+def cmd_render(args):
+    print(f"{args.bands} groups on a {args.size}x{args.size} canvas")
+    print(f"{'engine':>8} {'update_arr ms':>14} {'normalize ms':>13} {'merge ms':>9}")
+    for engine in args.engine:
+        uf = ENGINES[engine]((args.size, args.size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+        banded(uf, args.bands)
+        full = timed(lambda: repaint(uf), args.repeat)
+        normalize = timed(uf.normalize_brightness, args.repeat)
+        merge = float("inf")
+        for _ in range(args.repeat):
+            uf = ENGINES[engine]((args.size, args.size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+            seam = halves(uf)
+            start = time.perf_counter()
+            uf.update_arr(uf.union_many(seam))
+            merge = min(merge, 1000 * (time.perf_counter() - start))
+        print(f"{engine:>8} {full:>14.1f} {normalize:>13.1f} {merge:>9.2f}")
+
+
+def scribble(size, segments, seed = 0):
+    """Returns a reproducible freehand stroke as a list of short segment Shapes."""
+    rng = random.Random(seed)
+    x, y = size // 2, size // 2
+    shapes = []
+    for _ in range(segments):
+        x1 = max(1, min(size - 2, x + rng.randint(-8, 8)))
+        y1 = max(1, min(size - 2, y + rng.randint(-8, 8)))
+        shapes.append(Shape([(x, y), (x1, y1)]))
+        x, y = x1, y1
+    return shapes
+
+
+def cmd_freehand(args):
+    stroke = scribble(args.size, args.segments, seed = args.seed)
+    print(f"{args.segments} segment freehand stroke on a {args.size}x{args.size} canvas")
+    print(f"{'engine':>8} {'commit':>8} {'canvas':>8} {'ms / segment':>13} {'max ms':>8}")
+    for engine, bulk, canvas in itertools.product(args.engine, (False, True), ("empty", "banded")):
+        uf = ENGINES[engine]((args.size, args.size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+        if canvas == "banded":
+            banded(uf, args.bands)
+            uf.update_arr()
+        times = []
+        for shape in stroke:
+            start = time.perf_counter()
+            commit(uf, shape, bulk = bulk)
+            times.append(1000 * (time.perf_counter() - start))
+        mode = "bulk" if bulk else "per node"
+        print(f"{engine:>8} {mode:>8} {canvas:>8} {sum(times) / len(times):>13.2f} {max(times):>8.2f}")
+
+
+def bfs_fill_region(occupied, x, y, R, C):
+    """The original Shape.fill_region: level by level BFS over a set of tuples."""
+    q = [(x, y)]
+    visited = set(occupied) | {(x, y)}
+    while q:
+        next_level = []
+        for node in q:
+            for neighbor in Shape.get_neighbors(*node):
+                if neighbor not in visited and 0 <= neighbor[0] < C-1 and 0 <= neighbor[1] < R-1:
+                    visited.add(neighbor)
+                    next_level.append(neighbor)
+        q = next_level
+    return visited - set(occupied)
+
+
+def bfs_fill_shape(shape):
+    """The original Shape.fill_shape: BFS from the centroid bounded by the outline."""
+    X, Y = Shape.get_centroid(shape.vertices)
+    q = [(int(X), int(Y))]
+    visited = {(int(x), int(y)) for x, y in shape.edges}
+    while q:
+        next_level = []
+        for node in q:
+            for neighbor in Shape.get_neighbors(*node):
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    next_level.append(neighbor)
+        q = next_level
+    return visited
+
+
+def cmd_fill(args):
+    size = args.size
+    star = Shape(create_vertices(size // 10, size // 10, size - size // 10, size - size // 10, name = "star"))
+    cases = [("region", lambda: raster.flood_fill(np.zeros((size, size), dtype = bool), size // 2, size // 2),
+                        lambda: bfs_fill_region(set(), size // 2, size // 2, size, size)),
+             ("star", lambda: raster.polygon_mask(star.vertices, rule = "nonzero"),
+                      lambda: bfs_fill_shape(star))]
+    print(f"fills on an empty {size}x{size} canvas")
+    print(f"{'fill':>8} {'mask ms':>10} {'BFS ms':>10}")
+    for name, fill, bfs in cases:
+        print(f"{name:>8} {timed(fill, args.repeat):>10.1f} {timed(bfs, 1):>10.1f}")
+
+    print("adding the region fill to an empty engine, as a raster.Mask and as an array of (x, y) nodes")
+    print(f"{'engine':>8} {'mask ms':>10} {'array ms':>10}")
+    for engine in ("array", "tiled"):
+        def add(nodes):
+            uf = ENGINES[engine]((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+            start = time.perf_counter()
+            uf.union_many(nodes, touching = True)
+            return 1000 * (time.perf_counter() - start)
+        shape = Shape([(size // 2, size // 2)])
+        shape.fill_region(size // 2, size // 2, ENGINES[engine]((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"]))
+        mask, coords = (min(add(nodes) for _ in range(args.repeat)) for nodes in (shape.region(), shape.coords()))
+        print(f"{engine:>8} {mask:>10.1f} {coords:>10.1f}")
+
+
+def recursive_get_line(x0, y0, x1, y1):
+    """The original Shape.get_line: bisects the segment recursively."""
+    def helper(x0, y0, x1, y1):
+        nonlocal points
+        a, b, c, d = int(round(x0, 0)), int(round(y0, 0)), int(round(x1, 0)), int(round(y1, 0))
+        h = (a, b, c, d)
+        if h not in seen:
+            seen.add(h)
+            points |= {(a, b), (c, d)}
+            if a == c and b == d:
+                return None
+            xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
+            helper(x0, y0, xm, ym)
+            helper(xm, ym, x1, y1)
+    seen = set()
+    points = {(x0, y0), (x1, y1)}
+    helper(x0, y0, x1, y1)
+    return points
+
+
+def cmd_lines(args):
+    rng = random.Random(args.seed)
+    ends = [[rng.uniform(0, args.size) for _ in range(4)] for _ in range(args.segments)]
+    starts, stops = np.array(ends)[:, :2], np.array(ends)[:, 2:]
+    cases = [("recursive", lambda: [recursive_get_line(*e) for e in ends]),
+             ("dda", lambda: [raster.line(*e) for e in ends]),
+             ("dda batch", lambda: raster.segments(starts, stops)),
+             ("dda batch x3", lambda: raster.segments(starts, stops, thickness = 3))]
+    print(f"{args.segments} random segments on a {args.size}x{args.size} canvas")
+    print(f"{'rasterizer':>13} {'ms':>10} {'us / segment':>13}")
+    for name, func in cases:
+        ms = timed(func, args.repeat)
+        print(f"{name:>13} {ms:>10.1f} {1000 * ms / args.segments:>13.1f}")
+
+
+def stars_scenario(size, rng):
+    """Many small stars dropped all over the canvas."""
+    yield ("select", "star")
+    for _ in range(max(10, size // 4)):
+        x, y = rng.randrange(size - 20), rng.randrange(size - 20)
+        yield ("press", x, y)
+        yield ("drag", x + 19, y + 19)
+        yield ("release",)
+
+
+def fill_scenario(size, rng):
+    """One right click fill of the entire empty canvas."""
+    yield ("fill", size // 2, size // 2)
+
+
+def scribble_scenario(size, rng):
+    """One long and dense freehand stroke wandering around the middle of the canvas."""
+    x, y = size // 2, size // 2
+    step = max(2, size // 50)
+    yield ("select", "freehand")
+    yield ("press", x, y)
+    for _ in range(2000):
+        x = max(0, min(size - 1, x + rng.randint(-step, step)))
+        y = max(0, min(size - 1, y + rng.randint(-step, step)))
+        yield ("drag", x, y)
+    yield ("release",)
+
+
+def erase_scenario(size, rng):
+    """A grid of separate rectangles, then the eraser removes every one of them."""
+    cell = max(8, size // 20)
+    corners = [(x, y) for x in range(1, size - cell, cell) for y in range(1, size - cell, cell)]
+    yield ("select", "rectangle")
+    for x, y in corners:
+        yield ("press", x, y)
+        yield ("drag", x + cell // 2, y + cell // 2)
+        yield ("release",)
+    yield ("select", "eraser")
+    yield ("press", 0, 0)
+    for x, y in corners:
+        yield ("drag", x, y)
+    yield ("release",)
+
+
+def wipe_scenario(size, rng):
+    """The whole canvas filled as one group, then a single eraser click removes it."""
+    yield ("fill", size // 2, size // 2)
+    yield ("select", "eraser")
+    yield ("press", size // 2, size // 2)
+    yield ("release",)
+
+
+SCENARIOS = {"stars": stars_scenario, "fill": fill_scenario,
+             "scribble": scribble_scenario, "erase": erase_scenario, "wipe": wipe_scenario}
+
+
+def bench_session(engine, size, scenario, seed = 0):
+    """
+    Replays a scenario on a fresh engine and session.
+    Returns ({operation: [milliseconds, ...]}, peak MB).  Drags are keyed by tool, e.g. "drag:eraser".
+    """
+    tracemalloc.start()
+    uf = ENGINES[engine]((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+    session = Session(uf, thickness = settings.settings["THICKNESS"])
+    latencies = {}
+    for name, *args in SCENARIOS[scenario](size, random.Random(seed)):
+        op = f"{name}:{session.tool}" if name in ("press", "drag", "release") else name
+        start = time.perf_counter()
+        getattr(session, name)(*args)
+        latencies.setdefault(op, []).append(1000 * (time.perf_counter() - start))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latencies, peak / 2**20
+
+
+def cmd_sessions(args):
+    print(f"{'size':>6} {'scenario':>9} {'operation':>16} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9} {'peak MB':>9}")
+    for size, scenario in itertools.product(args.sizes, args.scenario):
+        latencies, peak = bench_session(args.engine, size, scenario, seed = args.seed)
+        for op, times in latencies.items():
+            if op == "select":
+                continue
+            p50, p90, p99 = np.percentile(times, [50, 90, 99])
+            print(f"{size:>6} {scenario:>9} {op:>16} {len(times):>6} {p50:>9.2f} {p90:>9.2f} "
+                  f"{p99:>9.2f} {max(times):>9.2f} {peak:>9.1f}")
+
+
+def cmd_startup(args):
+    if not args.window:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    print(f"{'window':>10} {'launch ms':>10} {'first frame ms':>15} {'reset ms':>9}")
+    for size in args.sizes:
+        width, height = map(int, size.split("x"))
+        launch, first, reset = [], [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            game = Game(**dict(settings.settings, WIDTH = width, HEIGHT = height, WORKERS = 0))
+            launch.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            game.draw()
+            first.append(time.perf_counter() - start)
+
+            # cover the canvas with shapes, then erase everything
+            for shape in random_shapes(min(width, height), args.shapes):
+                game.uf.union_many(shape)
+            game.uf.update_arr()
+            game.draw()
+            start = time.perf_counter()
+            game.session.reset()
+            game.draw()
+            reset.append(time.perf_counter() - start)
+            pygame.quit()
+        print(f"{size:>10} {np.median(launch) * 1e3:>10.1f} {np.median(first) * 1e3:>15.1f} {np.median(reset) * 1e3:>9.1f}")
+
+
+def shapes_mask(size, count, seed = 0):
+    """Returns a size x size bitmap of count random filled shapes, like an imported drawing."""
+    mask = np.zeros((size, size), dtype = bool)
+    for shape in random_shapes(size, count, seed = seed):
+        fill, (x0, y0) = raster.polygon_mask(shape.vertices)
+        mask[x0:x0 + fill.shape[0], y0:y0 + fill.shape[1]] |= fill[:size - x0, :size - y0]
+        x, y = shape.nodes.T
+        mask[x, y] = True
+    return mask
+
+
+def union_pixels(uf, mask):
+    """Adds mask to uf the slow way, a union of every pixel with its left and upper neighbors."""
+    for x, y in np.argwhere(mask).tolist():
+        uf.union((x, y), (x, y))
+        if x and mask[x - 1, y]:
+            uf.union((x, y), (x - 1, y))
+        if y and mask[x, y - 1]:
+            uf.union((x, y), (x, y - 1))
+    uf.update_arr()
+
+
+def cmd_label(args):
+    print(f"{'size':>6} {'step':>22} {'ms':>10} {'groups':>8}")
+    for size in args.sizes:
+        mask = shapes_mask(size, args.shapes, seed = args.seed)
+        for connectivity, workers in itertools.product((4, 8), args.workers):
+            ms = timed(lambda: raster.label(mask, connectivity, workers), args.repeat)
+            print(f"{size:>6} {f'label {connectivity} x{workers}':>22} {ms:>10.1f} {raster.label(mask, connectivity)[1]:>8}")
+        labels, count = raster.label(mask)
+        for engine in ("array", "tiled"):
+            uf = ENGINES[engine]((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+            ms = timed(lambda: uf.load_labels(labels), args.repeat)
+            print(f"{size:>6} {f'load_labels {engine}':>22} {ms:>10.1f} {len(uf.groups):>8}")
+        if size <= args.baseline:
+            uf = ArrayUnionFind((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+            ms = timed(lambda: union_pixels(uf, mask), 1)
+            print(f"{size:>6} {'union per pixel array':>22} {ms:>10.1f} {len(uf.groups):>8}")
+
+
+def cmd_templates(args):
+    print(f"{'sizes':>6} {'cache':>10} {'ms':>10} {'hit rate':>9}")
+    for sizes in args.sizes:
+        rng = random.Random(args.seed)
+        extents = [(16 + 8 * i, 8 + 4 * i) for i in range(sizes)]
+        boxes = []
+        for _ in range(args.shapes):
+            (w, h), x, y = rng.choice(extents), rng.randrange(2000), rng.randrange(2000)
+            boxes.append((rng.choice(TOOLS), x, y, x + w, y + h, rng.random() < 0.25))
+        start = time.perf_counter()
+        for name, x0, y0, x1, y1, filled in boxes:
+            rasterize(create_vertices(x0, y0, x1, y1, name = name), 3, filled)
+        print(f"{sizes:>6} {'none':>10} {(time.perf_counter() - start) * 1e3:>10.1f} {'':>9}")
+        templates = ShapeTemplates()
+        start = time.perf_counter()
+        for name, x0, y0, x1, y1, filled in boxes:
+            templates.nodes(x0, y0, x1, y1, name, 3, filled)
+        rate = templates.hits / (templates.hits + templates.misses)
+        print(f"{sizes:>6} {'templates':>10} {(time.perf_counter() - start) * 1e3:>10.1f} {rate:>9.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    p = commands.add_parser("engines", help = "compare union find engines")
+    p.add_argument("--size", type = int, default = 400, help = "canvas width and height")
+    p.add_argument("--shapes", type = int, default = 200, help = "number of shapes to commit")
+    p.add_argument("--seed", type = int, default = 0)
+    p.add_argument("--engine", nargs = "+", default = list(ENGINES), choices = list(ENGINES))
+    p.set_defaults(func = cmd_engines)
+
+    p = commands.add_parser("render", help = "time a full repaint of the canvas")
+    p.add_argument("--size", type = int, default = 800, help = "canvas width and height")
+    p.add_argument("--bands", type = int, default = 13, help = "number of groups")
+    p.add_argument("--repeat", type = int, default = 5)
+    p.add_argument("--engine", nargs = "+", default = list(ENGINES), choices = list(ENGINES))
+    p.set_defaults(func = cmd_render)
+
+    p = commands.add_parser("freehand", help = "time freehand stroke segments")
+    p.add_argument("--size", type = int, default = 800, help = "canvas width and height")
+    p.add_argument("--segments", type = int, default = 200)
+    p.add_argument("--bands", type = int, default = 13, help = "number of groups on the banded canvas")
+    p.add_argument("--seed", type = int, default = 0)
+    p.add_argument("--engine", nargs = "+", default = list(ENGINES), choices = list(ENGINES))
+    p.set_defaults(func = cmd_freehand)
+
+    p = commands.add_parser("fill", help = "time the fill engines")
+    p.add_argument("--size", type = int, default = 800, help = "canvas width and height")
+    p.add_argument("--repeat", type = int, default = 5)
+    p.set_defaults(func = cmd_fill)
+
+    p = commands.add_parser("lines", help = "time the line rasterizers")
+    p.add_argument("--size", type = int, default = 800, help = "canvas width and height")
+    p.add_argument("--segments", type = int, default = 2000)
+    p.add_argument("--seed", type = int, default = 0)
+    p.add_argument("--repeat", type = int, default = 3)
+    p.set_defaults(func = cmd_lines)
+
+    p = commands.add_parser("sessions", help = "replay headless drawing sessions")
+    p.add_argument("--sizes", type = int, nargs = "+", default = [200, 800, 2000, 4000], help = "canvas sizes")
+    p.add_argument("--scenario", nargs = "+", default = list(SCENARIOS), choices = list(SCENARIOS))
+    p.add_argument("--engine", default = "array", choices = list(ENGINES))
+    p.add_argument("--seed", type = int, default = 0)
+    p.set_defaults(func = cmd_sessions)
+
+    p = commands.add_parser("startup", help = "time launch, first frame and reset")
+    p.add_argument("--sizes", nargs = "+", default = ["800x800", "1920x1080", "3840x2160"], help = "window sizes, WIDTHxHEIGHT")
+    p.add_argument("--shapes", type = int, default = 100, help = "shapes drawn before the reset")
+    p.add_argument("--repeat", type = int, default = 5)
+    p.add_argument("--window", action = "store_true", help = "open a real window")
+    p.set_defaults(func = cmd_startup)
+
+    p = commands.add_parser("label", help = "time importing a bitmap")
+    p.add_argument("--sizes", type = int, nargs = "+", default = [1000, 4000], help = "bitmap width and height")
+    p.add_argument("--shapes", type = int, default = 300, help = "number of filled shapes in the bitmap")
+    p.add_argument("--workers", type = int, nargs = "+", default = [1, os.cpu_count() or 1], help = "labelling threads")
+    p.add_argument("--baseline", type = int, default = 1000, help = "largest size also timed with a union per pixel")
+    p.add_argument("--seed", type = int, default = 0)
+    p.add_argument("--repeat", type = int, default = 3)
+    p.set_defaults(func = cmd_label)
+
+    p = commands.add_parser("templates", help = "time the shape template cache")
+    p.add_argument("--shapes", type = int, default = 2000, help = "number of shapes to rasterize")
+    p.add_argument("--sizes", type = int, nargs = "+", default = [8, 32], help = "number of distinct box sizes")
+    p.add_argument("--seed", type = int, default = 0)
+    p.set_defaults(func = cmd_templates)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,168 @@
+"""
+Exports the drawing as it evolves as a sequence of frames at a constant frame rate, for demos and analysis.
+
+    python union_find_drawing_demo.py --export frames/      # a PNG per frame while drawing
+    python union_find_drawing_demo.py --export demo.mp4     # piped to ffmpeg, when it is installed
+    python union_find_drawing_demo.py --replay session.ufr --fast --headless --export frames/
+                                                            # a recorded session, without a window and faster than real time
+
+A directory gets numbered PNG files (frame000000.png, ...), any other path is handed to ffmpeg, which picks the
+format from the extension (.mp4, .webm, .gif, ...) and is sent raw RGB frames through a pipe.
+
+Frames are the drawing as the window shows it, without the outlines, banner and overlays.  The drawing thread only
+copies the frame's pixels, at zoom 1 of an ArrayUnionFind the 8-bit palette slots (a byte per pixel) and a reference
+to its colormap, which is replaced rather than changed, otherwise the RGB pixels of the window.  A writer thread turns
+them into PNG files (8-bit palette PNGs from slots) or RGB frames for ffmpeg.  zlib and pipe writes release the GIL,
+so the drawing thread keeps running while frames are encoded.
+The queue between them holds at most queue_size frames: drawing live, frames that do not fit are dropped (and counted)
+instead of slowing the game down, replaying a session (block = True) waits for the writer so no frame is lost.
+"""
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import zlib
+
+import numpy as np
+import pygame
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(rows, palette = None, level = 6):
+    """
+    Returns the bytes of a PNG image.
+    rows: (height, width) uint8 indices into palette ((N, 3) uint8, N <= 256), or (height, width, 3) uint8 RGB pixels
+    """
+    height, width = rows.shape[:2]
+    raw = np.empty((height, 1 + rows[0].size), dtype = np.uint8)
+    raw[:, 0] = 0 # every row starts with filter type 0 (none)
+    raw[:, 1:].reshape(rows.shape)[...] = rows
+    header = struct.pack(">IIBBBBB", width, height, 8, 2 if palette is None else 3, 0, 0, 0)
+    chunks = [png_chunk(b"IHDR", header)]
+    if palette is not None:
+        chunks.append(png_chunk(b"PLTE", np.ascontiguousarray(palette, dtype = np.uint8).tobytes()))
+    chunks += [png_chunk(b"IDAT", zlib.compress(raw.tobytes(), level)), png_chunk(b"IEND", b"")]
+    return PNG_SIGNATURE + b"".join(chunks)
+
+
+def capture(view):
+    """
+    Returns (rows, colors) of the drawing as view (a Viewport) shows it, rows of the image first: the palette slots and
+    colormap of an ArrayUnionFind at zoom 1, otherwise the RGB pixels of the window and None.
+    """
+    if view.plane is not None and view.zoom == 1:
+        return view.uf.slots.copy().T, view.uf.colormap
+    # RGBX is the fastest format to copy out of the surface, the writer skips the X
+    width, height = view.surface.get_size()
+    return np.frombuffer(pygame.image.tobytes(view.surface, "RGBX"), dtype = np.uint8).reshape(height, width, 4)[..., :3], None
+
+
+class Exporter():
+    """
+    Writes frames of a Viewport to path (a directory of PNG files or a video file made by ffmpeg), see the module docstring.
+    Call frame after every frame the game draws and close when done.
+    params:
+        path directory (created if needed, or ending in a path separator) or video file
+        size (width, height) of the frames
+        fps frames per second of the output
+        queue_size most frames waiting for the writer
+        block wait for the writer when the queue is full instead of dropping the frame
+        level zlib compression level of PNG files
+    """
+    def __init__(self, path, size, fps = 30, queue_size = 32, block = False, level = 6):
+        self.path, self.size, self.fps, self.block, self.level = path, tuple(size), fps, block, level
+        self.frames = queue.Queue(queue_size)
+        self.ticks = 0       # frames of the output given to the writer
+        self.changed = True  # the drawing changed since the last captured frame
+        self.dropped = 0     # frames dropped because the queue was full
+        self.written = 0     # frames written, repeats included
+        self.error = None    # exception that stopped the writer
+        self.encoder = None
+        if path.endswith(os.sep) or os.path.isdir(path) or not os.path.splitext(path)[1]:
+            os.makedirs(path, exist_ok = True)
+        else:
+            ffmpeg = shutil.which("ffmpeg")
+            if ffmpeg is None:
+                raise RuntimeError(f"ffmpeg is needed to write {path}, export to a directory of PNG frames instead")
+            width, height = self.size
+            self.encoder = subprocess.Popen([ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                                             "-s", f"{width}x{height}", "-r", str(fps), "-i", "-", "-pix_fmt", "yuv420p", path],
+                                            stdin = subprocess.PIPE)
+        self.writer = threading.Thread(target = self.write, name = "exporter")
+        self.writer.start()
+
+    def frame(self, t, view, changed = True, last = False):
+        """
+        Captures the drawing of view at t seconds since the start, changed is False when nothing was drawn since
+        the last call.  Frames of the output that passed since the last capture repeat the last captured frame.
+        The last frame is captured even when its frame of the output was already written, if the drawing changed,
+        and waits for the writer rather than being dropped.
+        """
+        self.changed |= changed
+        due = int(t * self.fps) + 1 - self.ticks # frames of the output up to t that are not written yet
+        if last and self.changed:
+            due = max(due, 1)
+        if due <= 0:
+            return
+        item = (due, *capture(view)) if self.changed else (due, None, None) # a repeat of the last frame
+        try:
+            self.frames.put(item, block = self.block or last)
+        except queue.Full:
+            self.dropped += 1 # the next frame covers these ticks too
+            return
+        self.ticks += due
+        self.changed = False
+
+    def write(self):
+        """Writer thread: encodes and writes queued frames until close."""
+        last = None # encoded bytes (or file name for PNG) of the last frame
+        try:
+            while (item := self.frames.get()) is not None:
+                repeat, rows, colors = item
+                if rows is not None:
+                    if self.encoder:
+                        last = np.ascontiguousarray(rows if colors is None else colors[rows]).tobytes()
+                    else:
+                        last = self.write_png(encode_png(rows, colors, self.level))
+                        repeat -= 1
+                for _ in range(repeat if last is not None else 0):
+                    if self.encoder:
+                        self.encoder.stdin.write(last)
+                    else:
+                        shutil.copyfile(last, self.frame_path(self.written))
+                    self.written += 1
+        except (OSError, ValueError) as e:
+            self.error = e
+            while self.frames.get() is not None: # let frame and close go on
+                pass
+
+    def write_png(self, data):
+        path = self.frame_path(self.written)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.written += 1
+        return path
+
+    def frame_path(self, n):
+        return os.path.join(self.path, f"frame{n:06d}.png")
+
+    def close(self, t = None, view = None):
+        """Captures a last frame at t (when given), waits for the writer to finish and returns the number of frames written."""
+        if view is not None:
+            self.frame(t, view, last = True)
+        self.frames.put(None)
+        self.writer.join()
+        if self.encoder:
+            self.encoder.stdin.close()
+            self.encoder.wait()
+        if self.error:
+            raise self.error
+        return self.written
+
@@ -0,0 +1,41 @@
+"""
+Imports bitmaps as drawings: the pixels that are on are labelled into connected groups (raster.label)
+and the groups are loaded into a union find engine in bulk (load_labels) instead of a union per pixel.
+"""
+import os
+
+import numpy as np
+import pygame
+
+import raster
+
+
+def read_mask(path):
+    """
+    Returns the pixels that are on in the bitmap at path as a boolean array indexed [x][y] like the drawing plane.
+    .npy files hold a 2D array (any nonzero value is on) or an image with color channels last, both indexed
+    [row][column] like images, other files are images pygame can read (PNG, BMP, ...) where on means not black
+    and not transparent.
+    """
+    if path.endswith(".npy"):
+        arr = np.load(path)
+        mask = arr != 0 if arr.ndim == 2 else (arr != 0).any(axis = 2)
+        return mask.T
+    image = pygame.image.load(path)
+    mask = pygame.surfarray.array3d(image).any(axis = 2)
+    if image.get_flags() & pygame.SRCALPHA:
+        mask &= pygame.surfarray.array_alpha(image) > 0
+    return mask
+
+
+def import_image(uf, path, connectivity = 4, workers = None):
+    """
+    Replaces the drawing of uf with the connected groups of the bitmap at path, cropped to the drawing plane.
+    connectivity: 4 or 8, see raster.label, the groups keep it when the eraser splits them
+    workers: threads labelling stripes of rows in parallel, one per core by default
+    Returns the number of groups.
+    """
+    mask = read_mask(path)[:uf.R, :uf.C]
+    labels, count = raster.label(mask, connectivity = connectivity, workers = workers or os.cpu_count() or 1)
+    uf.load_labels(labels, connectivity = connectivity)
+    return count
@@ -0,0 +1,135 @@
+"""
+Undo / redo history for the union find engines.
+
+An operation is the list of steps an engine recorded between begin and end, for example
+("stamp", root, runs, ...) for nodes added to a group or ("merge", obs, targ, runs, ...) for a merge.
+Nodes are stored as run length encoded sorted flat indices, see encode, so a filled region costs
+a few runs per row instead of one entry per node.  The engine replays the steps backwards to undo
+and forwards to redo.
+"""
+import collections
+
+import numpy as np
+
+
+def encode(indices):
+    """Run length encodes sorted unique ints as an (N, 2) int64 array of (start, length)."""
+    indices = np.asarray(indices, dtype = np.int64)
+    if not len(indices):
+        return np.zeros((0, 2), dtype = np.int64)
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = indices[np.concatenate(([0], breaks))]
+    stops = indices[np.concatenate((breaks - 1, [len(indices) - 1]))]
+    return np.stack([starts, stops - starts + 1], axis = 1)
+
+
+def encode_mask(mask, origin, C):
+    """
+    Run length encodes the nodes of a boolean mask whose [0, 0] is node origin (x0, y0) of a plane C nodes wide,
+    the same runs as encode of their sorted flat indices x * C + y without listing every node.
+    """
+    edges = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype = np.int8)
+    edges[:, 1:-1] = mask
+    edges = np.diff(edges, axis = 1).ravel() # 1 where a run starts, -1 after it ends, rows mask.shape[1] + 1 long
+    first = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - first
+    rows, cols = np.divmod(first, mask.shape[1] + 1)
+    starts = (rows + origin[0]) * C + cols + origin[1]
+    if len(starts) > 1: # runs that end a row and start the next are one run when the mask spans whole rows
+        head = np.concatenate(([True], starts[1:] != starts[:-1] + lengths[:-1]))
+        if not head.all():
+            lengths = np.add.reduceat(lengths, np.flatnonzero(head))
+            starts = starts[head]
+    return np.stack([starts, lengths], axis = 1).astype(np.int64)
+
+
+def decode(runs):
+    """Inverse of encode."""
+    starts, lengths = runs.T
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+
+def encode_values(values):
+    """Run length encodes an int array as an (N, 2) int64 array of (value, count)."""
+    values = np.asarray(values) # compared as they are, only the runs are widened
+    if not len(values):
+        return np.zeros((0, 2), dtype = np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return np.stack([values[starts], np.diff(np.append(starts, len(values)))], axis = 1).astype(np.int64)
+
+
+def decode_values(runs):
+    """Inverse of encode_values."""
+    return np.repeat(runs[:, 0], runs[:, 1])
+
+
+def by_root(roots):
+    """Yields (root, positions of root in roots) for every distinct root, positions in increasing order."""
+    order = np.argsort(roots, kind = "stable")
+    roots = roots[order]
+    starts = np.flatnonzero(np.concatenate(([True], roots[1:] != roots[:-1]))) if len(roots) else []
+    for start, stop in zip(starts, np.append(starts[1:], len(roots))):
+        yield int(roots[start]), order[start:stop]
+
+
+class Journal():
+    """
+    Bounded history of operations.
+    params:
+        budget bytes the recorded arrays may use, the oldest operations are evicted first, 0 disables the history
+    """
+    def __init__(self, budget):
+        self.budget = budget
+        self.done = collections.deque() # (steps, bytes) that can be undone, oldest first
+        self.undone = []                # (steps, bytes) that can be redone, most recently undone last
+        self.steps = None               # steps of the open operation
+        self.depth = 0                  # begin / end nesting, only the outermost pair makes an operation
+        self.bytes = 0
+
+    @property
+    def recording(self):
+        """True while an operation is open, engines skip the work of recording steps otherwise."""
+        return self.steps is not None
+
+    def begin(self):
+        if self.depth == 0 and self.budget:
+            self.steps = []
+        self.depth += 1
+
+    def record(self, *step):
+        if self.steps is not None:
+            self.steps.append(step)
+
+    def end(self):
+        self.depth -= 1
+        if self.depth or self.steps is None:
+            return
+        steps, self.steps = self.steps, None
+        if not steps:
+            return
+        size = sum(x.nbytes for step in steps for x in step if isinstance(x, np.ndarray)) + 64 * len(steps)
+        self.bytes -= sum(size for _, size in self.undone)
+        self.undone.clear()
+        self.done.append((steps, size))
+        self.bytes += size
+        while self.bytes > self.budget and self.done:
+            self.bytes -= self.done.popleft()[1]
+
+    def undo(self):
+        """Returns the steps of the last operation (to apply backwards) or None."""
+        if not self.done:
+            return None
+        self.undone.append(self.done.pop())
+        return self.undone[-1][0]
+
+    def redo(self):
+        """Returns the steps of the last undone operation (to apply forwards) or None."""
+        if not self.undone:
+            return None
+        self.done.append(self.undone.pop())
+        return self.done[-1][0]
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+        self.bytes = 0
@@ -0,0 +1,124 @@
+"""
+Opt-in frame profiler: per stage timers, an on-screen overlay and a CSV / JSON trace written on exit.
+Methods are only wrapped once a Profiler is created, a game without one runs the original methods untouched.
+"""
+import collections
+import csv
+import json
+import time
+
+import numpy as np
+import pygame
+
+
+class Profiler():
+    """
+    params:
+        trace path of the trace written by close(), .json for JSON and CSV otherwise, None to skip it
+        window number of recent frames the overlay percentiles are computed over
+        refresh seconds between overlay updates, rendering text every frame would skew the timings
+    """
+    def __init__(self, trace = None, window = 120, refresh = 0.5):
+        self.trace = trace
+        self.stages = {}  # stage -> seconds spent in it during the current frame
+        self.wrapped = [] # (owner, name, attribute replaced) to restore on close
+        self.rows = []    # one dict per frame: frame time, time per stage (ms) and counts
+        self.recent = collections.deque(maxlen = window)
+        self.last = time.perf_counter()
+        self.refresh = refresh
+        self.font = None
+        self.image = None
+        self.image_time = -refresh
+
+    def wrap(self, owner, name, stage = None):
+        """
+        Replaces owner.name (a method of an instance or a function of a class) with a version
+        that adds its running time to stage.  Stages are inclusive, nested calls count in both stages.
+        """
+        stage = stage or name
+        func = getattr(owner, name)
+        stages = self.stages
+        stages.setdefault(stage, 0.0)
+        perf_counter = time.perf_counter
+        def timed(*args, **kwargs):
+            t = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stages[stage] += perf_counter() - t
+        timed.__wrapped__ = func
+        self.wrapped.append((owner, name, vars(owner).get(name)))
+        setattr(owner, name, timed)
+
+    def unwrap(self):
+        """Restores every wrapped method."""
+        for owner, name, original in reversed(self.wrapped):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.wrapped = []
+
+    def frame(self, **counts):
+        """Ends the current frame, counts (e.g. nodes = ..., groups = ...) are stored with its timings."""
+        now = time.perf_counter()
+        row = {"frame": len(self.rows), "ms": (now - self.last) * 1e3}
+        for stage, seconds in self.stages.items():
+            row[stage] = seconds * 1e3
+            self.stages[stage] = 0.0
+        row.update(counts)
+        self.rows.append(row)
+        self.recent.append(row)
+        self.last = now
+
+    def summary(self):
+        """Returns {stage: (p50, p99)} in ms over the recent frames, "ms" is the whole frame."""
+        if not self.recent:
+            return {}
+        return {stage: tuple(float(p) for p in np.percentile([row[stage] for row in self.recent], [50, 99]))
+                for stage in ["ms", *self.stages]}
+
+    def overlay(self):
+        """Returns a translucent surface listing FPS, p50 / p99 per stage and the latest counts."""
+        if self.image is not None and time.perf_counter() - self.image_time < self.refresh:
+            return self.image
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, 20)
+
+        summary = self.summary()
+        frame_p50 = summary.get("ms", (0, 0))[0]
+        lines = [f"FPS {1e3 / frame_p50:.0f}" if frame_p50 else "FPS -",
+                 f"{'stage':<14}{'p50':>8}{'p99':>8}"]
+        lines += [f"{'frame' if stage == 'ms' else stage:<14}{p50:>8.2f}{p99:>8.2f}" for stage, (p50, p99) in summary.items()]
+        if self.recent:
+            counts = {key: value for key, value in self.recent[-1].items() if key not in ("frame", "ms", *self.stages)}
+            lines.append("  ".join(f"{key} {value}" for key, value in counts.items()))
+
+        text = [self.font.render(line, True, (230, 230, 230)) for line in lines]
+        width = max(t.get_width() for t in text) + 10
+        height = sum(t.get_height() for t in text) + 10
+        self.image = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.image.fill((0, 0, 0, 170))
+        y = 5
+        for t in text:
+            self.image.blit(t, (5, y))
+            y += t.get_height()
+        self.image_time = time.perf_counter()
+        return self.image
+
+    def close(self):
+        """Restores the wrapped methods and writes the trace."""
+        self.unwrap()
+        if not self.trace:
+            return
+        if self.trace.endswith(".json"):
+            with open(self.trace, "w") as f:
+                json.dump({"summary": self.summary(), "frames": self.rows}, f)
+        else:
+            fields = list(dict.fromkeys(key for row in self.rows for key in row))
+            with open(self.trace, "w", newline = "") as f:
+                writer = csv.DictWriter(f, fields)
+                writer.writeheader()
+                writer.writerows(self.rows)
+        print(f"profile trace written to {self.trace}")
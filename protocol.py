@@ -0,0 +1,144 @@
+"""
+Binary protocol between a shared canvas server (see server.py) and its clients, over TCP or Unix sockets.
+
+Every message is a frame: its length (uint32) followed by the body, all little endian.
+
+Client to server, bodies start with kind (uint8) and the client's sequence number of the operation (uint32):
+    SHAPE   tool (uint8 index into TOOLS), flags (uint8, FILLED), thickness (uint8), x0, y0, x1, y1 (uint16)
+    STROKE  flags (uint8, ERASING), thickness (uint8), count (uint16) and count vertices x, y (uint16)
+            a freehand stroke through the vertices, or with ERASING an eraser brush dragged along them
+    FILL    x, y (uint16) paint fill of the empty region around the point
+    ERASE   x, y (uint16) erase the group under the point
+
+Server to client:
+    HELLO   client id (uint16), plane width, height (uint16), count (uint8) and count colors R, G, B (uint8)
+    DELTA   tick (uint32), count (uint32) and count operations applied this tick as client id (uint16), sequence
+            number (uint32), then count (uint16) patches, each a box x0, y0, x1, y1 (uint16), the byte length (uint32)
+            and the zlib compressed int32 group ids of the box in row major order (-1 for empty nodes).
+            Color of a group id is colors[id % len(colors)].  The first DELTA a client receives covers the whole drawing.
+"""
+import asyncio
+import collections
+import struct
+import zlib
+
+import numpy as np
+
+LENGTH = struct.Struct("<I")
+
+# message kinds
+SHAPE, STROKE, FILL, ERASE = range(1, 5) # client to server
+HELLO, DELTA = 16, 17                    # server to client
+FILLED = ERASING = 1                     # flags
+
+TOOLS = ["line", "rectangle", "triangle1", "triangle2", "triangle3", "triangle4", "pentagon", "star"]
+
+OP = struct.Struct("<BI")
+SHAPE_ARGS = struct.Struct("<BBBHHHH")
+STROKE_ARGS = struct.Struct("<BBH")
+POINT = struct.Struct("<HH")
+HELLO_ARGS = struct.Struct("<BHHHB")
+DELTA_ARGS = struct.Struct("<BII")
+APPLIED = struct.Struct("<HI")
+PATCH = struct.Struct("<HHHHI")
+
+Op = collections.namedtuple("Op", ["kind", "seq", "args"])             # args depend on kind, see unpack_op
+Delta = collections.namedtuple("Delta", ["tick", "applied", "patches"]) # applied [(client, seq)], patches [(box, labels)]
+
+
+def frame(body):
+    return LENGTH.pack(len(body)) + body
+
+
+async def read_frame(reader):
+    """Returns the body of the next frame from an asyncio StreamReader, or None when the connection closed."""
+    try:
+        n, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+        return await reader.readexactly(n)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+def pack_shape(seq, tool, x0, y0, x1, y1, thickness = 3, filled = False):
+    return frame(OP.pack(SHAPE, seq) + SHAPE_ARGS.pack(TOOLS.index(tool), FILLED if filled else 0, thickness, x0, y0, x1, y1))
+
+
+def pack_stroke(seq, vertices, thickness = 3, erasing = False):
+    vertices = np.asarray(vertices, dtype = "<u2").reshape(-1, 2)
+    return frame(OP.pack(STROKE, seq) + STROKE_ARGS.pack(ERASING if erasing else 0, thickness, len(vertices)) + vertices.tobytes())
+
+
+def pack_fill(seq, x, y):
+    return frame(OP.pack(FILL, seq) + POINT.pack(x, y))
+
+
+def pack_erase(seq, x, y):
+    return frame(OP.pack(ERASE, seq) + POINT.pack(x, y))
+
+
+def unpack_op(body):
+    """
+    Returns the Op of a client frame body, its args are
+        SHAPE   (tool name, (x0, y0, x1, y1), thickness, filled)
+        STROKE  (N x 2 int array of vertices, thickness, erasing)
+        FILL, ERASE  (x, y)
+    Raises ValueError for a malformed body.
+    """
+    try:
+        kind, seq = OP.unpack_from(body)
+        if kind == SHAPE:
+            tool, flags, thickness, *box = SHAPE_ARGS.unpack_from(body, OP.size)
+            return Op(kind, seq, (TOOLS[tool], tuple(box), thickness, bool(flags & FILLED)))
+        if kind == STROKE:
+            flags, thickness, count = STROKE_ARGS.unpack_from(body, OP.size)
+            vertices = np.frombuffer(body, dtype = "<u2", count = 2 * count, offset = OP.size + STROKE_ARGS.size)
+            return Op(kind, seq, (vertices.reshape(-1, 2).astype(np.intp), thickness, bool(flags & ERASING)))
+        if kind in (FILL, ERASE):
+            return Op(kind, seq, POINT.unpack_from(body, OP.size))
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"malformed operation: {e}")
+    raise ValueError(f"unknown operation kind {kind}")
+
+
+def pack_hello(client, size, colors):
+    colors = np.asarray(colors, dtype = np.uint8).reshape(-1, 3)
+    return frame(HELLO_ARGS.pack(HELLO, client, *size, len(colors)) + colors.tobytes())
+
+
+def unpack_hello(body):
+    """Returns (client id, (width, height) of the plane, (N, 3) uint8 colors)."""
+    kind, client, width, height, count = HELLO_ARGS.unpack_from(body)
+    if kind != HELLO:
+        raise ValueError(f"expected HELLO, got message kind {kind}")
+    colors = np.frombuffer(body, dtype = np.uint8, count = 3 * count, offset = HELLO_ARGS.size).reshape(-1, 3)
+    return client, (width, height), colors
+
+
+def pack_delta(tick, applied, patches):
+    """applied: [(client, seq)] of the operations in this tick, patches: [(box, int32 labels of the box)]."""
+    out = [DELTA_ARGS.pack(DELTA, tick, len(applied))]
+    out += [APPLIED.pack(client, seq) for client, seq in applied]
+    out.append(struct.pack("<H", len(patches)))
+    for box, labels in patches:
+        data = zlib.compress(np.ascontiguousarray(labels, dtype = "<i4").tobytes(), 1)
+        out += [PATCH.pack(*box, len(data)), data]
+    return frame(b"".join(out))
+
+
+def unpack_delta(body):
+    kind, tick, count = DELTA_ARGS.unpack_from(body)
+    if kind != DELTA:
+        raise ValueError(f"expected DELTA, got message kind {kind}")
+    i = DELTA_ARGS.size
+    applied = [APPLIED.unpack_from(body, i + k * APPLIED.size) for k in range(count)]
+    i += count * APPLIED.size
+    count, = struct.unpack_from("<H", body, i)
+    i += 2
+    patches = []
+    for _ in range(count):
+        x0, y0, x1, y1, n = PATCH.unpack_from(body, i)
+        i += PATCH.size
+        labels = np.frombuffer(zlib.decompress(body[i:i + n]), dtype = "<i4").reshape(x1 - x0, y1 - y0)
+        patches.append(([x0, y0, x1, y1], labels))
+        i += n
+    return Delta(tick, applied, patches)
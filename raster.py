@@ -0,0 +1,317 @@
+"""
+NumPy rasterization helpers that work on boolean bitmaps indexed [x][y] like UnionFind.arr.
+"""
+import concurrent.futures
+
+import numpy as np
+
+
+def runs(row):
+    """Returns (starts, stops) of the runs of True in a 1D boolean array."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], row, [False])).astype(np.int8)))
+    return edges[::2], edges[1::2]
+
+
+def flood_fill(blocked, x, y):
+    """
+    Span based scanline flood fill.
+    Returns a boolean mask (same shape as blocked) of the open pixels 4-directionally connected to (x, y).
+    blocked: 2D boolean array, True where the fill can not go
+    """
+    R, C = blocked.shape
+    filled = np.zeros((R, C), dtype = bool)
+    if not (0 <= x < R and 0 <= y < C) or blocked[x, y]:
+        return filled
+    seeds = [(x, y)]
+    while seeds:
+        x, y = seeds.pop()
+        if filled[x, y]:
+            continue
+        # widen the seed into the longest open span of row x
+        row = blocked[x]
+        left = np.flatnonzero(row[:y][::-1])
+        right = np.flatnonzero(row[y:])
+        y0 = y - left[0] if len(left) else 0
+        y1 = y + right[0] if len(right) else C
+        filled[x, y0:y1] = True
+        # every open run of the rows above and below that touches the span seeds a new span
+        for nx in (x - 1, x + 1):
+            if 0 <= nx < R:
+                starts, _ = runs(~(blocked[nx, y0:y1] | filled[nx, y0:y1]))
+                seeds.extend((nx, y0 + int(start)) for start in starts)
+    return filled
+
+
+def components(n, a, b):
+    """
+    Connected components of a graph of n items given as pairs of item arrays a and b.
+    Returns (component of every item numbered 0 .. count - 1 in the order of their smallest item, count).
+    Every pair hooks the larger root under the smaller one and pointers jump until all pairs agree.
+    """
+    parent = np.arange(n)
+    while True:
+        pa, pb = parent[a], parent[b]
+        differ = pa != pb
+        if not differ.any():
+            break
+        np.minimum.at(parent, np.maximum(pa, pb)[differ], np.minimum(pa, pb)[differ])
+        while True:
+            grand_parents = parent[parent]
+            if np.array_equal(grand_parents, parent):
+                break
+            parent = grand_parents
+    roots = parent == np.arange(n)
+    return (np.cumsum(roots) - 1)[parent], int(roots.sum())
+
+
+def label(mask, connectivity = 4, workers = 0):
+    """
+    Run based connected component labelling.
+    Returns (labels, count): an int32 array shaped like mask, 0 where mask is False and 1 .. count
+    for the components, numbered in the order their first pixel appears in row major order.
+    Every row is split into runs and runs of neighboring rows that touch are joined by a vectorized
+    union find over the runs, so the work scales with the number of runs rather than with the pixels.
+    connectivity: 4 (pixels touch along an edge, like Shape.get_neighbors) or 8 (edges and corners)
+    workers: label that many stripes of rows in parallel threads and join their labels along the stripe borders
+    """
+    R, C = mask.shape
+    if workers > 1 and R >= 2 * workers:
+        return label_stripes(mask, connectivity, workers)
+    labels = np.zeros((R, C), dtype = np.int32)
+    edges = np.diff(np.pad(mask, ((0, 0), (1, 1))).astype(np.int8), axis = 1)
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    if not len(starts):
+        return labels, 0
+
+    # run b of row r + 1 touches run a of row r when start_b < stop_a + d and start_a < stop_b + d (d = 1 counts corners),
+    # with keys row * (C + 1) + column both conditions are a binary search over all runs
+    key, d = C + 1, 1 if connectivity == 8 else 0
+    lo = np.searchsorted(rows * key + stops, (rows + 1) * key + starts - d, side = "right")
+    hi = np.searchsorted(rows * key + starts, (rows + 1) * key + stops + d, side = "left")
+    count = np.maximum(hi - lo, 0)
+    a = np.repeat(np.arange(len(starts)), count)
+    b = np.repeat(lo - (np.cumsum(count) - count), count) + np.arange(count.sum())
+    ids, n = components(len(starts), a, b)
+
+    lengths = stops - starts
+    flat = np.repeat(rows * C + starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    labels.ravel()[flat] = np.repeat(ids.astype(np.int32) + 1, lengths)
+    return labels, n
+
+
+def label_stripes(mask, connectivity, workers):
+    """label for workers stripes of rows at once, NumPy releases the GIL so the stripes run on separate cores."""
+    R, C = mask.shape
+    bounds = np.linspace(0, R, workers + 1).astype(int)
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        stripes = list(pool.map(lambda i: label(mask[bounds[i]:bounds[i + 1]], connectivity), range(workers)))
+    offsets = np.cumsum([0] + [count for _, count in stripes])
+    labels = np.concatenate([np.where(stripe > 0, stripe + offset, 0) for (stripe, _), offset in zip(stripes, offsets)])
+
+    # labels that touch across a stripe border are the same component
+    pairs = []
+    for x in bounds[1:-1]:
+        above, below = labels[x - 1], labels[x]
+        for dy in ((-1, 0, 1) if connectivity == 8 else (0,)):
+            a, b = above[max(0, -dy):C - max(0, dy)], below[max(0, dy):C - max(0, -dy)]
+            on = (a > 0) & (b > 0)
+            pairs.append((a[on], b[on]))
+    a, b = (np.concatenate(side) for side in zip(*pairs)) if pairs else (np.zeros(0, int), np.zeros(0, int))
+    ids, count = components(offsets[-1] + 1, a, b) # item 0 is the background, it stays alone and first
+    return ids.astype(np.int32)[labels], count - 1
+
+
+class Mask():
+    """
+    Set of nodes stored as a boolean bitmap and the position (x0, y0) of bitmap[0][0] on the drawing plane.
+    A byte per node of its box instead of the 16 of an N x 2 array of (x, y), and union, intersection,
+    difference and dilation are bitmap operations, so large filled areas never turn into arrays of pairs.
+    Iterating yields the (x, y0, y1) spans of the nodes row by row, y1 exclusive.
+    """
+    def __init__(self, bitmap, origin = (0, 0)):
+        self.bitmap = bitmap
+        self.origin = (int(origin[0]), int(origin[1]))
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        """Mask of an N x 2 array of (x, y) nodes, its box is the bounding box of the nodes."""
+        nodes = np.asarray(nodes, dtype = np.intp).reshape(-1, 2)
+        if not len(nodes):
+            return cls(np.zeros((0, 0), dtype = bool))
+        low = nodes.min(axis = 0)
+        bitmap = np.zeros(nodes.max(axis = 0) - low + 1, dtype = bool)
+        bitmap[tuple((nodes - low).T)] = True
+        return cls(bitmap, low)
+
+    @property
+    def box(self):
+        """[x0, y0, x1, y1] covered by the bitmap, x1 and y1 exclusive."""
+        x0, y0 = self.origin
+        return [x0, y0, x0 + self.bitmap.shape[0], y0 + self.bitmap.shape[1]]
+
+    def __len__(self):
+        return int(np.count_nonzero(self.bitmap))
+
+    def __iter__(self):
+        for x, y0, y1 in zip(*(a.tolist() for a in self.spans())):
+            yield x, y0, y1
+
+    def spans(self):
+        """Returns (x, y0, y1) arrays of the runs of nodes in every row, in row major order."""
+        edges = np.diff(np.pad(self.bitmap, ((0, 0), (1, 1))).astype(np.int8), axis = 1)
+        rows, starts = np.nonzero(edges == 1)
+        _, stops = np.nonzero(edges == -1)
+        return rows + self.origin[0], starts + self.origin[1], stops + self.origin[1]
+
+    def coords(self):
+        """Returns the nodes as an N x 2 int array of (x, y), sorted row by row."""
+        return np.argwhere(self.bitmap) + self.origin
+
+    def indices(self, C):
+        """Returns the sorted flat indices x * C + y of the nodes, which must lie on a plane C nodes wide (see crop)."""
+        xs, ys = np.nonzero(self.bitmap)
+        return (xs + self.origin[0]) * C + ys + self.origin[1]
+
+    def within(self, box):
+        """Returns the bitmap of box [x0, y0, x1, y1] with the nodes of the mask that lie inside it."""
+        x0, y0, x1, y1 = box
+        out = np.zeros((max(0, x1 - x0), max(0, y1 - y0)), dtype = bool)
+        (ox, oy), (mx0, my0, mx1, my1) = self.origin, self.box
+        ix0, iy0, ix1, iy1 = max(x0, mx0), max(y0, my0), min(x1, mx1), min(y1, my1)
+        if ix0 < ix1 and iy0 < iy1:
+            out[ix0 - x0:ix1 - x0, iy0 - y0:iy1 - y0] = self.bitmap[ix0 - ox:ix1 - ox, iy0 - oy:iy1 - oy]
+        return out
+
+    def crop(self, box):
+        """Returns the nodes inside box [x0, y0, x1, y1], a view that shares the bitmap."""
+        (ox, oy), (mx0, my0, mx1, my1) = self.origin, self.box
+        x0, y0 = min(max(box[0], mx0), mx1), min(max(box[1], my0), my1)
+        x1, y1 = max(min(box[2], mx1), x0), max(min(box[3], my1), y0)
+        return Mask(self.bitmap[x0 - ox:x1 - ox, y0 - oy:y1 - oy], (x0, y0))
+
+    def __or__(self, other):
+        (ax0, ay0, ax1, ay1), (bx0, by0, bx1, by1) = self.box, other.box
+        box = [min(ax0, bx0), min(ay0, by0), max(ax1, bx1), max(ay1, by1)]
+        return Mask(self.within(box) | other.within(box), box[:2])
+
+    def __and__(self, other):
+        return Mask(self.bitmap & other.within(self.box), self.origin)
+
+    def __sub__(self, other):
+        return Mask(self.bitmap & ~other.within(self.box), self.origin)
+
+    def dilate(self, connectivity = 4):
+        """Returns the nodes and their 4-directional (or 8 with corners) neighbors, the box grows by one on every side."""
+        R, C = self.bitmap.shape
+        out = np.zeros((R + 2, C + 2), dtype = bool)
+        for dx, dy in ((1, 1), (0, 1), (2, 1), (1, 0), (1, 2)) + (((0, 0), (0, 2), (2, 0), (2, 2)) if connectivity == 8 else ()):
+            out[dx:dx + R, dy:dy + C] |= self.bitmap
+        return Mask(out, (self.origin[0] - 1, self.origin[1] - 1))
+
+
+def polygon_mask(vertices, rule = "evenodd"):
+    """
+    Scanline polygon rasterizer.
+    Returns (mask, (x0, y0)) where mask is a boolean array of the pixels whose integer (x, y) lies inside
+    the polygon and (x0, y0) is the position of mask[0][0] on the drawing plane.
+    rule: "evenodd" or "nonzero" winding, they only differ for self intersecting polygons such as the star
+    """
+    v = np.asarray(vertices, dtype = float).reshape(-1, 2)
+    x0, y0 = np.floor(v.min(axis = 0)).astype(int)
+    x1, y1 = np.ceil(v.max(axis = 0)).astype(int) + 1
+    (xa, ya), (xb, yb) = v.T, np.roll(v, -1, axis = 0).T
+
+    # crossings of every scanline x with every edge, each edge covers xa <= x < xb (or xb <= x < xa)
+    xs = np.arange(x0, x1, dtype = float)[:, None]
+    lo, hi = np.minimum(xa, xb), np.maximum(xa, xb)
+    crosses = (lo <= xs) & (xs < hi)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        yc = ya + (xs - xa) * (yb - ya) / (xb - xa)
+    rows, edges = np.nonzero(crosses)
+    cols = np.clip(np.ceil(yc[rows, edges]).astype(int) - y0, 0, y1 - y0)
+
+    # walking along the scanline every crossing toggles (evenodd) or winds (nonzero) the inside state
+    winding = np.zeros((x1 - x0, y1 - y0 + 1), dtype = np.int32)
+    step = 1 if rule == "evenodd" else np.where(xb > xa, 1, -1)[edges]
+    np.add.at(winding, (rows, cols), step)
+    inside = np.cumsum(winding, axis = 1)[:, :-1]
+    mask = inside % 2 == 1 if rule == "evenodd" else inside != 0
+    return mask, (int(x0), int(y0))
+
+
+def brush(thickness):
+    """Returns the (dx, dy) offsets of a diamond brush, thickness 3 is a node and its 4 neighbors."""
+    r = max(0, (thickness - 1) // 2)
+    dx, dy = np.mgrid[-r:r + 1, -r:r + 1]
+    keep = np.abs(dx) + np.abs(dy) <= r
+    return np.stack([dx[keep], dy[keep]], axis = 1)
+
+
+def thicken(nodes, thickness):
+    """Returns the unique nodes covered by stamping a brush of the given thickness on every node."""
+    nodes = np.asarray(nodes, dtype = np.intp).reshape(-1, 2)
+    if thickness > 1:
+        nodes = (nodes[:, None, :] + brush(thickness)).reshape(-1, 2)
+    return unique(nodes)
+
+
+def unique(nodes):
+    """
+    np.unique(nodes, axis = 0) for (N, 2) int arrays.
+    Dense node sets are deduplicated by stamping a bitmap of their bounding box, sparse ones by sorting one key per node.
+    """
+    if not len(nodes):
+        return nodes
+    low = nodes.min(axis = 0)
+    height, width = nodes.max(axis = 0) - low + 1
+    x, y = (nodes - low).T
+    if height * width <= 16 * len(nodes):
+        bitmap = np.zeros((height, width), dtype = bool)
+        bitmap[x, y] = True
+        return np.argwhere(bitmap) + low
+    keys = unique_ints(x * width + y)
+    return np.stack(np.divmod(keys, width), axis = 1) + low
+
+
+def unique_ints(values, bound = None):
+    """
+    Sorted unique values of a 1D int array, a much faster np.unique for large arrays.
+    bound: all values lie in [0, bound), dense arrays are then deduplicated with a bitmap instead of a sort
+    """
+    if bound is not None and bound <= 16 * len(values):
+        seen = np.zeros(bound, dtype = bool)
+        seen[values] = True
+        return np.flatnonzero(seen)
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+
+def segments(starts, ends, thickness = 1):
+    """
+    Integer DDA rasterizer for many line segments at once.
+    starts, ends: (N, 2) arrays of (x, y) end points, rounded to the nearest node
+    Returns the unique (x, y) nodes of every segment as an (M, 2) int array.
+    """
+    starts = np.rint(np.asarray(starts, dtype = float).reshape(-1, 2)).astype(np.intp)
+    ends = np.rint(np.asarray(ends, dtype = float).reshape(-1, 2)).astype(np.intp)
+    delta = ends - starts
+    steps = np.abs(delta).max(axis = 1)            # number of steps along the major axis
+    segment = np.repeat(np.arange(len(steps)), steps + 1)
+    t = np.arange(len(segment)) - np.repeat(np.cumsum(steps + 1) - (steps + 1), steps + 1)
+    n = np.maximum(steps, 1)[segment, None]
+    # start + round(t * delta / n) in integer arithmetic
+    nodes = starts[segment] + (2 * t[:, None] * delta[segment] + n) // (2 * n)
+    return thicken(nodes, thickness)
+
+
+def line(x0, y0, x1, y1, thickness = 1):
+    """Returns all integer nodes that connect (x0, y0) to (x1, y1) as an (M, 2) int array."""
+    return segments([(x0, y0)], [(x1, y1)], thickness = thickness)
+
+
+def polyline(vertices, closed = False, thickness = 1):
+    """Rasterizes the segments joining consecutive vertices (and the last to the first when closed)."""
+    v = np.asarray(vertices, dtype = float).reshape(-1, 2)
+    ends = np.roll(v, -1, axis = 0) if closed else v[1:]
+    return segments(v[:len(ends)], ends, thickness = thickness)
@@ -0,0 +1,131 @@
+"""
+Compact binary log of the input events Game handles, used to record sessions and replay them.
+
+File layout (little endian):
+    header   b"UFRP", version (uint8), window width, height, drawing plane width, height (uint16)
+    events   varint microseconds since the previous event, kind | code << 3 | MOVED (uint8),
+             and when MOVED is set the zigzag varint dx, dy of the mouse since the previous event
+    trailer  optional sha1 (20 bytes) of the drawing when the recording ended, followed by b"UFEN"
+"""
+import collections
+import hashlib
+import struct
+
+MAGIC, END, VERSION = b"UFRP", b"UFEN", 4
+HEADER = struct.Struct("<4sBHHHH")
+
+# event kinds
+MOTION, PRESS, RELEASE, KEY, QUIT = range(5) # code is the mouse button for PRESS / RELEASE and one of the keys for KEY
+LEFT, MIDDLE, RIGHT = 1, 2, 3                # mouse buttons
+WHEEL_UP, WHEEL_DOWN = 4, 5
+UP, DOWN, ESCAPE, SAVE, LOAD, UNDO, REDO, STATS, ERASER = range(9) # keys
+MOVED = 128                                  # the mouse moved, dx and dy follow
+
+Event = collections.namedtuple("Event", ["t", "kind", "code", "pos"]) # microseconds since the start, kind, code, (x, y)
+
+
+def digest(arrays):
+    """Fingerprint of the arrays that make up a drawing (see snapshot), replays must reproduce it exactly."""
+    sha1 = hashlib.sha1()
+    for arr in arrays:
+        sha1.update(arr.tobytes())
+    return sha1.digest()
+
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, i):
+    """Returns (value, index after the value)."""
+    n = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return n, i
+
+
+def zigzag(n):
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def unzigzag(n):
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+class Recorder():
+    """
+    Appends events to a recording file.
+    params:
+        path of the file to create
+        size (width, height) of the window
+        canvas (width, height) of the drawing plane
+    """
+    def __init__(self, path, size, canvas):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, *size, *canvas))
+        self.t = 0
+        self.pos = (0, 0)
+        self.buffer = bytearray()
+
+    def write(self, event):
+        out = self.buffer
+        write_varint(out, event.t - self.t)
+        moved = event.pos != self.pos
+        out.append(event.kind | event.code << 3 | (MOVED if moved else 0))
+        if moved:
+            write_varint(out, zigzag(event.pos[0] - self.pos[0]))
+            write_varint(out, zigzag(event.pos[1] - self.pos[1]))
+        self.t, self.pos = event.t, event.pos
+        if len(out) > 1 << 16:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self, arr_digest = None):
+        """Finishes the file, arr_digest (see digest) lets a replay verify that it reproduced the canvas."""
+        self.flush()
+        if arr_digest is not None:
+            self.file.write(arr_digest + END)
+        self.file.close()
+
+
+class Replay():
+    """
+    Reads a recording file, iterate over it for its events.
+    Attributes: size (width, height) of the recorded window and canvas of its drawing plane, digest of the final drawing or None.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, width, height, canvas_width, canvas_height = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} recording")
+        self.size = (width, height)
+        self.canvas = (canvas_width, canvas_height)
+        self.digest = None
+        if data.endswith(END):
+            self.digest, data = data[-24:-4], data[:-24]
+        self.data = data
+
+    def __iter__(self):
+        data, i = self.data, HEADER.size
+        t, x, y = 0, 0, 0
+        while i < len(data):
+            dt, i = read_varint(data, i)
+            byte = data[i]
+            i += 1
+            if byte & MOVED:
+                dx, i = read_varint(data, i)
+                dy, i = read_varint(data, i)
+                x, y = x + unzigzag(dx), y + unzigzag(dy)
+            t += dt
+            yield Event(t, byte & 7, byte >> 3 & 15, (x, y))
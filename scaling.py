@@ -0,0 +1,237 @@
+"""
+Scaling benchmark of the union find engines under synthetic workloads, without pygame or a window.
+
+    python scaling.py --sizes 64 128 256 --jobs 4
+    python scaling.py --save baseline.json
+    python scaling.py --baseline baseline.json --threshold 0.25
+
+Every workload is a stream of unions of (x, y) node pairs on a size x size plane, fed to uf.union one
+pair at a time and painted once with update_arr:
+percolation: random sites open with probability 0.6 (just above the site percolation threshold), every pair
+             of open neighbors in random order, so groups of every size keep meeting.
+snake:       one path through every node, its links added pairs first, then the links joining pairs, and so on,
+             so every merge joins two groups of equal size (the worst case for relabelling the smaller group).
+islands:     4x4 islands built first, then bridged in random order until they are a single group.
+
+Every (workload, engine, size) runs in its own process of a pool of --jobs workers and reports union ops/sec,
+merges and the nodes a relabel-the-smaller-group merge moves (the cost of the dict UnionFind, counted by an
+independent union find), peak RSS of the process, and the engine's group count.  The groups the engine ends up
+with are checked node by node against the independent union find.  Every run of the engine is followed by a run
+of the independent union find on the same pairs, in the same process, and a job runs at least --repeat times
+and at least --min-time seconds.  Times are the medians of the runs, and "vs ref" is the engine's speed relative
+to the independent union find (the median of its time over the engine's, run by run), which a busy machine or
+a slower clock change alike.
+Python 3.11 or later starts a fresh process per job, older versions reuse the workers, so peak RSS is then
+the largest of the jobs a worker ran.
+Each curve ends with the exponent k of time ~ nodes^k between the smallest and largest size (1 is linear).
+--save writes the results as JSON, --baseline compares the speed relative to the independent union find against
+saved results and exits with status 1 when any of them dropped by more than --threshold, or when an engine ended
+up with the wrong groups.
+"""
+import argparse
+import concurrent.futures
+import gc
+import json
+import math
+import resource
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from union_find import UnionFind, ArrayUnionFind, TiledUnionFind
+
+ENGINES = {"dict": UnionFind, "array": ArrayUnionFind, "tiled": TiledUnionFind}
+COLOR_WHEEL = ((255, 51, 51), (51, 255, 51), (51, 51, 255))
+
+
+def neighbors(size):
+    """Returns (a, b) flat indices x * size + y of every pair of 4-directionally adjacent nodes."""
+    index = np.arange(size * size).reshape(size, size)
+    a = np.concatenate((index[:-1].ravel(), index[:, :-1].ravel()))
+    b = np.concatenate((index[1:].ravel(), index[:, 1:].ravel()))
+    return a, b
+
+
+def percolation(size, rng, p = 0.6):
+    is_open = rng.random(size * size) < p
+    a, b = neighbors(size)
+    both = is_open[a] & is_open[b]
+    a, b = a[both], b[both]
+    order = rng.permutation(len(a))
+    # open sites without an open neighbor are added as groups of one node
+    alone = np.flatnonzero(is_open & ~np.isin(np.arange(size * size), np.concatenate((a, b))))
+    return np.concatenate((alone, a[order])), np.concatenate((alone, b[order]))
+
+
+def snake(size, rng):
+    x, y = np.divmod(np.arange(size * size), size)
+    path = x * size + np.where(x % 2, size - 1 - y, y) # row by row, every other row backwards
+    links = np.arange(len(path) - 1)
+    level = np.log2((links + 1) & -(links + 1)).astype(int) # trailing zeros of the link number
+    order = np.lexsort((rng.random(len(links)), level))
+    return path[links[order]], path[links[order] + 1]
+
+
+def islands(size, rng, side = 4):
+    a, b = neighbors(size)
+    (ax, ay), (bx, by) = np.divmod(a, size), np.divmod(b, size)
+    inside = (ax // side == bx // side) & (ay // side == by // side)
+    # bridges join every island to the next one in its row and the first islands of the rows to each other
+    bridges = ~inside & np.where(ax == bx, ax % side == 0, ay == 0)
+    first, then = np.flatnonzero(inside), np.flatnonzero(bridges)
+    order = np.concatenate((rng.permutation(first), rng.permutation(then)))
+    return a[order], b[order]
+
+
+WORKLOADS = {"percolation": percolation, "snake": snake, "islands": islands}
+
+
+def reference(n, a, b):
+    """
+    Returns (roots, merges, relabelled nodes) of unioning the pairs in order with union by size,
+    roots holds the root of every node and -1 for nodes no pair mentions.
+    """
+    parent, size = list(range(n)), [1] * n
+    seen = np.zeros(n, dtype = bool)
+    seen[a] = seen[b] = True
+    merges = relabelled = 0
+    for i, j in zip(a.tolist(), b.tolist()):
+        while parent[i] != i:
+            parent[i] = i = parent[parent[i]]
+        while parent[j] != j:
+            parent[j] = j = parent[parent[j]]
+        if i != j:
+            if size[i] < size[j]:
+                i, j = j, i
+            parent[j] = i
+            size[i] += size[j]
+            merges += 1
+            relabelled += size[j]
+    roots = np.full(n, -1)
+    for i in np.flatnonzero(seen).tolist():
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        roots[i] = root
+    return roots, merges, relabelled
+
+
+def same_groups(a, b):
+    """Whether two arrays of per node roots (-1 for empty nodes) describe the same groups, whatever the roots are."""
+    if not np.array_equal(a < 0, b < 0):
+        return False
+    a, b = a[a >= 0], b[b >= 0]
+    pairs = len(np.unique(np.stack([a, b], axis = 1), axis = 0))
+    return pairs == len(np.unique(a)) == len(np.unique(b))
+
+
+def run(job):
+    """
+    Runs one (workload, engine, size, seed, repeat, min_time) in a fresh process and returns its result row,
+    median times of at least repeat runs and min_time seconds, each run followed by a timed run of reference.
+    """
+    workload, engine, size, seed, repeat, min_time = job
+    a, b = WORKLOADS[workload](size, np.random.default_rng(seed))
+    pairs = list(zip(zip(*np.divmod(a, size)), zip(*np.divmod(b, size))))
+    pairs = [((int(ax), int(ay)), (int(bx), int(by))) for (ax, ay), (bx, by) in pairs]
+    roots, merges, relabelled = reference(size * size, a, b)
+
+    times, paints, references = [], [], []
+    gc.disable() # like timeit, a collection would land in whichever run happened to trigger it
+    while len(times) < repeat or sum(times) + sum(paints) + sum(references) < min_time:
+        uf = ENGINES[engine]((size, size), 200, COLOR_WHEEL)
+        start = time.perf_counter()
+        for p, q in pairs:
+            uf.union(p, q)
+        times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        uf.update_arr()
+        paints.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        reference(size * size, a, b)
+        references.append(time.perf_counter() - start)
+        gc.collect()
+    gc.enable()
+    seconds, paint = statistics.median(times), statistics.median(paints)
+    found = len(uf.group) if isinstance(uf, UnionFind) else len(uf.bbox)
+    correct = found == len(np.unique(roots[roots >= 0])) and same_groups(uf.roots([0, 0, size, size]).ravel(), roots)
+    return {"workload": workload, "engine": engine, "size": size, "unions": len(pairs),
+            "ms": seconds * 1e3, "paint_ms": paint * 1e3, "ops": len(pairs) / seconds,
+            "relative": statistics.median(r / t for r, t in zip(references, times)), "runs": len(times),
+            "merges": merges, "relabelled": relabelled, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "groups": found, "correct": correct}
+
+
+def exponent(rows):
+    """Exponent k of time ~ nodes^k between the smallest and the largest size of a curve."""
+    first, last = rows[0], rows[-1]
+    if first["size"] == last["size"]:
+        return float("nan")
+    return math.log(last["ms"] / first["ms"]) / math.log(last["size"] ** 2 / first["size"] ** 2)
+
+
+def regressions(rows, baseline, threshold):
+    """
+    Returns a line for every row whose speed relative to the independent union find is more than threshold
+    below the same row of baseline.  Baselines saved before the relative speed was measured are not compared.
+    """
+    before = {(row["workload"], row["engine"], row["size"]): row["relative"] for row in baseline if "relative" in row}
+    lines = []
+    for row in rows:
+        key = (row["workload"], row["engine"], row["size"])
+        if key in before and row["relative"] < (1 - threshold) * before[key]:
+            lines.append(f"{' '.join(map(str, key))}: {row['relative']:.2f}x the reference ({row['ops']:,.0f} ops/s), "
+                         f"baseline {before[key]:.2f}x")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [64, 128, 256], help = "plane width and height")
+    parser.add_argument("--workload", nargs = "+", default = list(WORKLOADS), choices = list(WORKLOADS))
+    parser.add_argument("--engine", nargs = "+", default = list(ENGINES), choices = list(ENGINES))
+    parser.add_argument("--jobs", type = int, default = None, help = "worker processes, one per core by default")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--repeat", type = int, default = 7, help = "least runs per job, the median counts")
+    parser.add_argument("--min-time", type = float, default = 0.5, help = "least seconds of runs per job")
+    parser.add_argument("--save", help = "write the results to this JSON file")
+    parser.add_argument("--baseline", help = "JSON file of earlier results to compare against")
+    parser.add_argument("--threshold", type = float, default = 0.25, help = "largest allowed drop of ops/sec, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    jobs = [(workload, engine, size, args.seed, args.repeat, args.min_time) for workload in args.workload for engine in args.engine for size in sorted(args.sizes)]
+    start = time.perf_counter()
+    # a process per job, so peak RSS is the job's own and jobs on separate cores do not share a GIL
+    fresh = {"max_tasks_per_child": 1} if sys.version_info >= (3, 11) else {} # older versions reuse the workers
+    with concurrent.futures.ProcessPoolExecutor(args.jobs, **fresh) as pool:
+        rows = list(pool.map(run, jobs))
+    wall = time.perf_counter() - start
+
+    print(f"{'workload':>12} {'engine':>6} {'size':>5} {'unions':>9} {'ms':>9} {'ops/s':>11} {'vs ref':>7} {'paint ms':>9} "
+          f"{'merges':>9} {'relabelled':>11} {'rss MB':>7} {'groups':>7}")
+    for i, row in enumerate(rows):
+        print(f"{row['workload']:>12} {row['engine']:>6} {row['size']:>5} {row['unions']:>9} {row['ms']:>9.1f} {row['ops']:>11,.0f} "
+              f"{row['relative']:>7.2f} {row['paint_ms']:>9.1f} {row['merges']:>9} {row['relabelled']:>11} {row['rss_mb']:>7.1f} "
+              f"{row['groups']:>7}{'' if row['correct'] else ' WRONG'}")
+        if i + 1 == len(rows) or rows[i + 1]["engine"] != row["engine"] or rows[i + 1]["workload"] != row["workload"]:
+            curve = [r for r in rows if r["engine"] == row["engine"] and r["workload"] == row["workload"]]
+            print(f"{'':>12} {'':>6} time ~ nodes^{exponent(curve):.2f}")
+    busy = sum(row["runs"] * (row["ms"] + row["paint_ms"]) for row in rows) / 1e3
+    print(f"{len(rows)} runs in {wall:.1f} s on {args.jobs or 'all'} cores, {busy:.1f} s of unions and painting")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(rows, f, indent = 1)
+    failed = [f"{row['workload']} {row['engine']} {row['size']}: wrong groups" for row in rows if not row["correct"]]
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed += regressions(rows, json.load(f), args.threshold)
+    for line in failed:
+        print("FAILED", line)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+Shared canvas server: one union find engine that several clients draw on at once, see protocol.py for the messages.
+
+    python server.py serve --size 800 800 --port 8765
+    python server.py serve --size 4000 4000 --engine tiled --unix /tmp/canvas.sock
+    python server.py swarm --clients 32 --ops 200                  # against a server started in the same process
+    python server.py swarm --clients 32 --ops 200 --port 8765      # against a running server
+
+The server owns the drawing.  Operations that arrive during a tick (1 / 60 s by default) are applied together in a
+worker thread followed by a single update_arr pass, then every client receives one DELTA with the group ids of the
+boxes that changed, coalesced, instead of whole frames.  A client that joins receives the whole drawing with the next
+tick.  Clients that stop reading are disconnected once MAX_BUFFER bytes are queued for them.
+swarm connects synthetic clients that send random shapes, strokes, fills and erases, and reports the throughput
+and the fan-out latency: the time from sending an operation until every client has received its effect.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+
+import protocol
+import raster
+import settings
+from union_find import ArrayUnionFind, TiledUnionFind, Shape, ShapeTemplates, join, make_palette, render
+
+ENGINES = {"array": ArrayUnionFind, "tiled": TiledUnionFind}
+MAX_BUFFER = 64 << 20 # bytes queued for a client before it is disconnected
+FILL_SIZE = 1024      # paint fills stay within a FILL_SIZE x FILL_SIZE box around the point, like the visible part in Game
+MAX_THICKNESS = 64
+
+
+def coalesce(boxes, limit = 16):
+    """Merges overlapping [x0, y0, x1, y1] boxes, more than limit boxes are merged into their bounding box."""
+    boxes = [list(box) for box in boxes if box[0] < box[2] and box[1] < box[3]]
+    i = 0
+    while i < len(boxes):
+        a = boxes[i]
+        for j in range(i + 1, len(boxes)):
+            b = boxes[j]
+            if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                boxes[i] = join(a, b)
+                del boxes[j]
+                break
+        else:
+            i += 1
+    if len(boxes) > limit:
+        boxes = [[min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]]
+    return boxes
+
+
+class CanvasServer():
+    """
+    Owns the drawing and applies the operations of every client, see the module docstring.
+    params:
+        size (width, height) of the drawing plane
+        engine ArrayUnionFind or TiledUnionFind (large planes)
+        tick seconds between batches of operations
+    """
+    def __init__(self, size, engine = ArrayUnionFind, tick = 1 / 60):
+        self.colors = settings.settings["COLOR_WHEEL"]
+        self.uf = engine(tuple(size), settings.settings["BRIGHTNESS"], self.colors)
+        self.templates = ShapeTemplates()
+        self.tick_seconds = tick
+        self.tick = 0
+        self.pending = []     # (client id, protocol.Op) received since the last batch
+        self.clients = {}     # client id: StreamWriter of the clients that have the drawing
+        self.joining = {}     # client id: StreamWriter of the clients that receive the whole drawing with the next batch,
+                              # they stay here until it is sent so a client that leaves meanwhile is dropped by handle
+        self.next_id = 0
+        self.wake = asyncio.Event()
+        self.task = None
+
+    async def start(self, host = "127.0.0.1", port = 8765, path = None):
+        """Listens on a TCP port (0 picks a free one) or on the Unix socket at path, returns the asyncio Server."""
+        if path:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        self.task = asyncio.create_task(self.run())
+        return server
+
+    async def handle(self, reader, writer):
+        """Serves one client connection."""
+        client, self.next_id = self.next_id, (self.next_id + 1) % 65536
+        writer.write(protocol.pack_hello(client, (self.uf.R, self.uf.C), self.colors))
+        self.joining[client] = writer
+        self.wake.set()
+        try:
+            while (body := await protocol.read_frame(reader)) is not None:
+                self.pending.append((client, protocol.unpack_op(body)))
+                self.wake.set()
+        except ValueError as e:
+            print(f"client {client}: {e}")
+        finally:
+            self.clients.pop(client, None)
+            self.joining.pop(client, None)
+            writer.close()
+
+    async def run(self):
+        """Applies the pending operations in batches, at most one per tick, and sends the changes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            ops, self.pending = self.pending, []
+            joined = list(self.joining) # clients that join during the step get the whole drawing with the next batch
+            delta, whole = await loop.run_in_executor(None, self.step, ops, bool(joined))
+            self.send(self.clients, delta)
+            joining = {client: self.joining.pop(client) for client in joined if client in self.joining}
+            self.send(joining, whole) # drops the writers that closed meanwhile
+            self.clients.update(joining)
+            await asyncio.sleep(self.tick_seconds) # operations arriving meanwhile make the next batch
+
+    def step(self, ops, whole):
+        """
+        Applies ops and repaints once, runs in a worker thread.  Returns the DELTA frame of the changes
+        and, when whole is True, a DELTA frame of the whole drawing for clients that just joined.
+        """
+        for _, op in ops:
+            self.apply(op)
+        self.uf.update_arr()
+        self.tick += 1
+        applied = [(client, op.seq) for client, op in ops]
+        boxes = coalesce(self.uf.take_updates() + self.uf.take_recolored())
+        delta = protocol.pack_delta(self.tick, applied, [(box, self.uf.label_box(box)) for box in boxes])
+        if not whole:
+            return delta, None
+        boxes = coalesce(self.uf.bbox.values())
+        return delta, protocol.pack_delta(self.tick, applied, [(box, self.uf.label_box(box)) for box in boxes])
+
+    def apply(self, op):
+        """Applies one operation to the engine, like the matching Session tool."""
+        uf = self.uf
+        if op.kind == protocol.SHAPE:
+            tool, (x0, y0, x1, y1), thickness, filled = op.args
+            x0, x1 = min(x0, uf.R - 2), min(x1, uf.R - 2)
+            y0, y1 = min(y0, uf.C - 2), min(y1, uf.C - 2)
+            uf.union_many(self.templates.nodes(x0, y0, x1, y1, tool, min(thickness, MAX_THICKNESS), filled))
+        elif op.kind == protocol.STROKE:
+            vertices, thickness, erasing = op.args
+            if len(vertices):
+                nodes = raster.polyline(vertices, thickness = min(thickness, MAX_THICKNESS))
+                if erasing:
+                    uf.erase_nodes(nodes)
+                else:
+                    uf.union_many(nodes)
+        elif op.kind == protocol.FILL:
+            x, y = op.args
+            if x < uf.R and y < uf.C and (x, y) not in uf.id:
+                x0, y0 = max(0, x - FILL_SIZE // 2), max(0, y - FILL_SIZE // 2)
+                shape = Shape([(x, y)])
+                shape.fill_region(x, y, uf, [x0, y0, min(uf.R, x0 + FILL_SIZE), min(uf.C, y0 + FILL_SIZE)])
+                uf.union_many(shape, touching = True)
+        elif op.kind == protocol.ERASE:
+            if op.args in uf.id:
+                uf.delete_group(op.args)
+
+    def send(self, writers, data):
+        """Writes data to every writer of the dict writers (client id: StreamWriter), closed writers are removed from it."""
+        for client, writer in list(writers.items()):
+            if not writer.is_closing() and writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                print(f"client {client} is not reading, disconnecting it")
+                writer.close()
+            if writer.is_closing():
+                del writers[client]
+                continue
+            writer.write(data)
+
+
+class CanvasClient():
+    """
+    Connection to a CanvasServer.  shape, stroke, fill and erase send an operation and return its sequence number,
+    receive applies the next DELTA to labels, the client's copy of the group ids of the drawing.
+    """
+    def __init__(self, reader, writer, hello):
+        self.reader, self.writer = reader, writer
+        self.id, (R, C), self.colors = protocol.unpack_hello(hello)
+        self.labels = np.full((R, C), -1, dtype = np.int32)
+        self.seq = 0
+        self.received = 0 # bytes of DELTA frames
+
+    @classmethod
+    async def connect(cls, host = "127.0.0.1", port = 8765, path = None):
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        hello = await protocol.read_frame(reader)
+        if hello is None:
+            raise ConnectionError("the server closed the connection")
+        return cls(reader, writer, hello)
+
+    def next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def shape(self, tool, x0, y0, x1, y1, thickness = 3, filled = False):
+        seq = self.next_seq()
+        self.writer.write(protocol.pack_shape(seq, tool, x0, y0, x1, y1, thickness, filled))
+        return seq
+
+    def stroke(self, vertices, thickness = 3, erasing = False):
+        seq = self.next_seq()
+        self.writer.write(protocol.pack_stroke(seq, vertices, thickness, erasing))
+        return seq
+
+    def fill(self, x, y):
+        seq = self.next_seq()
+        self.writer.write(protocol.pack_fill(seq, x, y))
+        return seq
+
+    def erase(self, x, y):
+        seq = self.next_seq()
+        self.writer.write(protocol.pack_erase(seq, x, y))
+        return seq
+
+    async def receive(self):
+        """Waits for the next DELTA, applies it to labels and returns it, or None when the server closed the connection."""
+        body = await protocol.read_frame(self.reader)
+        if body is None:
+            return None
+        self.received += len(body)
+        delta = protocol.unpack_delta(body)
+        for (x0, y0, x1, y1), labels in delta.patches:
+            self.labels[x0:x1, y0:y1] = labels
+        return delta
+
+    def image(self):
+        """Returns the RGB pixels of the client's copy of the drawing."""
+        return render(self.labels, make_palette(self.colors))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def random_op(client, rng):
+    """Sends a random operation from client: mostly shapes and freehand strokes, some fills and erases."""
+    R, C = client.labels.shape
+    roll = rng.random()
+    x, y = rng.randrange(R - 2), rng.randrange(C - 2)
+    if roll < 0.6:
+        w, h = rng.randrange(2, max(3, R // 8)), rng.randrange(2, max(3, C // 8))
+        return client.shape(rng.choice(protocol.TOOLS), x, y, min(R - 2, x + w), min(C - 2, y + h), filled = rng.random() < 0.2)
+    if roll < 0.9:
+        steps = np.cumsum([(rng.randint(-9, 9), rng.randint(-9, 9)) for _ in range(rng.randrange(2, 20))], axis = 0)
+        vertices = np.clip(steps + (x, y), 0, (R - 1, C - 1))
+        return client.stroke(vertices, erasing = roll > 0.85)
+    if roll < 0.93:
+        return client.fill(x, y)
+    return client.erase(x, y)
+
+
+async def swarm(clients, ops, address, rate = 0, seed = 0):
+    """
+    Connects clients synthetic clients to the server at address (keyword arguments of CanvasClient.connect), each sends
+    ops random operations (rate per second, 0 for as fast as the socket takes them) and reads every DELTA until it has
+    seen all operations.  Returns a dict of the measurements.
+    """
+    connections = [await CanvasClient.connect(**address) for _ in range(clients)]
+    total = clients * ops
+    sent = {}     # (client id, seq): time sent
+    arrived = {}  # (client id, seq): times the operation arrived at each client
+
+    async def produce(client, rng):
+        for _ in range(ops):
+            sent[client.id, random_op(client, rng)] = time.perf_counter()
+            await client.writer.drain()
+            await asyncio.sleep(1 / rate if rate else 0)
+
+    async def consume(client):
+        seen = deltas = 0
+        while seen < total:
+            delta = await client.receive()
+            if delta is None:
+                break
+            now = time.perf_counter()
+            for key in delta.applied:
+                arrived.setdefault(tuple(key), []).append(now)
+            seen += len(delta.applied)
+            deltas += 1
+        return deltas
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(produce(c, random.Random(seed + i)) for i, c in enumerate(connections)),
+                                   *(consume(c) for c in connections))
+    elapsed = time.perf_counter() - start
+    fan_out = np.array([max(arrived[key]) - t for key, t in sent.items() if len(arrived.get(key, ())) == clients]) * 1e3
+    received = [c.received for c in connections]
+    for c in connections:
+        await c.close()
+    return {"ops": total, "seconds": elapsed, "ops_per_second": total / elapsed,
+            "complete": len(fan_out), "deltas": sum(results[clients:]) / clients,
+            "p50_ms": float(np.percentile(fan_out, 50)) if len(fan_out) else float("nan"),
+            "p99_ms": float(np.percentile(fan_out, 99)) if len(fan_out) else float("nan"),
+            "mb_per_client": sum(received) / clients / 2**20}
+
+
+async def cmd_serve(args):
+    canvas = CanvasServer(args.size, ENGINES[args.engine], args.tick)
+    server = await canvas.start(args.host, args.port, args.unix)
+    print(f"serving a {args.size[0]}x{args.size[1]} canvas on {args.unix or f'{args.host}:{args.port}'}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), canvas.task)
+
+
+async def cmd_swarm(args):
+    server = None
+    if args.port is None and args.unix is None:
+        canvas = CanvasServer(args.size, ENGINES[args.engine], args.tick)
+        server = await canvas.start(args.host, 0)
+        address = {"host": args.host, "port": server.sockets[0].getsockname()[1]}
+    else:
+        address = {"host": args.host, "port": args.port, "path": args.unix}
+    result = await swarm(args.clients, args.ops, address, args.rate, args.seed)
+    print(f"{args.clients} clients x {args.ops} operations in {result['seconds']:.2f} s: {result['ops_per_second']:,.0f} ops/s, "
+          f"{result['deltas']:.0f} deltas and {result['mb_per_client']:.2f} MB received per client")
+    print(f"fan-out latency p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms "
+          f"({result['complete']} of {result['ops']} operations reached every client)")
+    if server:
+        server.close()
+        canvas.task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest = "command", required = True)
+    for name, func in (("serve", cmd_serve), ("swarm", cmd_swarm)):
+        p = commands.add_parser(name, help = "run a shared canvas server" if name == "serve" else "load test a server with synthetic clients")
+        p.add_argument("--host", default = "127.0.0.1")
+        p.add_argument("--port", type = int, default = 8765 if name == "serve" else None)
+        p.add_argument("--unix", help = "path of a Unix socket instead of TCP")
+        p.add_argument("--size", type = int, nargs = 2, default = [800, 800], help = "width and height of the drawing plane")
+        p.add_argument("--engine", default = "array", choices = list(ENGINES))
+        p.add_argument("--tick", type = float, default = 1 / 60, help = "seconds between batches of operations")
+        p.set_defaults(func = func)
+        if name == "swarm":
+            p.add_argument("--clients", type = int, default = 16)
+            p.add_argument("--ops", type = int, default = 100, help = "operations per client")
+            p.add_argument("--rate", type = float, default = 0, help = "operations per second per client, 0 for no limit")
+            p.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
@@ -5,8 +5,20 @@ color_wheel = ((c, a, a), (c, b, a), (c, c, a), (b, c, a), (a, c, a),
 
 settings = {"WIDTH": 800,               # window width
             "HEIGHT": 800,              # window height
-            "SLEEP_TIME": 0,            # sleep between iterations to reduce the frame rate
-            "LOCK_TIME": 0.2,           # delay between allowed input actions (seconds)
+            "CANVAS": None,             # (width, height) of the drawing plane, None for the window size, larger planes scroll
+            "FPS": 60,                  # frame rate cap, the game waits for input when idle
             "COLOR_WHEEL": color_wheel, # tuple of (R, G, B) colors
-            "BRIGHTNESS": 200           # pixel intensity [0, 255]
+            "BRIGHTNESS": 200,          # pixel intensity [0, 255]
+            "THICKNESS": 3,             # width of drawn lines in pixels (3 keeps diagonal steps connected)
+            "ERASER_SIZE": 9,           # width of the eraser brush in pixels
+            "CONNECTIVITY": 4,          # pixels of imported bitmaps join a group along edges (4) or edges and corners (8)
+            "TEMPLATE_CACHE": 32 << 20, # bytes of rasterized shapes kept for reuse, shapes of the same tool and size share them
+            "WORKERS": 2,               # threads rasterizing released shapes, 0 rasterizes on the main thread
+            "SAVE_FILE": "drawing.ufc", # F5 saves the drawing here, F9 loads it
+            "AUTOSAVE_FILE": "autosave.ufc", # in the user's data directory unless it is an absolute path
+            "AUTOSAVE_EVERY": 50,       # edits between autosaves, 0 disables autosave
+            "UNDO_BUDGET": 64 << 20,    # bytes of undo history (Z undoes, Y redoes), the oldest edits are forgotten first
+            "HUD": False,               # show group statistics at start, H toggles them
+            "EXPORT_FPS": 30,           # frame rate of exported frames (--export)
+            "EXPORT_QUEUE": 32          # captured frames waiting to be written, more are dropped while drawing live
             }
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Single file format for saved drawings, laid out so that loading memory maps the arrays instead of reading them.
+
+File layout (little endian):
+    prefix   b"UFCV", version (uint8), length of the header (uint32)
+    header   JSON object: the engine's metadata and, for every array, its dtype, shape and offset
+    arrays   raw C ordered array data, every array starts on a 64 byte boundary after the header
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC, VERSION = b"UFCV", 1
+PREFIX = struct.Struct("<4sBI")
+ALIGN = 64
+APP = "union-find-drawing-game"
+
+
+def align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def save(path, meta, arrays):
+    """
+    Writes meta (a JSON serializable dict) and arrays ({name: numpy array}) to path.
+    The file is written next to path and renamed over it, so a crash never leaves a half written file.
+    A drawing memory mapped from path must be detached first (see ArrayUnionFind.detach), Windows can not
+    replace a mapped file.  Raises OSError when the file can not be written, nothing is left behind.
+    """
+    layout, offset = {}, 0
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+    for name, arr in arrays.items():
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset = align(offset + arr.nbytes)
+    header = json.dumps(dict(meta, arrays = layout)).encode()
+    start = align(PREFIX.size + len(header))
+
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(PREFIX.pack(MAGIC, VERSION, len(header)))
+            f.write(header)
+            for name, arr in arrays.items():
+                f.seek(start + layout[name]["offset"])
+                f.write(arr.data)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load(path):
+    """
+    Returns (meta, arrays) saved by save.  The arrays are copy-on-write memory maps of the file:
+    they are paged in when first touched and changing them never changes the file.
+    """
+    with open(path, "rb") as f:
+        magic, version, length = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} drawing")
+        meta = json.loads(f.read(length))
+    start = align(PREFIX.size + length)
+    arrays = {}
+    for name, spec in meta.pop("arrays").items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape, dtype = dtype) # empty arrays can not be mapped
+        else:
+            arrays[name] = np.memmap(path, dtype = dtype, mode = "c", offset = start + spec["offset"], shape = shape)
+    return meta, arrays
+
+
+def data_path(name):
+    """
+    Returns name inside the game's directory of user data (not created here): %LOCALAPPDATA% on Windows,
+    ~/Library/Application Support on macOS and $XDG_DATA_HOME (~/.local/share) elsewhere.  Absolute paths are kept.
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, APP, name)
@@ -0,0 +1,61 @@
+"""
+Tests of the shared canvas protocol, run with python -m pytest.
+"""
+import numpy as np
+import pytest
+
+import protocol
+
+
+def body(message):
+    """The body of a framed message."""
+    n, = protocol.LENGTH.unpack_from(message)
+    assert len(message) == protocol.LENGTH.size + n
+    return message[protocol.LENGTH.size:]
+
+
+def test_shape():
+    op = protocol.unpack_op(body(protocol.pack_shape(7, "star", 1, 2, 300, 400, thickness = 5, filled = True)))
+    assert op == protocol.Op(protocol.SHAPE, 7, ("star", (1, 2, 300, 400), 5, True))
+
+
+def test_stroke():
+    vertices = [(0, 0), (10, 65535), (300, 4)]
+    op = protocol.unpack_op(body(protocol.pack_stroke(2 ** 32 - 1, vertices, thickness = 9, erasing = True)))
+    assert (op.kind, op.seq) == (protocol.STROKE, 2 ** 32 - 1)
+    np.testing.assert_array_equal(op.args[0], vertices)
+    assert op.args[1:] == (9, True)
+
+
+@pytest.mark.parametrize("kind, pack", [(protocol.FILL, protocol.pack_fill), (protocol.ERASE, protocol.pack_erase)])
+def test_points(kind, pack):
+    assert protocol.unpack_op(body(pack(3, 17, 42))) == protocol.Op(kind, 3, (17, 42))
+
+
+def test_malformed_operations():
+    for data in (b"", b"\x01", protocol.OP.pack(protocol.SHAPE, 1) + b"\x00", protocol.OP.pack(99, 1),
+                 protocol.OP.pack(protocol.SHAPE, 1) + protocol.SHAPE_ARGS.pack(200, 0, 1, 0, 0, 1, 1)):
+        with pytest.raises(ValueError):
+            protocol.unpack_op(data)
+
+
+def test_hello():
+    colors = [(255, 51, 51), (51, 255, 51), (51, 51, 255)]
+    client, size, received = protocol.unpack_hello(body(protocol.pack_hello(12, (640, 480), colors)))
+    assert (client, size) == (12, (640, 480))
+    np.testing.assert_array_equal(received, colors)
+    with pytest.raises(ValueError):
+        protocol.unpack_hello(body(protocol.pack_delta(0, [], [])))
+
+
+def test_delta():
+    labels = np.arange(-1, 11, dtype = np.int32).reshape(3, 4)
+    patches = [([0, 0, 3, 4], labels), ([5, 6, 6, 7], np.array([[2 ** 31 - 1]], dtype = np.int32))]
+    delta = protocol.unpack_delta(body(protocol.pack_delta(99, [(1, 5), (2, 6)], patches)))
+    assert delta.tick == 99
+    assert delta.applied == [(1, 5), (2, 6)]
+    assert [box for box, _ in delta.patches] == [box for box, _ in patches]
+    for (_, received), (_, sent) in zip(delta.patches, patches):
+        np.testing.assert_array_equal(received, sent)
+    with pytest.raises(ValueError):
+        protocol.unpack_delta(body(protocol.pack_hello(1, (1, 1), [(1, 2, 3)])))
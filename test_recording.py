@@ -0,0 +1,70 @@
+"""
+Tests of the input recordings, run with python -m pytest.
+"""
+import numpy as np
+
+import recording
+import settings
+from recording import Event
+from union_find import ArrayUnionFind, TiledUnionFind
+from union_find_drawing_demo import Session
+
+EVENTS = [Event(0, recording.MOTION, 0, (10, 20)),
+          Event(1500, recording.PRESS, recording.LEFT, (10, 20)),
+          Event(1600, recording.MOTION, 0, (400, 3)),
+          Event(200000, recording.RELEASE, recording.LEFT, (0, 0)),
+          Event(200001, recording.KEY, recording.ERASER, (0, 0)),
+          Event(10 ** 9, recording.PRESS, recording.WHEEL_DOWN, (65535, 65535)),
+          Event(10 ** 9, recording.QUIT, 0, (65535, 65535))]
+
+
+def test_events_round_trip(tmp_path):
+    path = str(tmp_path / "session.ufr")
+    recorder = recording.Recorder(path, (800, 600), (1024, 1024))
+    for event in EVENTS:
+        recorder.write(event)
+    arr_digest = recording.digest([np.arange(10)])
+    recorder.close(arr_digest)
+    replay = recording.Replay(path)
+    assert replay.size == (800, 600)
+    assert replay.canvas == (1024, 1024)
+    assert replay.digest == arr_digest
+    assert list(replay) == EVENTS
+
+
+def test_without_digest(tmp_path):
+    path = str(tmp_path / "session.ufr")
+    recorder = recording.Recorder(path, (800, 600), (800, 600))
+    recorder.write(EVENTS[0])
+    recorder.close()
+    replay = recording.Replay(path)
+    assert replay.digest is None
+    assert list(replay) == EVENTS[:1]
+
+
+def test_varints():
+    for n in (0, 1, 127, 128, 300, 2 ** 35):
+        out = bytearray()
+        recording.write_varint(out, n)
+        assert recording.read_varint(out, 0) == (n, len(out))
+    for n in (0, 1, -1, 63, -64, 10 ** 6, -10 ** 6):
+        assert recording.unzigzag(recording.zigzag(n)) == n
+
+
+def play(engine, workers):
+    uf = engine((120, 120), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"], undo_budget = 1 << 20)
+    session = Session(uf, workers = workers)
+    session.play([("select", "star"), ("press", 5, 5), ("drag", 40, 40), ("release",),
+                  ("select", "rectangle"), ("press", 30, 30), ("release", 90, 70),
+                  ("select", "freehand"), ("press", 100, 5), ("trace", [(110, 60), (60, 110)]), ("release",),
+                  ("fill", 60, 50), ("undo",), ("redo",),
+                  ("select", "eraser"), ("select_eraser", "brush"), ("press", 0, 60), ("drag", 119, 60), ("release",),
+                  ("select_eraser", "group"), ("press", 100, 5), ("release",)])
+    session.flush()
+    return recording.digest(uf.snapshot())
+
+
+def test_replay_digest_is_deterministic():
+    """Replaying the same events reproduces the digest, also when shapes are rasterized on worker threads."""
+    for engine in (ArrayUnionFind, TiledUnionFind):
+        assert play(engine, 0) == play(engine, 0) == play(engine, 2)
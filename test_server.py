@@ -0,0 +1,65 @@
+"""
+Tests of the shared canvas server, run with python -m pytest.
+"""
+import asyncio
+import threading
+
+import numpy as np
+
+from server import CanvasServer, CanvasClient
+
+
+async def until(condition, seconds = 5):
+    """Waits for condition() to hold, the server runs in the same event loop."""
+    for _ in range(int(seconds / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError
+
+
+def test_clients_share_the_drawing():
+    async def main():
+        canvas = CanvasServer((64, 64), tick = 0)
+        server = await canvas.start(port = 0)
+        address = {"port": server.sockets[0].getsockname()[1]}
+        a, b = await CanvasClient.connect(**address), await CanvasClient.connect(**address)
+        await until(lambda: len(canvas.clients) == 2)
+        seq = a.shape("rectangle", 5, 5, 20, 30)
+        for client in (a, b):
+            while (a.id, seq) not in map(tuple, (await client.receive()).applied):
+                pass
+        np.testing.assert_array_equal(a.labels, b.labels)
+        assert (a.labels >= 0).any()
+        for client in (a, b):
+            await client.close()
+        server.close()
+        canvas.task.cancel()
+    asyncio.run(main())
+
+
+def test_client_leaving_during_a_step_is_dropped():
+    """A client that disconnects while the batch that would send it the drawing runs never becomes a client."""
+    async def main():
+        canvas = CanvasServer((64, 64), tick = 0)
+        stepping, resume = threading.Event(), threading.Event()
+        step = canvas.step
+
+        def slow_step(ops, whole):
+            stepping.set()
+            resume.wait(5)
+            return step(ops, whole)
+
+        canvas.step = slow_step
+        server = await canvas.start(port = 0)
+        client = await CanvasClient.connect(port = server.sockets[0].getsockname()[1])
+        await until(stepping.is_set)
+        await client.close()
+        await until(lambda: not canvas.joining)
+        resume.set()
+        await until(lambda: canvas.tick == 1)
+        await asyncio.sleep(0.05)
+        assert not canvas.clients and not canvas.joining
+        server.close()
+        canvas.task.cancel()
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""
+Tests of saving and loading drawings, run with python -m pytest.
+"""
+import numpy as np
+import pytest
+
+import raster
+import settings
+import storage
+from union_find import ArrayUnionFind, TiledUnionFind
+
+
+def make(engine, size = 64):
+    return engine((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+
+
+def draw(uf):
+    uf.union_many(np.argwhere(np.ones((10, 20), dtype = bool)) + [3, 5])
+    uf.union_many(raster.polyline([(0, 63), (63, 30)], thickness = 3))
+    uf.union((50, 2), (50, 3))
+    uf.update_arr()
+
+
+def test_arrays_round_trip(tmp_path):
+    path = str(tmp_path / "arrays.ufc")
+    arrays = {"a": np.arange(12, dtype = np.int32).reshape(3, 4), "b": np.array([1.5, -2.0]),
+              "empty": np.zeros((0, 4), dtype = np.int64)}
+    storage.save(path, {"engine": "test", "n": 3}, arrays)
+    meta, loaded = storage.load(path)
+    assert meta == {"engine": "test", "n": 3}
+    assert loaded.keys() == arrays.keys()
+    for name, arr in arrays.items():
+        assert loaded[name].dtype == arr.dtype
+        np.testing.assert_array_equal(loaded[name], arr)
+
+
+def test_not_a_drawing(tmp_path):
+    path = tmp_path / "junk.ufc"
+    path.write_bytes(b"PNG\x00" + bytes(64))
+    with pytest.raises(ValueError):
+        storage.load(str(path))
+
+
+@pytest.mark.parametrize("engine", [ArrayUnionFind, TiledUnionFind])
+def test_engine_round_trip(engine, tmp_path):
+    path = str(tmp_path / "drawing.ufc")
+    uf = make(engine)
+    draw(uf)
+    storage.save(path, *uf.state())
+    saved = open(path, "rb").read()
+
+    loaded = make(engine)
+    loaded.load_state(*storage.load(path))
+    np.testing.assert_array_equal(loaded.roots([0, 0, 64, 64]) >= 0, uf.roots([0, 0, 64, 64]) >= 0)
+    assert sorted(map(tuple, loaded.bbox.values())) == sorted(map(tuple, uf.bbox.values()))
+    assert sorted(loaded.size[root] for root in loaded.bbox) == sorted(uf.size[root] for root in uf.bbox)
+    assert loaded.group_of((50, 2)) == uf.group_of((50, 2))
+    assert loaded.group_id == uf.group_id
+
+    # the loaded arrays are copy-on-write maps of the file, editing never changes it
+    loaded.union((50, 3), (20, 20))
+    loaded.delete_group((5, 5))
+    assert loaded.root_of((50, 2)) is not None and loaded.root_of((5, 5)) is None
+    assert open(path, "rb").read() == saved
+
+
+@pytest.mark.parametrize("engine", [ArrayUnionFind, TiledUnionFind])
+def test_connectivity_is_saved(engine, tmp_path):
+    path = str(tmp_path / "drawing.ufc")
+    uf = make(engine)
+    mask = np.eye(64, dtype = bool)
+    uf.load_labels(raster.label(mask, connectivity = 8)[0], connectivity = 8)
+    storage.save(path, *uf.state())
+    loaded = make(engine)
+    loaded.load_state(*storage.load(path))
+    assert loaded.connectivity == 8
+
+
+def test_wrong_engine(tmp_path):
+    path = str(tmp_path / "drawing.ufc")
+    storage.save(path, *make(ArrayUnionFind).state())
+    with pytest.raises(ValueError):
+        make(TiledUnionFind).load_state(*storage.load(path))
+    with pytest.raises(ValueError):
+        make(ArrayUnionFind, size = 32).load_state(*storage.load(path))
+
+
+def test_failed_save_leaves_nothing(tmp_path):
+    path = tmp_path / "missing" / "drawing.ufc"
+    with pytest.raises(OSError):
+        storage.save(str(path), *make(ArrayUnionFind).state())
+    assert not (tmp_path / "missing").exists()
+
+
+@pytest.mark.parametrize("engine", [ArrayUnionFind, TiledUnionFind])
+def test_save_over_loaded_drawing(engine, tmp_path):
+    path = str(tmp_path / "drawing.ufc")
+    uf = make(engine)
+    draw(uf)
+    storage.save(path, *uf.state())
+    uf.load_state(*storage.load(path))
+    uf.detach()
+    assert not isinstance(uf.parent, np.memmap)
+    assert not any(isinstance(tile, np.memmap) for tile in getattr(uf, "tiles", {}).values())
+    uf.delete_group((5, 5))
+    storage.save(path, *uf.state())
+    loaded = make(engine)
+    loaded.load_state(*storage.load(path))
+    assert loaded.root_of((5, 5)) is None and loaded.root_of((50, 2)) is not None
+
+
+def test_data_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage.sys, "platform", "linux")
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path))
+    assert storage.data_path("autosave.ufc") == str(tmp_path / storage.APP / "autosave.ufc")
+    assert storage.data_path(str(tmp_path / "here.ufc")) == str(tmp_path / "here.ufc")
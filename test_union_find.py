@@ -0,0 +1,243 @@
+"""
+Tests of the union find engines, run with python -m pytest.
+"""
+import numpy as np
+import pytest
+
+import raster
+import settings
+from union_find import UnionFind, ArrayUnionFind, TiledUnionFind, ShapeTemplates, create_vertices, rasterize
+
+SIZE = 48
+
+
+def tiled(*args, **kwargs):
+    return TiledUnionFind(*args, tile = 16, **kwargs) # chunks smaller than the plane, so groups cross chunk borders
+
+ENGINES = [ArrayUnionFind, tiled]
+
+
+def make(engine, size = SIZE, undo_budget = 0):
+    if engine is UnionFind:
+        return UnionFind((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"])
+    return engine((size, size), settings.settings["BRIGHTNESS"], settings.settings["COLOR_WHEEL"], undo_budget = undo_budget)
+
+
+def partition(uf):
+    """The groups of uf as a label image numbered like raster.label (1 .. count in order of their first node)."""
+    roots = uf.roots([0, 0, uf.R, uf.C]).ravel()
+    on = roots >= 0
+    _, first, inverse = np.unique(roots[on], return_index = True, return_inverse = True)
+    labels = np.zeros(roots.shape, dtype = np.int32)
+    labels[on] = (np.argsort(np.argsort(first)) + 1)[inverse]
+    return labels.reshape(uf.R, uf.C)
+
+
+def sizes(uf):
+    return sorted(int(uf.size[root]) for root in uf.bbox)
+
+
+def state(uf):
+    """Everything an undo must restore: the partition, the group ids and every group's size, box and sums."""
+    roots = uf.roots([0, 0, uf.R, uf.C])
+    gids = np.where(roots >= 0, uf.gid[np.maximum(roots, 0)], -1)
+    groups = sorted((int(uf.size[root]), tuple(uf.bbox[root]), tuple(uf.sums[root])) for root in uf.bbox)
+    return partition(uf), gids, groups, uf.group_id
+
+
+def assert_same(a, b):
+    np.testing.assert_array_equal(a[0], b[0])
+    np.testing.assert_array_equal(a[1], b[1])
+    assert a[2:] == b[2:]
+
+
+def random_rectangle(rng, size = SIZE):
+    x0, y0 = rng.integers(0, size - 4, 2)
+    w, h = rng.integers(1, 12, 2)
+    return np.argwhere(np.ones((w, h), dtype = bool)) + [x0, y0]
+
+
+def random_stroke(rng, size = SIZE, thickness = 3):
+    """A stroke thick enough to be 4-connected, a one pixel wide diagonal is a group that raster.label splits."""
+    return raster.polyline(rng.integers(-2, size + 2, (rng.integers(2, 5), 2)), thickness = thickness)
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("engine", ENGINES + [UnionFind])
+def test_partition_matches_label(engine, seed):
+    """Shapes added with touching merge into the 4-connected components of the drawing, erasing splits them again."""
+    rng = np.random.default_rng(seed)
+    uf = make(engine)
+    drawn = np.zeros((SIZE, SIZE), dtype = bool)
+    for step in range(40):
+        if engine is not UnionFind and step % 4 == 3:
+            nodes = random_stroke(rng)
+            uf.erase_nodes(nodes)
+            value = False
+        else:
+            nodes = random_rectangle(rng) if rng.random() < 0.5 else random_stroke(rng)
+            uf.union_many(nodes, touching = True)
+            value = True
+        x, y = nodes.T
+        on = (0 <= x) & (x < SIZE) & (0 <= y) & (y < SIZE)
+        drawn[x[on], y[on]] = value
+        uf.update_arr()
+        labels, count = raster.label(drawn)
+        np.testing.assert_array_equal(partition(uf), labels)
+        if engine is not UnionFind:
+            assert len(uf.groups) == count
+            assert sum(sizes(uf)) == drawn.sum()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_single_unions_match_label(engine):
+    rng = np.random.default_rng(0)
+    uf = make(engine)
+    drawn = rng.random((SIZE, SIZE)) < 0.6
+    for x, y in np.argwhere(drawn).tolist():
+        uf.union((x, y), (x, y))
+        for nx, ny in ((x - 1, y), (x, y - 1)):
+            if nx >= 0 and ny >= 0 and drawn[nx, ny]:
+                uf.union((x, y), (nx, ny))
+    np.testing.assert_array_equal(partition(uf), raster.label(drawn)[0])
+    assert uf.union((-1, -1), (-5, 3)) is None
+
+
+def edits(uf):
+    """One edit of every kind the journal records, on a drawing of a few groups."""
+    rng = np.random.default_rng(1)
+    return {
+        "union": lambda: uf.union((40, 40), (40, 41)),
+        "union new node": lambda: uf.union((6, 1), (7, 1)),
+        "merge": lambda: uf.union((3, 3), (20, 20)),
+        "union_many": lambda: uf.union_many(random_rectangle(rng)),
+        "union_many touching": lambda: uf.union_many(np.array([[10, 12]]), touching = True),
+        "delete_group": lambda: uf.delete_group((3, 3)),
+        "erase_nodes": lambda: uf.erase_nodes(np.array([[20, y] for y in range(SIZE)])),
+        "erase group": lambda: uf.erase_nodes(np.argwhere(np.ones((5, 5), dtype = bool)) + [30, 2]),
+        "reset": lambda: uf.reset(),
+    }
+
+
+def draw_groups(uf):
+    uf.union_many(np.argwhere(np.ones((6, 6), dtype = bool)) + [1, 1])
+    uf.union_many(np.argwhere(np.ones((3, SIZE - 4), dtype = bool)) + [19, 2])
+    uf.union_many(np.argwhere(np.ones((5, 5), dtype = bool)) + [30, 2])
+    uf.union_many(np.array([[10, 10], [10, 11]]))
+    uf.update_arr()
+
+
+@pytest.mark.parametrize("edit", list(edits(None)))
+@pytest.mark.parametrize("engine", ENGINES)
+def test_undo_redo(engine, edit):
+    uf = make(engine, undo_budget = 1 << 20)
+    draw_groups(uf)
+    before = state(uf)
+    edits(uf)[edit]()
+    uf.update_arr()
+    after = state(uf)
+    assert uf.undo()
+    assert_same(state(uf), before)
+    assert uf.redo()
+    assert_same(state(uf), after)
+    assert uf.undo()
+    assert_same(state(uf), before)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_undo_nothing(engine):
+    uf = make(engine, undo_budget = 1 << 20)
+    assert not uf.undo()
+    assert not uf.redo()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_erase_splits_bar(engine):
+    uf = make(engine)
+    uf.union_many(np.array([[5, y] for y in range(30)]))
+    uf.erase_nodes(np.array([[5, 10]]))
+    assert uf.root_of((5, 0)) != uf.root_of((5, 29))
+    assert sizes(uf) == [10, 19]
+    assert sorted(uf.bbox.values()) == [[5, 0, 6, 10], [5, 11, 6, 30]]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_erase_ring_does_not_split(engine):
+    uf = make(engine)
+    ring = np.ones((10, 10), dtype = bool)
+    ring[1:-1, 1:-1] = False
+    uf.union_many(np.argwhere(ring) + 3)
+    uf.erase_nodes(np.array([[3, 7]]))
+    assert sizes(uf) == [35]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_erase_splits_plus_in_four(engine):
+    uf = make(engine)
+    plus = [[20, y] for y in range(5, 36)] + [[x, 20] for x in range(5, 36) if x != 20]
+    uf.union_many(np.array(plus))
+    kept = uf.root_of((20, 20))
+    uf.erase_nodes(np.array([[20, 20]]))
+    assert sizes(uf) == [15, 15, 15, 15]
+    assert len({uf.root_of(node) for node in ((20, 5), (20, 35), (5, 20), (35, 20))}) == 4
+    assert kept not in uf.bbox or uf.size[kept] == 15
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_erase_whole_group(engine):
+    uf = make(engine)
+    uf.union_many(np.array([[1, 1], [1, 2]]))
+    assert uf.erase_nodes(np.array([[1, 1], [1, 2], [40, 40]])) == 2
+    assert not uf.bbox
+    assert uf.root_of((1, 1)) is None
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_erase_splits_8_connected_import(engine):
+    uf = make(engine, size = 64)
+    mask = np.zeros((64, 64), dtype = bool)
+    mask[np.arange(1, 41), np.arange(1, 41)] = True # a diagonal line, one group only with 8-connectivity
+    labels, count = raster.label(mask, connectivity = 8)
+    assert count == 1
+    uf.load_labels(labels, connectivity = 8)
+    uf.erase_nodes([[25, 25]])
+    assert uf.root_of((10, 10)) != uf.root_of((30, 30))
+    assert uf.root_of((1, 1)) == uf.root_of((24, 24))
+    assert uf.root_of((26, 26)) == uf.root_of((40, 40))
+    assert sizes(uf) == [15, 24]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_delete_group_keeps_others(engine):
+    uf = make(engine)
+    draw_groups(uf)
+    others = uf.root_of((20, 20)), uf.root_of((10, 10))
+    uf.delete_group((3, 3))
+    uf.update_arr()
+    assert uf.root_of((3, 3)) is None
+    assert (uf.roots([1, 1, 7, 7]) < 0).all()
+    assert (uf.root_of((20, 20)), uf.root_of((10, 10))) == others
+
+
+@pytest.mark.parametrize("name", ["line", "rectangle", "triangle1", "triangle4", "pentagon", "star"])
+def test_templates_translate(name):
+    templates = ShapeTemplates()
+    first = templates.nodes(10, 20, 47, 40, name, 3, filled = True)
+    for dx, dy in ((1, 0), (0, 1), (-7, 13), (200, 301)):
+        np.testing.assert_array_equal(templates.nodes(10 + dx, 20 + dy, 47 + dx, 40 + dy, name, 3, filled = True), first + [dx, dy])
+    assert (templates.hits, templates.misses) == (4, 1)
+    np.testing.assert_array_equal(first, rasterize(create_vertices(0, 0, 37, 20, name), 3, True) + [10, 20])
+
+
+def test_templates_budget():
+    templates = ShapeTemplates(budget = 1)
+    templates.nodes(0, 0, 30, 30, "rectangle")
+    templates.nodes(0, 0, 30, 30, "rectangle")
+    assert (templates.hits, templates.misses, templates.bytes) == (0, 2, 0)
+    templates = ShapeTemplates()
+    templates.nodes(0, 0, 30, 30, "rectangle")
+    templates.budget = 5 * templates.bytes // 2 # room for two templates of about this size
+    for size in (31, 32, 30):
+        templates.nodes(0, 0, size, size, "rectangle")
+    assert templates.bytes <= templates.budget
+    assert (templates.hits, templates.misses) == (0, 4) # 30 was evicted by 32
@@ -0,0 +1,2003 @@
+"""
+Union find engines that record which nodes of the drawing plane belong to which group, and the Shape
+rasterizer (with create_vertices and the ShapeTemplates cache) they take nodes from.  Only NumPy is needed, no window: every engine
+reports the boxes of the drawing that changed (take_updates) for the game to display, ArrayUnionFind paints them as palette
+slots (slots and colormap), TiledUnionFind renders them on demand (render_box).
+
+    UnionFind       dict of sets, the reference implementation
+    ArrayUnionFind  flat int32 arrays with union by size and path compression
+    TiledUnionFind  64x64 chunks that are only allocated where something is drawn, for large planes
+"""
+import collections
+import heapq
+import math
+import threading
+
+import numpy as np
+
+import journal
+import raster
+
+
+def make_palette(color_wheel):
+    """
+    Returns the color wheel as a (len(color_wheel) + 1, 3) uint8 array.
+    The extra last row is black and is used for empty pixels.
+    """
+    return np.array(tuple(color_wheel) + ((0, 0, 0),), dtype = np.uint8)
+
+def render(labels, palette, out = None):
+    """
+    Builds the RGB image of a label image in one fancy-indexing step.
+    labels: int array of group ids, negative for empty pixels
+    palette: output of make_palette
+    """
+    n = len(palette) - 1
+    index = np.remainder(labels, n)
+    index[labels < 0] = n
+    return np.take(palette, index, axis = 0, out = out)
+
+def normalize_brightness(arr, brightness):
+    """
+    Scales every pixel of an (..., 3) RGB array that is on to the same intensity (in place).
+    """
+    rgb = arr.astype(np.float32)
+    norm = np.sqrt(np.einsum("...k,...k->...", rgb, rgb))[..., None]
+    np.maximum(norm, 1, out = norm) # pixels that are off stay (0, 0, 0)
+    rgb *= brightness / norm
+    arr[...] = rgb
+    return arr
+
+def box_of(indices, C):
+    """Returns the [x0, y0, x1, y1] bounding box of flat node indices x * C + y."""
+    xs, ys = np.divmod(indices, C)
+    return [int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1]
+
+def join(a, b):
+    """Returns the bounding box of boxes a and b."""
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+def sum_nodes(indices, C):
+    """Returns [sum of x, sum of y] of flat node indices x * C + y."""
+    xs, ys = np.divmod(np.asarray(indices, dtype = np.int64), C)
+    return [int(xs.sum()), int(ys.sum())]
+
+def add_sums(a, b, sign):
+    """Returns a + sign * b for [sum of x, sum of y] pairs."""
+    return [a[0] + sign * b[0], a[1] + sign * b[1]]
+
+def labelled_groups(labels):
+    """
+    Splits a label image (0 for empty pixels and 1 .. count for the groups, see raster.label) into groups.
+    Returns (x, y, starts, sizes, boxes, sums): the labelled pixels ordered by label (row major within a label),
+    the index of the first pixel of every label in x and y, and per label the number of pixels,
+    the [x0, y0, x1, y1] bounding box and [sum of x, sum of y] as (count, 4) and (count, 2) arrays.
+    """
+    flat = np.flatnonzero(labels)
+    group = labels.ravel()[flat]
+    order = np.argsort(group, kind = "stable")
+    group = group[order]
+    x, y = np.divmod(flat[order], labels.shape[1])
+    starts = np.flatnonzero(np.concatenate(([True], group[1:] != group[:-1]))) if len(group) else np.zeros(0, dtype = np.intp)
+    sizes = np.diff(np.append(starts, len(group)))
+    if not len(starts):
+        return x, y, starts, sizes, np.zeros((0, 4), dtype = np.int64), np.zeros((0, 2), dtype = np.int64)
+    boxes = np.stack([np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts),
+                      np.maximum.reduceat(x, starts) + 1, np.maximum.reduceat(y, starts) + 1], axis = 1)
+    sums = np.stack([np.add.reduceat(x.astype(np.int64), starts), np.add.reduceat(y.astype(np.int64), starts)], axis = 1)
+    return x, y, starts, sizes, boxes, sums
+
+def find_splits(uf, root, near, anchor = None):
+    """
+    Returns the pieces that broke off root's group after nodes inside box near [x0, y0, x1, y1] were erased from it,
+    each as sorted flat node indices x * C + y, without labelling more of the group than needed.
+    Every piece of the group must touch near (near includes the neighbors of the erased nodes).  The group is
+    labelled inside a window around near that doubles, within the group's bounding box, until the pieces that
+    touch near are all one piece (nothing broke off) or at most one of them reaches a side of the window the
+    group continues past.  That piece keeps the root (the largest piece when none does) and the others,
+    which are complete inside the window, break off.  anchor (a flat node index) must stay in the piece that
+    keeps the root, the window grows until that is possible.  Pieces are connected the way uf's groups are
+    (uf.connectivity, 4 or 8), so an 8-connected group only splits where no corner joins it either.
+    """
+    gx0, gy0, gx1, gy1 = uf.bbox[root]
+    x0, y0, x1, y1 = near = [max(near[0], gx0), max(near[1], gy0), min(near[2], gx1), min(near[3], gy1)]
+    while True:
+        labels, count = raster.label(uf.roots([x0, y0, x1, y1]) == root, connectivity = uf.connectivity)
+        inner = labels[near[0] - x0:near[2] - x0, near[1] - y0:near[3] - y0]
+        pieces = raster.unique_ints(inner[inner > 0], count + 1)
+        if len(pieces) < 2:
+            return []
+        sides = [side for side, open_ in ((labels[0], x0 > gx0), (labels[-1], x1 < gx1),
+                                          (labels[:, 0], y0 > gy0), (labels[:, -1], y1 < gy1)) if open_]
+        reach = pieces[np.isin(pieces, np.concatenate(sides))] if sides else pieces[:0]
+        keep = reach[0] if len(reach) else pieces[np.argmax(np.bincount(labels.ravel(), minlength = count + 1)[pieces])]
+        if anchor is not None:
+            ax, ay = divmod(anchor, uf.C)
+            if x0 <= ax < x1 and y0 <= ay < y1:
+                keep = labels[ax - x0, ay - y0] if not len(reach) or labels[ax - x0, ay - y0] == keep else 0
+        if len(reach) <= 1 and keep:
+            break
+        w, h = x1 - x0, y1 - y0
+        x0, y0, x1, y1 = max(gx0, x0 - w), max(gy0, y0 - h), min(gx1, x1 + w), min(gy1, y1 + h)
+
+    flat = np.flatnonzero(np.isin(labels, pieces[pieces != keep]))
+    xs, ys = np.divmod(flat, y1 - y0)
+    indices = (xs + x0) * uf.C + ys + y0
+    return [indices[i] for _, i in journal.by_root(labels.ravel()[flat])]
+
+def hit_groups(uf, x, y, radius = 0):
+    """
+    Returns a node (x, y) of every group with a node within radius of (x, y), nearest group first, for an eraser brush.
+    Only the box around the brush is looked up, in the label raster of the engine (uf.roots).
+    """
+    x0, y0, x1, y1 = max(0, x - radius), max(0, y - radius), min(uf.R, x + radius + 1), min(uf.C, y + radius + 1)
+    if x0 >= x1 or y0 >= y1:
+        return []
+    roots = uf.roots([x0, y0, x1, y1])
+    dx, dy = np.ogrid[x0 - x:x1 - x, y0 - y:y1 - y]
+    dist = dx * dx + dy * dy
+    xs, ys = np.nonzero((roots >= 0) & (dist <= radius * radius))
+    order = np.argsort(dist[xs, ys], kind = "stable")
+    xs, ys = xs[order], ys[order]
+    _, first = np.unique(roots[xs, ys], return_index = True)
+    return [(int(xs[i]) + x0, int(ys[i]) + y0) for i in np.sort(first)]
+
+def shrink_box(uf, root, box, band = 64):
+    """
+    Returns box [x0, y0, x1, y1] shrunk until every side touches a node of root's group, after nodes were erased
+    from it (the group must not be empty).  The sides are scanned inwards in strips of 1, 2, 4 ... band rows or columns.
+    """
+    x0, y0, x1, y1 = box
+    def hits(a, b, axis):
+        """Whether the group has a node in each row (axis 1) or column (axis 0) from a to b of the box."""
+        strip = [a, y0, b, y1] if axis == 1 else [x0, a, x1, b]
+        return (uf.roots(strip) == root).any(axis = axis)
+    for axis in (1, 0):
+        lo, hi = (x0, x1) if axis == 1 else (y0, y1)
+        width = 1
+        while True:
+            hit = hits(lo, min(lo + width, hi), axis)
+            if hit.any():
+                lo += int(np.argmax(hit))
+                break
+            lo, width = lo + width, min(2 * width, band)
+        width = 1
+        while True:
+            hit = hits(max(hi - width, lo), hi, axis)
+            if hit.any():
+                hi -= int(np.argmax(hit[::-1]))
+                break
+            hi, width = hi - width, min(2 * width, band)
+        if axis == 1:
+            x0, x1 = lo, hi
+        else:
+            y0, y1 = lo, hi
+    return [x0, y0, x1, y1]
+
+def plane_indices(nodes, R, C, touching = False):
+    """
+    Returns (indices, near): the sorted unique flat indices x * C + y of the nodes (a Shape, a raster.Mask or an
+    N x 2 array of (x, y)) that lie on an R x C plane and, when touching, the flat indices of the nodes on the plane
+    that are 4-directionally adjacent to them (None otherwise, and neighbors may repeat or be nodes themselves).
+    A Mask is never expanded into (x, y) pairs and only the ring its dilation adds is returned as neighbors.
+    """
+    if isinstance(nodes, Shape):
+        nodes = nodes.region()
+    plane = [0, 0, R, C]
+    if isinstance(nodes, raster.Mask):
+        near = (nodes.dilate() - nodes).crop(plane).indices(C) if touching else None
+        return nodes.crop(plane).indices(C), near
+    x, y = np.asarray(nodes, dtype = np.intp).reshape(-1, 2).T
+    on = (0 <= x) & (x < R) & (0 <= y) & (y < C)
+    x, y = x[on], y[on]
+    near = None
+    if touching:
+        near = []
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            nx, ny = x + dx, y + dy
+            inside = (0 <= nx) & (nx < R) & (0 <= ny) & (ny < C)
+            near.append(nx[inside] * C + ny[inside])
+        near = np.concatenate(near)
+    return raster.unique_ints(x * C + y, R * C), near
+
+class UnionFind():
+    """
+    Non-standard implementation of union find.
+    Each shape's nodes are connected like a network.
+    When shapes overlap, their two networks merge together into a larger group (network) of nodes.
+    
+    Serves a second function to keep an RGB array of the drawing (arr)
+    where shapes of the same color belong to the same group.
+    
+    params:
+        surface_shape (num_rows, num_cols) of the drawing plane
+        brightness int [0, 255] controls how bright the shapes are
+        color_wheel tuple of (R, G, B) tuples where R, G, B are integers [0, 255] 
+    """
+    def __init__(self, surface_shape, brightness, color_wheel):
+        self.group_id = 0
+        self.group = {}
+        self.id = {}
+        self.connectivity = 4 # how the nodes of a group touch, see load_labels
+        
+        self.colors = color_wheel
+        self.R, self.C = surface_shape
+        self.arr = np.zeros((self.R, self.C, 3), dtype = np.uint8) # row, column, RGB
+        self.brightness = brightness
+        self.updated = [] # [x0, y0, x1, y1] boxes of arr that changed since the last take_updates
+        
+    def reset(self):
+        """Erases every group in place."""
+        self.group_id = 0
+        self.group.clear()
+        self.id.clear()
+        self.arr.fill(0)
+        self.update_surface()
+        
+    def load_labels(self, labels, connectivity = 4):
+        """
+        Replaces the drawing with one group per label of a label image (see raster.label), labels[0][0] at node (0, 0).
+        connectivity: 4 or 8, the connectivity the image was labelled with
+        """
+        self.reset()
+        self.connectivity = connectivity
+        x, y = np.nonzero(labels)
+        for node, group in zip(zip(x.tolist(), y.tolist()), (labels[x, y] - 1).tolist()):
+            self.id[node] = group
+            self.group.setdefault(group, set()).add(node)
+        self.group_id = len(self.group)
+        self.update_arr()
+        
+    def delete_group(self, node):
+        nodes = self.group.pop(self.id[node])
+        for node in nodes:
+            del self.id[node]
+        x, y = np.array(list(nodes)).T
+        self.arr[x, y] = 0
+        self.updated.append([int(x.min()), int(y.min()), int(x.max()) + 1, int(y.max()) + 1])
+
+    def roots(self, box):
+        """Returns the group id of every node inside box [x0, y0, x1, y1], -1 for empty nodes."""
+        x0, y0, x1, y1 = box
+        out = np.full((x1 - x0, y1 - y0), -1, dtype = np.int32)
+        for x in range(x0, x1):
+            for y in range(y0, y1):
+                out[x - x0, y - y0] = self.id.get((x, y), -1)
+        return out
+        
+    def update_arr(self, node_id = None):
+        """
+        Updates the array for all nodes affected by most recent union.
+        """
+        for node_id in (self.group if node_id is None else [node_id]):
+            x, y = np.array(list(self.group[node_id])).T
+            self.arr[x, y] = self.colors[node_id % len(self.colors)]
+        self.update_surface()
+    
+    def update_surface(self):
+        """
+        Marks the whole array as changed, see take_updates.
+        """
+        self.updated = [[0, 0, self.R, self.C]]
+    
+    def take_updates(self):
+        """Returns the [x0, y0, x1, y1] boxes of arr that changed since the last call."""
+        updated, self.updated = self.updated, []
+        return updated
+    
+    def normalize_brightness(self):
+        """
+        Converts all pixels that are on to the same intensity.
+        """
+        normalize_brightness(self.arr, self.brightness)
+        
+    def union(self, a, b):
+        """Union nodes a and b"""
+        A, B = a in self.id, b in self.id
+        if A and B and self.id[a] != self.id[b]:
+            self.merge(a, b)
+        elif A or B:
+            self.add(a, b)
+        else:
+            self.create(a, b)
+        return self.id[a] if a in self.id else self.id[b]
+    
+    def occupied(self, box = None):
+        """Returns a boolean bitmap of the nodes inside box [x0, y0, x1, y1] (default: all) that belong to a group."""
+        x0, y0, x1, y1 = box or (0, 0, self.R, self.C)
+        bitmap = np.zeros((x1 - x0, y1 - y0), dtype = bool)
+        if self.id:
+            x, y = np.array(list(self.id)).T - np.array([[x0], [y0]])
+            on = (0 <= x) & (x < x1 - x0) & (0 <= y) & (y < y1 - y0)
+            bitmap[x[on], y[on]] = True
+        return bitmap
+
+    def union_many(self, nodes, touching = False):
+        """
+        Unions every node of a Shape (or a raster.Mask or an N x 2 array of (x, y) nodes) into one group.
+        touching: also merge groups that are 4-directionally adjacent to the nodes
+        Nodes off the drawing plane are ignored.  Returns the group id or None if no nodes were added.
+        """
+        if isinstance(nodes, (Shape, raster.Mask)):
+            nodes = nodes.coords()
+        nodes = [(x, y) for x, y in np.asarray(nodes).tolist() if 0 <= x < self.R and 0 <= y < self.C]
+        for node in nodes:
+            self.union(nodes[0], node)
+            if touching:
+                for neighbor in Shape.get_neighbors(*node):
+                    if neighbor in self.id:
+                        self.union(node, neighbor)
+        return self.id[nodes[0]] if nodes else None
+
+    def merge(self, a, b):
+        """Nodes a and b both belong to a group, merge the smaller group with the larger group."""
+        obs, targ = sorted((self.id[a], self.id[b]), key = lambda i: len(self.group[i]))
+        for node in self.group[obs]:
+            self.id[node] = targ
+        self.group[targ] |= self.group[obs]
+        del self.group[obs]
+    
+    def add(self, a, b):
+        """Node a or node b does not have a group.  Add the new node to the existing group."""
+        a, b = (a, b) if a in self.id else (b, a)
+        targ = self.id[a]
+        self.id[b] = targ
+        self.group[targ] |= {b}
+    
+    def create(self, a, b):
+        """Neither node a nor b belong to a group.  Create a new group {a, b}."""
+        self.group[self.group_id] = {a, b}
+        self.id[a] = self.id[b] = self.group_id
+        self.group_id += 1
+
+
+class NodeIds():
+    """
+    Read only view of ArrayUnionFind or TiledUnionFind that behaves like UnionFind.id
+    so that `node in uf.id` and `uf.id[node]` work for every engine.
+    """
+    def __init__(self, uf):
+        self.uf = uf
+
+    def __contains__(self, node):
+        return self.uf.group_of(node) is not None
+
+    def __getitem__(self, node):
+        group = self.uf.group_of(node)
+        if group is None:
+            raise KeyError(node)
+        return group
+
+    def __len__(self):
+        return self.uf.node_count()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        x, y = self.uf.nodes().T
+        return list(zip(x.tolist(), y.tolist()))
+
+
+GroupStats = collections.namedtuple("GroupStats", ["id", "size", "bbox", "centroid"]) # ids are given in creation order
+
+class Groups():
+    """
+    Read only statistics of the groups of ArrayUnionFind or TiledUnionFind, answered from the aggregates
+    the engine keeps for every root (size, bbox, sums of the node coordinates and the group id):
+    len(uf.groups) counts the groups, largest() and at(node) return GroupStats.
+    The largest group is the top of a max-heap of (size, root). Roots whose group changed size are only
+    collected by grew and pushed when largest() is asked, so a run of unions costs one push per group
+    instead of one per union; entries whose group changed size or disappeared since are discarded when they reach the top.
+    """
+    def __init__(self, uf):
+        self.uf = uf
+        self.heap = [] # (-size, root)
+        self.changed = set() # roots grown since the last largest()
+
+    def __len__(self):
+        return len(self.uf.bbox)
+
+    def grew(self, root):
+        """Called by the engine whenever the size of the group rooted at root changed."""
+        self.changed.add(root)
+
+    def rebuild(self):
+        """Rebuilds the heap from the current roots, after the engine replaced its groups in bulk."""
+        self.changed.clear()
+        self.heap = [(-int(self.uf.size[root]), root) for root in self.uf.bbox]
+        heapq.heapify(self.heap)
+
+    def largest(self):
+        """Returns the GroupStats of the largest group or None if there are no groups."""
+        uf = self.uf
+        if len(self.heap) + len(self.changed) > 2 * len(uf.bbox) + 64:
+            self.rebuild() # most entries are stale
+        heap = self.heap
+        for root in self.changed:
+            if root in uf.bbox:
+                heapq.heappush(heap, (-uf.size.item(root), root))
+        self.changed.clear()
+        while heap and (heap[0][1] not in uf.bbox or -heap[0][0] != uf.size[heap[0][1]]):
+            heapq.heappop(heap)
+        return self.stats(heap[0][1]) if heap else None
+
+    def at(self, node):
+        """Returns the GroupStats of the group under node (x, y) or None if it is empty."""
+        root = self.uf.root_of(node)
+        return None if root is None else self.stats(root)
+
+    def stats(self, root):
+        size = int(self.uf.size[root])
+        sum_x, sum_y = self.uf.sums[root]
+        return GroupStats(int(self.uf.gid[root]), size, tuple(self.uf.bbox[root]), (sum_x / size, sum_y / size))
+
+
+class ArrayUnionFind():
+    """
+    Flat implementation of union find with the same public interface as UnionFind.
+    Each pixel (x, y) of the drawing plane is node x * C + y in three int32 arrays:
+        parent: parent node, -1 for empty pixels and itself for the root of a group
+        size:   number of nodes in the group (only meaningful at a root)
+        gid:    group id used to pick the group's color (only meaningful at a root)
+
+    Groups are merged by size (the smaller tree hangs under the larger root and takes its group id)
+    and find compresses paths, so a merge costs O(1) instead of relabelling every node of the smaller group.
+
+    Every root also keeps the sums of its nodes' coordinates (for the centroid), see Groups for the statistics.
+
+    The drawing is painted as palette slots, a byte per pixel (slots), and colormap holds the color of every slot.
+    A group gets a slot of its own while there are free ones, so when it is merged its slot is pointed at the slot of
+    the larger group (a union find over the 256 slots) and no pixel is repainted.  Groups that find no free slot share
+    the slot of their color and are repainted when merged, like every group used to be.
+
+    Every union, union_many, delete_group, erase_nodes and reset is recorded in journal so it can be undone.
+    Compressed paths make parent pointers useless for splitting a merge again, so a merge records
+    the nodes of the smaller group (run length encoded) and undo points all of them back at its old root.
+
+    A single union(a, b) keeps all of that up to date (bbox, sums, palette slot, gid, journal) with scalar numpy
+    reads and writes, so per pair it is slower than UnionFind's dicts (about half the ops/s of scaling.py's
+    workloads at 256 x 256), it only wins once the groups UnionFind relabels grow large.  Add many nodes with
+    union_many, which does the same work once per group in vectorized passes.
+
+    params:
+        surface_shape (num_rows, num_cols) of the drawing plane
+        brightness int [0, 255] controls how bright the shapes are
+        color_wheel tuple of (R, G, B) tuples where R, G, B are integers [0, 255]
+        undo_budget bytes of undo history to keep, 0 disables undo
+    """
+    def __init__(self, surface_shape, brightness, color_wheel, undo_budget = 0):
+        self.group_id = 0
+        self.colors = color_wheel
+        self.R, self.C = surface_shape
+        self.parent = np.full(self.R * self.C, -1, dtype = np.int32)
+        self.size = np.zeros(self.R * self.C, dtype = np.int32)
+        self.gid = np.empty(self.R * self.C, dtype = np.int32) # only read at roots, left uninitialized for a fast start
+        self.bbox = {} # root: [x0, y0, x1, y1] bounding box of the group (x1 and y1 exclusive)
+        self.sums = {} # root: [sum of x, sum of y] over the nodes of the group
+        self.connectivity = 4 # how the nodes of a group touch (4 or 8), groups split along it, see find_splits
+        self.id = NodeIds(self)
+        self.groups = Groups(self)
+        self.journal = journal.Journal(undo_budget)
+
+        self.palette = make_palette(self.colors)
+        self.brightness = brightness
+        self.slots = np.zeros((self.R, self.C), dtype = np.uint8) # palette slot of each pixel, 0 if empty
+        self.slot = np.zeros(self.R * self.C, dtype = np.uint8)   # palette slot of the group (only meaningful at a root)
+        self.slot_parent = np.arange(256, dtype = np.int32)     # slot a merged group's slot points at, itself for a root slot
+        self.slot_color = np.full(256, len(self.colors), dtype = np.int32) # palette row of every root slot, black if unused
+        self.slot_color[1:len(self.colors) + 1] = np.arange(len(self.colors)) # the shared slots of the colors
+        self.colormap = np.zeros((256, 3), dtype = np.uint8)    # RGB color of every slot
+        self.colormap_version = 0 # bumped whenever colormap changes
+        self.clear_slots()
+
+        # Regions that must be repainted by the next update_arr and regions of slots repainted since
+        # the last call to take_updates, all as [x0, y0, x1, y1] boxes
+        self.touched = [self.R, self.C, 0, 0] # nodes added since the last update_arr
+        self.dirty = []                      # groups whose pixels changed color or were erased
+        self.updated = []                    # the blank canvas needs no upload
+        self.recolored = []                  # groups whose pixels changed color through colormap only
+
+    max_dirty = 16 # more pending boxes than this are repainted as one bounding box
+
+    def reset(self):
+        """Erases every group in place, only the area the groups covered is cleared and repainted black."""
+        self.journal.begin()
+        if self.journal.recording:
+            nodes = np.flatnonzero(self.parent >= 0)
+            for root, i in journal.by_root(self.find_many(nodes)):
+                self.journal.record("delete", root, journal.encode(nodes[i]), int(self.size[root]), int(self.gid[root]), self.bbox[root])
+            self.journal.record("counter", self.group_id)
+        boxes = list(self.bbox.values())
+        if len(boxes) > self.max_dirty:
+            boxes = [[min(b[0] for b in boxes), min(b[1] for b in boxes),
+                      max(b[2] for b in boxes), max(b[3] for b in boxes)]]
+        for x0, y0, x1, y1 in boxes:
+            self.parent.reshape(self.R, self.C)[x0:x1, y0:y1] = -1
+            self.slots[x0:x1, y0:y1] = 0
+        self.bbox.clear()
+        self.sums.clear()
+        self.clear_slots()
+        self.group_id = 0
+        self.touched = [self.R, self.C, 0, 0]
+        self.updated.extend(boxes)
+        self.journal.end()
+
+    def index(self, node):
+        """Returns the flat index of node (x, y) or None if the node is off the drawing plane."""
+        x, y = node
+        x, y = int(x), int(y)
+        if 0 <= x < self.R and 0 <= y < self.C:
+            return x * self.C + y
+        return None
+
+    def extend_box(self, box, i):
+        """Grows box [x0, y0, x1, y1] in place to include node index i."""
+        x, y = divmod(i, self.C)
+        if x < box[0]: box[0] = x
+        if y < box[1]: box[1] = y
+        if x >= box[2]: box[2] = x + 1
+        if y >= box[3]: box[3] = y + 1
+
+    def occupied(self, box = None):
+        """Returns a boolean bitmap of the nodes inside box [x0, y0, x1, y1] (default: all) that belong to a group."""
+        x0, y0, x1, y1 = box or (0, 0, self.R, self.C)
+        return self.parent.reshape(self.R, self.C)[x0:x1, y0:y1] >= 0
+
+    def root_of(self, node):
+        """Returns the root of node (x, y) or None if it is empty or off the drawing plane."""
+        i = self.index(node)
+        if i is None or self.parent[i] < 0:
+            return None
+        return int(self.find(i))
+
+    def group_of(self, node):
+        """Returns the group id of node (x, y) or None if it is empty or off the drawing plane."""
+        root = self.root_of(node)
+        return None if root is None else int(self.gid[root])
+
+    def node_count(self):
+        return int(sum(self.size[root] for root in self.bbox))
+
+    def nodes(self):
+        """Returns every occupied node as an N x 2 array of (x, y)."""
+        return np.argwhere(self.parent.reshape(self.R, self.C) >= 0)
+
+    def find(self, i):
+        """
+        Returns the root of node index i, pointing every node on the path directly at the root.
+        Walks the path with Python ints (parent.item), numpy scalars cost more than the lookups themselves.
+        """
+        parent = self.parent
+        root, up = i, parent.item(i)
+        while up != root:
+            root, up = up, parent.item(up)
+        up = parent.item(i)
+        while up != root:
+            parent[i] = root
+            i, up = up, parent.item(up)
+        return root
+
+    def find_many(self, nodes):
+        """Vectorized find for an array of occupied node indices, compresses their paths."""
+        parents = roots = self.parent[nodes]
+        while True:
+            grand_parents = self.parent[roots]
+            if np.array_equal(grand_parents, roots):
+                break
+            roots = grand_parents
+        if roots is not parents:
+            self.parent[nodes] = roots
+        return roots
+
+    def find_region(self, box):
+        """
+        Vectorized find for every node inside box [x0, y0, x1, y1].
+        Returns (boolean mask of the occupied nodes in the box, their roots) and compresses their paths.
+        """
+        x0, y0, x1, y1 = box
+        block = self.parent.reshape(self.R, self.C)[x0:x1, y0:y1]
+        occupied = block >= 0
+        parents = roots = block[occupied]
+        while True:
+            grand_parents = self.parent[roots]
+            if np.array_equal(grand_parents, roots):
+                break
+            roots = grand_parents
+        if roots is not parents:
+            block[occupied] = roots
+        return occupied, roots
+
+    def group_runs(self, root, box, occupied, roots):
+        """Returns the encoded indices of the nodes of root's group, given find_region(box)."""
+        xs, ys = np.nonzero(occupied)
+        on = roots == root
+        return journal.encode((xs[on] + box[0]) * self.C + ys[on] + box[1])
+
+    def group_mask(self, root, box):
+        """
+        Returns the boolean mask of the nodes of root's group inside box [x0, y0, x1, y1].  Nodes that point straight
+        at root (most of them once paths are compressed) are found in one comparison, only the others are looked up.
+        """
+        x0, y0, x1, y1 = box
+        block = self.parent.reshape(self.R, self.C)[x0:x1, y0:y1]
+        mask = block == root
+        rest = np.flatnonzero((block >= 0) & ~mask)
+        if len(rest):
+            xs, ys = np.divmod(rest, y1 - y0)
+            mask.flat[rest[self.find_many((xs + x0) * self.C + ys + y0) == root]] = True
+        return mask
+
+    def delete_group(self, node):
+        root = self.find(self.index(node))
+        x0, y0, x1, y1 = box = self.bbox.pop(root)
+        del self.sums[root]
+        erase = self.group_mask(root, box)
+        self.journal.begin()
+        if self.journal.recording:
+            self.journal.record("delete", int(root), journal.encode_mask(erase, box, self.C), int(self.size[root]), int(self.gid[root]), box)
+        self.journal.end()
+        np.copyto(self.parent.reshape(self.R, self.C)[x0:x1, y0:y1], -1, where = erase)
+        self.size[root], self.gid[root] = 0, -1 # only meaningful at roots
+        # only the group's pixels change, they are cleared here instead of repainting the whole box in update_arr
+        np.copyto(self.slots[x0:x1, y0:y1], 0, where = erase)
+        self.updated.append(box)
+        self.update_arr()
+
+    def roots(self, box):
+        """Returns the root of every node inside box [x0, y0, x1, y1], -1 for empty nodes."""
+        occupied, roots = self.find_region(box)
+        out = np.full(occupied.shape, -1, dtype = np.int32)
+        out[occupied] = roots
+        return out
+
+    def erase_nodes(self, nodes):
+        """
+        Erases nodes (a Shape, a raster.Mask or an N x 2 array of (x, y)) from their groups.  A group the erased nodes
+        cut apart keeps its root and color for one piece and every other piece becomes a new group, see find_splits.
+        Empty nodes and nodes off the drawing plane are ignored.  Returns the number of erased nodes.
+        """
+        nodes, _ = plane_indices(nodes, self.R, self.C)
+        nodes = nodes[self.parent[nodes] >= 0]
+        if not len(nodes):
+            return 0
+        self.journal.begin()
+        for root, i in journal.by_root(self.find_many(nodes)):
+            erased = nodes[i]
+            if len(erased) == self.size[root]:
+                box = self.bbox[root]
+                if self.journal.recording:
+                    self.journal.record("delete", root, journal.encode(erased), int(self.size[root]), int(self.gid[root]), box)
+                self.parent[erased] = -1
+                del self.bbox[root], self.sums[root]
+                self.dirty.append(box)
+                continue
+            if erased[min(np.searchsorted(erased, root), len(erased) - 1)] == root:
+                root = self.reroot(root, erased)
+            self.apply(("unstamp", root, journal.encode(erased)))
+            x0, y0, x1, y1 = box_of(erased, self.C)
+            pieces = find_splits(self, root, [x0 - 1, y0 - 1, x1 + 1, y1 + 1], anchor = root)
+            for piece in pieces:
+                self.apply(("split", root, journal.encode(piece), int(piece[0]), self.group_id))
+            box = self.bbox[root]
+            if pieces or not (box[0] < x0 and box[1] < y0 and x1 < box[2] and y1 < box[3]):
+                self.apply(("bbox", root, box, shrink_box(self, root, box)))
+        self.journal.end()
+        self.update_arr()
+        return len(nodes)
+
+    def reroot(self, root, erased):
+        """Moves the root of a group to a node that is not about to be erased and returns the new root."""
+        box = self.bbox[root]
+        occupied, roots = self.find_region(box)
+        xs, ys = np.nonzero(occupied)
+        on = roots == root
+        members = (xs[on] + box[0]) * self.C + ys[on] + box[1]
+        new = int(members[~np.isin(members, erased)][0])
+        self.apply(("reroot", root, new, list(box)))
+        return new
+
+    def apply(self, step):
+        """Records a journal step and applies it, for edits that are replayed exactly as they are made."""
+        if self.journal.recording:
+            self.journal.record(*step)
+        self.replay(step, forward = True)
+
+    def update_arr(self, node_id = None):
+        """
+        Updates the array for all nodes affected by most recent union, merge or delete_group,
+        only those regions are repainted and reported by take_updates.
+        node_id is accepted for compatibility with UnionFind, every pending region is repainted.
+        """
+        boxes = self.dirty
+        if self.touched[0] < self.touched[2]:
+            boxes.append(self.touched)
+        if len(boxes) > self.max_dirty:
+            boxes = [[min(b[0] for b in boxes), min(b[1] for b in boxes),
+                      max(b[2] for b in boxes), max(b[3] for b in boxes)]]
+        for box in boxes:
+            x0, y0, x1, y1 = box
+            occupied, _ = self.find_region(box) # compressed, so every occupied node now points at its root
+            slots = self.slots[x0:x1, y0:y1]
+            np.take(self.slot, self.parent.reshape(self.R, self.C)[x0:x1, y0:y1], out = slots)
+            slots[~occupied] = 0
+        if self.remapped:
+            self.recolor()
+        self.updated.extend(boxes)
+        self.touched = [self.R, self.C, 0, 0]
+        self.dirty = []
+
+    def update_surface(self):
+        """
+        Marks the whole array as changed, see take_updates.
+        """
+        self.updated.append([0, 0, self.R, self.C])
+
+    def invalidate(self, box = None):
+        """Marks box [x0, y0, x1, y1] (default: the whole canvas) to be repainted by the next update_arr."""
+        self.dirty.append(list(box) if box else [0, 0, self.R, self.C])
+
+    def take_updates(self):
+        """Returns the [x0, y0, x1, y1] boxes of slots that changed since the last call."""
+        updated, self.updated = self.updated, []
+        return updated
+
+    def take_recolored(self):
+        """
+        Returns the [x0, y0, x1, y1] boxes whose pixels changed color since the last call only because colormap changed
+        (merged groups), their slots are the same.
+        """
+        recolored, self.recolored = self.recolored, []
+        return recolored
+
+    def clear_slots(self):
+        """Frees every slot of its own, for a drawing without groups."""
+        n = len(self.colors)
+        self.slot_parent[n + 1:] = np.arange(n + 1, 256)
+        self.slot_color[n + 1:] = n
+        self.free_slots = list(range(255, n, -1))
+        self.given = 0 # slots given since the last collect_slots
+        self.remapped = True
+
+    def give_slot(self, root):
+        """
+        Gives the group of root a palette slot: one of its own while there are free slots, so merging it only
+        points its slot elsewhere (see merge), otherwise the slot its color shares with other groups.
+        """
+        n = len(self.colors)
+        if not self.free_slots and self.given >= max(255 - n, len(self.bbox)):
+            self.collect_slots()
+        self.given += 1
+        color = self.gid.item(root) % n
+        if self.free_slots:
+            s = self.free_slots.pop()
+            self.slot_color[s] = color
+            self.remapped = True
+        else:
+            s = 1 + color
+        self.slot[root] = s
+
+    def collect_slots(self):
+        """Frees the slots of their own that no pixel and no group uses anymore, one pass over slots."""
+        n = len(self.colors)
+        used = np.bincount(self.slots.ravel(), minlength = 256) > 0
+        used[self.slot[list(self.bbox)]] = True
+        while True: # the slots that used slots point at give them their color
+            parents = self.slot_parent[used]
+            if used[parents].all():
+                break
+            used[parents] = True
+        free = np.flatnonzero(~used[n + 1:]) + n + 1
+        self.slot_parent[free] = free
+        self.slot_color[free] = n
+        self.free_slots = free[::-1].tolist()
+        self.given = 0
+
+    def recolor(self):
+        """Points every slot at its root slot and rebuilds colormap, 256 entries instead of every pixel."""
+        roots = self.slot_parent
+        while True:
+            up = self.slot_parent[roots]
+            if np.array_equal(up, roots):
+                break
+            roots = up
+        self.slot_parent[:] = roots
+        self.colormap = self.palette[self.slot_color[roots]]
+        self.colormap_version += 1
+        self.remapped = False
+
+    def render_box(self, box, step = 1):
+        """Returns the RGB pixels of box [x0, y0, x1, y1], every step-th node along both axes."""
+        x0, y0, x1, y1 = box
+        return self.colormap[self.slots[x0:x1:step, y0:y1:step]]
+
+    def label_box(self, box, step = 1):
+        """Returns the group id of every step-th node of box [x0, y0, x1, y1], -1 for empty nodes."""
+        occupied, roots = self.find_region(box)
+        labels = np.full(occupied.shape, -1, dtype = np.int32)
+        labels[occupied] = self.gid[roots]
+        return labels[::step, ::step]
+
+    def snapshot(self):
+        """Arrays that together fingerprint the drawing, see recording.digest."""
+        return [self.colormap[self.slots]] # the RGB image of the drawing
+
+    def state(self):
+        """Returns (meta, arrays) that describe the drawing, see storage.save.  Only parent is stored densely."""
+        roots = np.array(list(self.bbox), dtype = np.int32)
+        meta = {"engine": "array", "shape": [self.R, self.C], "group_id": self.group_id, "connectivity": self.connectivity}
+        arrays = {"parent": self.parent, "roots": roots, "size": self.size[roots], "gid": self.gid[roots],
+                  "bbox": np.array(list(self.bbox.values()), dtype = np.int32).reshape(-1, 4),
+                  "sums": np.array([self.sums[root] for root in self.bbox], dtype = np.int64).reshape(-1, 2)}
+        return meta, arrays
+
+    def detach(self):
+        """Copies parent into memory when it is memory mapped from a saved drawing, so the file can be replaced."""
+        if isinstance(self.parent, np.memmap):
+            self.parent = np.array(self.parent)
+
+    def load_state(self, meta, arrays):
+        """Replaces the drawing with a saved state.  parent is used as given, so it may be memory mapped."""
+        if meta["engine"] != "array" or meta["shape"] != [self.R, self.C]:
+            raise ValueError(f"the drawing was saved from a {meta['shape'][0]}x{meta['shape'][1]} {meta['engine']} canvas")
+        self.reset()
+        roots = np.asarray(arrays["roots"])
+        self.parent = arrays["parent"]
+        self.size[roots] = arrays["size"]
+        self.gid[roots] = arrays["gid"]
+        self.group_id = meta["group_id"]
+        self.connectivity = meta.get("connectivity", 4) # saved before imports could be 8-connected
+        self.bbox = dict(zip(roots.tolist(), np.asarray(arrays["bbox"]).tolist()))
+        if "sums" in arrays:
+            self.sums = dict(zip(roots.tolist(), np.asarray(arrays["sums"]).tolist()))
+        else: # saved before the sums were kept
+            nodes = np.flatnonzero(self.parent >= 0)
+            self.sums = {root: sum_nodes(nodes[i], self.C) for root, i in journal.by_root(self.find_many(nodes))}
+        for root, box in self.bbox.items():
+            self.give_slot(root)
+            self.invalidate(box)
+            self.groups.grew(root)
+        self.update_arr()
+        self.journal.clear()
+
+    def load_labels(self, labels, connectivity = 4):
+        """
+        Replaces the drawing with one group per label of a label image (see raster.label), labels[0][0] at node (0, 0),
+        in a few vectorized passes instead of a union per pixel.  Groups are colored in label order.
+        connectivity: 4 or 8, the connectivity the image was labelled with, erasing splits the groups along it
+        """
+        if labels.shape[0] > self.R or labels.shape[1] > self.C:
+            raise ValueError(f"a {labels.shape[0]}x{labels.shape[1]} image does not fit on the {self.R}x{self.C} canvas")
+        self.reset()
+        self.connectivity = connectivity
+        x, y, starts, sizes, boxes, sums = labelled_groups(labels)
+        nodes = x * self.C + y
+        roots = nodes[starts]
+        self.parent[nodes] = np.repeat(roots, sizes)
+        self.size[roots] = sizes
+        self.gid[roots] = np.arange(len(roots))
+        self.group_id = len(roots)
+        self.bbox = dict(zip(roots.tolist(), boxes.tolist()))
+        self.sums = dict(zip(roots.tolist(), sums.tolist()))
+        for root in roots.tolist():
+            self.give_slot(root)
+        self.groups.rebuild()
+        self.invalidate([0, 0, labels.shape[0], labels.shape[1]])
+        self.update_arr()
+        self.journal.clear()
+
+    def normalize_brightness(self):
+        """
+        Converts all colors to the same intensity, in the palette instead of every pixel.
+        """
+        normalize_brightness(self.palette[:-1], self.brightness)
+        self.recolor()
+        self.recolored.append([0, 0, self.R, self.C])
+
+    def union(self, a, b):
+        """
+        Union nodes a and b.  Nodes that are off the drawing plane are ignored.
+        A single pair is the pen's hot path, so it is handled with Python ints and no array operations.
+        """
+        R, C = self.R, self.C
+        (ax, ay), (bx, by) = a, b
+        ax, ay, bx, by = int(ax), int(ay), int(bx), int(by)
+        i = ax * C + ay if 0 <= ax < R and 0 <= ay < C else None
+        j = bx * C + by if 0 <= bx < R and 0 <= by < C else None
+        if i is None or j is None:
+            if i is None and j is None:
+                return None
+            i = j = i if j is None else j
+        parent = self.parent
+        pi, pj = parent.item(i), parent.item(j)
+        if pi >= 0 and pj >= 0:
+            ri = self.find(i)
+            rj = ri if pi == pj else self.find(j)
+            if ri == rj: # nothing to change or journal
+                return self.gid.item(ri)
+            self.journal.begin()
+            self.merge(ri, rj)
+            self.journal.end()
+            return self.gid.item(self.find(ri))
+        self.journal.begin()
+        if pi >= 0 or pj >= 0:
+            root = self.add(i, j)
+        else:
+            root = self.create(i, j)
+        self.journal.end()
+        return self.gid.item(root)
+
+    def union_many(self, nodes, touching = False):
+        """
+        Unions every node of a Shape (or a raster.Mask or an N x 2 array of (x, y) nodes) into one group in a few
+        vectorized passes.  Every existing group the nodes overlap (or are 4-directionally adjacent to when touching
+        is True) is merged into the largest of them once, then the new nodes are stamped with its root.
+        Nodes off the drawing plane are ignored.  Returns the group id or None if no nodes were added.
+        """
+        nodes, near = plane_indices(nodes, self.R, self.C, touching)
+        if not len(nodes):
+            return None
+
+        # existing groups to merge, largest first
+        occupied = [nodes[self.parent[nodes] >= 0]]
+        if touching:
+            occupied.append(near[self.parent[near] >= 0])
+        roots = raster.unique_ints(self.find_many(np.concatenate(occupied)))
+        roots = roots[np.argsort(-self.size[roots], kind = "stable")]
+        new = nodes[self.parent[nodes] < 0]
+        self.journal.begin()
+        if not len(roots):
+            targ = int(new[0])
+            self.create(targ, targ)
+            new = new[1:]
+        else:
+            targ = int(roots[0])
+            for root in roots[1:]:
+                self.merge(int(root), targ)
+
+        # stamp the new nodes with the root of the group
+        if len(new):
+            if self.journal.recording:
+                self.journal.record("stamp", targ, journal.encode(new), list(self.bbox[targ]))
+            self.parent[new] = targ
+            self.size[targ] += len(new)
+            self.groups.grew(targ)
+            xs, ys = divmod(new, self.C)
+            sums = self.sums[targ]
+            sums[0] += int(xs.sum())
+            sums[1] += int(ys.sum())
+            box = [int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1]
+            for targ_box in (self.bbox[targ], self.touched):
+                targ_box[:] = [min(box[0], targ_box[0]), min(box[1], targ_box[1]),
+                               max(box[2], targ_box[2]), max(box[3], targ_box[3])]
+        self.journal.end()
+        return int(self.gid[targ])
+
+    def merge(self, a, b):
+        """
+        Roots a and b belong to different groups, hang the smaller tree under the larger root.
+        The smaller group takes the larger group's color, see recolor_merged.
+        """
+        obs, targ = (a, b) if self.size.item(a) <= self.size.item(b) else (b, a)
+        if self.journal.recording:
+            box = self.bbox[obs]
+            self.journal.record("merge", obs, self.group_runs(obs, box, *self.find_region(box)), targ,
+                                int(self.size[obs]), int(self.gid[obs]), box, list(self.bbox[targ]), self.sums[obs])
+        self.parent[obs] = targ
+        self.size[targ] += self.size[obs]
+        self.groups.grew(targ)
+        sums, targ_sums = self.sums.pop(obs), self.sums[targ]
+        self.sums[targ] = [sums[0] + targ_sums[0], sums[1] + targ_sums[1]]
+        box, targ_box = self.bbox.pop(obs), self.bbox[targ]
+        self.bbox[targ] = [min(box[0], targ_box[0]), min(box[1], targ_box[1]),
+                           max(box[2], targ_box[2]), max(box[3], targ_box[3])]
+        self.recolor_merged(obs, targ, box)
+
+    def recolor_merged(self, obs, targ, box):
+        """
+        Gives the pixels of group obs, merged into targ, targ's color: a slot of its own is pointed at targ's slot,
+        the pixels of a shared slot are repainted (within box) unless targ's color shares the same slot.
+        """
+        s = self.slot[obs]
+        if s > len(self.colors):
+            self.slot_parent[s] = self.slot[targ]
+            self.remapped = True
+            self.recolored.append(list(box))
+        elif s != self.slot[targ]:
+            self.dirty.append(list(box))
+
+    def add(self, a, b):
+        """Node a or node b does not have a group.  Add the new node to the existing group and return its root."""
+        a, b = (a, b) if self.parent.item(a) >= 0 else (b, a)
+        targ = self.find(a)
+        if self.journal.recording:
+            self.journal.record("stamp", targ, journal.encode([b]), list(self.bbox[targ]))
+        self.parent[b] = targ
+        self.size[targ] += 1
+        self.groups.grew(targ)
+        x, y = divmod(b, self.C)
+        sums = self.sums[targ]
+        sums[0] += x
+        sums[1] += y
+        self.extend_box(self.bbox[targ], b)
+        self.extend_box(self.touched, b)
+        return targ
+
+    def create(self, a, b):
+        """Neither node a nor b belong to a group.  Create a new group {a, b} rooted at a and return a."""
+        if self.journal.recording:
+            self.journal.record("create", a, journal.encode(sorted({a, b})), self.group_id)
+        self.parent[a] = self.parent[b] = a
+        self.size[a] = 1 if a == b else 2
+        self.gid[a] = self.group_id
+        self.group_id += 1
+        self.give_slot(a)
+        (ax, ay), (bx, by) = divmod(a, self.C), divmod(b, self.C)
+        self.sums[a] = [ax, ay] if a == b else [ax + bx, ay + by]
+        self.groups.grew(a)
+        self.bbox[a] = [min(ax, bx), min(ay, by), max(ax, bx) + 1, max(ay, by) + 1]
+        self.extend_box(self.touched, a)
+        self.extend_box(self.touched, b)
+        return a
+
+    def undo(self):
+        """Reverts the last operation in the journal and repaints it, returns False if there is nothing to undo."""
+        steps = self.journal.undo()
+        if steps is None:
+            return False
+        for step in reversed(steps):
+            self.replay(step, forward = False)
+        self.update_arr()
+        return True
+
+    def redo(self):
+        """Applies the last undone operation again, returns False if there is nothing to redo."""
+        steps = self.journal.redo()
+        if steps is None:
+            return False
+        for step in steps:
+            self.replay(step, forward = True)
+        self.update_arr()
+        return True
+
+    def replay(self, step, forward):
+        """Applies a journal step (forward) or reverts it, without recording anything."""
+        kind = step[0]
+        if kind == "counter":
+            self.group_id = 0 if forward else step[1]
+            return
+        if kind == "bbox":
+            _, root, before, after = step
+            self.bbox[root] = list(after if forward else before)
+            return
+        if kind == "reroot":
+            _, old, new, box = step
+            old, new = (old, new) if forward else (new, old)
+            x0, y0, x1, y1 = box
+            self.find_region(box) # every node of the group now points at old
+            block = self.parent.reshape(self.R, self.C)[x0:x1, y0:y1]
+            block[block == old] = new
+            self.parent[new] = new
+            self.size[new], self.gid[new], self.slot[new] = self.size[old], self.gid[old], self.slot[old]
+            self.bbox[new], self.sums[new] = self.bbox.pop(old), self.sums.pop(old)
+            self.groups.grew(new)
+            return
+        nodes = journal.decode(step[2])
+        if kind == "stamp":
+            _, targ, _, box = step
+            self.parent[nodes] = targ if forward else -1
+            self.size[targ] += len(nodes) if forward else -len(nodes)
+            self.bbox[targ] = join(box, box_of(nodes, self.C)) if forward else list(box)
+            self.sums[targ] = add_sums(self.sums[targ], sum_nodes(nodes, self.C), 1 if forward else -1)
+            self.groups.grew(targ)
+            self.dirty.append(box_of(nodes, self.C))
+        elif kind == "create":
+            _, root, _, group_id = step
+            if forward:
+                self.parent[nodes] = root
+                self.size[root] = len(nodes)
+                self.gid[root] = group_id
+                self.give_slot(root)
+                self.bbox[root] = box_of(nodes, self.C)
+                self.sums[root] = sum_nodes(nodes, self.C)
+                self.groups.grew(root)
+            else:
+                self.parent[nodes] = -1
+                del self.bbox[root], self.sums[root]
+            self.group_id = group_id + 1 if forward else group_id
+            self.dirty.append(box_of(nodes, self.C))
+        elif kind == "merge":
+            _, obs, _, targ, size, group_id, box, targ_box, sums = step
+            if forward:
+                self.parent[obs] = targ
+                self.size[targ] += size
+                del self.bbox[obs], self.sums[obs]
+                self.bbox[targ] = join(box, targ_box)
+                self.sums[targ] = add_sums(self.sums[targ], sums, 1)
+                self.recolor_merged(obs, targ, box)
+            else:
+                self.parent[nodes] = obs # every node of the smaller group, obs included
+                self.size[obs] = size
+                self.gid[obs] = group_id # erasing the merged group may have cleared it
+                self.give_slot(obs)
+                self.size[targ] -= size
+                self.bbox[obs], self.bbox[targ] = list(box), list(targ_box)
+                self.sums[obs], self.sums[targ] = list(sums), add_sums(self.sums[targ], sums, -1)
+                self.groups.grew(obs)
+                self.dirty.append(list(box))
+            self.groups.grew(targ)
+        elif kind == "delete":
+            _, root, _, size, group_id, box = step
+            if forward:
+                self.parent[nodes] = -1
+                del self.bbox[root], self.sums[root]
+            else:
+                self.parent[nodes] = root
+                self.size[root] = size
+                self.gid[root] = group_id
+                self.give_slot(root)
+                self.bbox[root] = list(box)
+                self.sums[root] = sum_nodes(nodes, self.C)
+                self.groups.grew(root)
+            self.dirty.append(list(box))
+        elif kind == "unstamp":
+            root = step[1]
+            self.parent[nodes] = -1 if forward else root
+            self.size[root] += -len(nodes) if forward else len(nodes)
+            self.sums[root] = add_sums(self.sums[root], sum_nodes(nodes, self.C), -1 if forward else 1)
+            self.groups.grew(root)
+            self.dirty.append(box_of(nodes, self.C))
+        elif kind == "split":
+            _, root, _, new, group_id = step
+            if forward:
+                self.parent[nodes] = new
+                self.size[new] = len(nodes)
+                self.gid[new] = group_id
+                self.give_slot(new)
+                self.bbox[new] = box_of(nodes, self.C)
+                self.sums[new] = sum_nodes(nodes, self.C)
+                self.groups.grew(new)
+            else:
+                self.parent[nodes] = root
+                del self.bbox[new], self.sums[new]
+            self.size[root] += -len(nodes) if forward else len(nodes)
+            self.sums[root] = add_sums(self.sums[root], sum_nodes(nodes, self.C), -1 if forward else 1)
+            self.groups.grew(root)
+            self.group_id = group_id + 1 if forward else group_id
+            self.dirty.append(box_of(nodes, self.C))
+
+class TiledUnionFind():
+    """
+    Union find for drawing planes too large to store densely, with the same public interface as ArrayUnionFind.
+    The plane is split into tile x tile chunks that are only allocated once something is drawn on them.
+    Every pixel of a chunk stores the id of the set it was stamped with (-1 if empty) and a union find over
+    the sets merges groups, so connectivity does not depend on chunk borders:
+        parent: parent set, itself for the root of a group
+        size:   number of nodes in the group (only meaningful at a root)
+        gid:    group id used to pick the group's color (only meaningful at a root)
+    Those three arrays grow with the number of sets, not with the size of the plane.
+    Colors are not stored, render_box renders the visible part of the plane on demand (see Viewport).
+    Edits are journaled like ArrayUnionFind's, a merge records the sets of the smaller group instead of its nodes.
+    Like ArrayUnionFind, a single union(a, b) is slower per pair than UnionFind, use union_many for many nodes.
+
+    params:
+        surface_shape (num_rows, num_cols) of the drawing plane
+        brightness int [0, 255] controls how bright the shapes are
+        color_wheel tuple of (R, G, B) tuples where R, G, B are integers [0, 255]
+        tile int width and height of a chunk
+        undo_budget bytes of undo history to keep, 0 disables undo
+    """
+    def __init__(self, surface_shape, brightness, color_wheel, tile = 64, undo_budget = 0):
+        self.group_id = 0
+        self.colors = color_wheel
+        self.R, self.C = surface_shape
+        self.T = tile
+        self.TC = -(-self.C // tile) # chunks per column of the plane
+        self.tiles = {} # tx * TC + ty: (tile, tile) int32 array of set ids
+        self.sets = 0
+        self.parent = np.zeros(64, dtype = np.int32)
+        self.size = np.zeros(64, dtype = np.int32)
+        self.gid = np.zeros(64, dtype = np.int32)
+        self.bbox = {} # root: [x0, y0, x1, y1] bounding box of the group (x1 and y1 exclusive)
+        self.sums = {} # root: [sum of x, sum of y] over the nodes of the group
+        self.connectivity = 4 # how the nodes of a group touch (4 or 8), groups split along it, see find_splits
+        self.id = NodeIds(self)
+        self.groups = Groups(self)
+        self.journal = journal.Journal(undo_budget)
+
+        self.palette = make_palette(self.colors)
+        self.brightness = brightness
+
+        # Regions to repaint, see ArrayUnionFind
+        self.touched = [self.R, self.C, 0, 0]
+        self.dirty = []
+        self.updated = []
+
+    max_dirty = 16 # more pending boxes than this are repainted as one bounding box
+
+    def reset(self):
+        """Erases every group in place, only the area the groups covered is repainted."""
+        self.journal.begin()
+        if self.journal.recording:
+            x, y = self.nodes().T
+            order = np.argsort(x * self.C + y)
+            x, y = x[order], y[order]
+            sets = self.lookup(x, y)
+            roots = self.find_many(sets)
+            for root, i in journal.by_root(roots):
+                self.record_delete(root, journal.encode(x[i] * self.C + y[i]), sets[i])
+            self.journal.record("counter", self.group_id)
+        else:
+            self.sets = 0 # set ids are only reused when no history refers to them
+        self.dirty.extend(self.bbox.values())
+        self.tiles.clear()
+        self.bbox.clear()
+        self.sums.clear()
+        self.group_id = 0
+        self.update_arr()
+        self.journal.end()
+
+    def chunks(self, x, y):
+        """Groups nodes by chunk, yields (chunk key, indices into x and y of the nodes in that chunk)."""
+        if not len(x):
+            return
+        keys = (x // self.T) * self.TC + y // self.T
+        order = np.argsort(keys, kind = "stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        for start, stop in zip(starts, np.append(starts[1:], len(keys))):
+            yield int(keys[start]), order[start:stop]
+
+    def lookup(self, x, y):
+        """Returns the set id of every node (x, y), -1 for empty nodes.  Nodes must be on the drawing plane."""
+        sets = np.full(len(x), -1, dtype = np.int32)
+        for key, i in self.chunks(x, y):
+            tile = self.tiles.get(key)
+            if tile is not None:
+                sets[i] = tile[x[i] % self.T, y[i] % self.T]
+        return sets
+
+    def stamp(self, x, y, s):
+        """
+        Stamps nodes (x, y) with set s (or each with its own set when s is an array), allocating their chunks when needed.
+        s = -1 erases them and frees chunks that become empty.
+        """
+        erase = np.ndim(s) == 0 and s < 0
+        for key, i in self.chunks(x, y):
+            tile = self.tile_at(int(x[i[0]]), int(y[i[0]]), allocate = not erase)
+            if tile is None:
+                continue
+            tile[x[i] % self.T, y[i] % self.T] = s if np.ndim(s) == 0 else s[i]
+            if erase and not (tile >= 0).any():
+                del self.tiles[key]
+
+    def blocks(self, box, step = 1):
+        """
+        Yields (rows, cols, chunk block) for every allocated chunk that intersects box [x0, y0, x1, y1],
+        where block is the part of the chunk sampled every step-th node and rows, cols are the slices
+        it covers in the (ceil((x1 - x0) / step), ceil((y1 - y0) / step)) sampled box.
+        """
+        x0, y0, x1, y1 = box
+        T = self.T
+        for tx in range(x0 // T, (x1 - 1) // T + 1):
+            i0, i1 = -(-(max(x0, tx * T) - x0) // step), -(-(min(x1, tx * T + T) - x0) // step)
+            if i0 >= i1:
+                continue
+            for ty in range(y0 // T, (y1 - 1) // T + 1):
+                tile = self.tiles.get(tx * self.TC + ty)
+                if tile is None:
+                    continue
+                j0, j1 = -(-(max(y0, ty * T) - y0) // step), -(-(min(y1, ty * T + T) - y0) // step)
+                if j0 >= j1:
+                    continue
+                a, b = x0 + i0 * step - tx * T, y0 + j0 * step - ty * T
+                yield slice(i0, i1), slice(j0, j1), tile[a:a + (i1 - i0 - 1) * step + 1:step, b:b + (j1 - j0 - 1) * step + 1:step]
+
+    def occupied(self, box = None):
+        """Returns a boolean bitmap of the nodes inside box [x0, y0, x1, y1] (default: all) that belong to a group."""
+        x0, y0, x1, y1 = box = box or (0, 0, self.R, self.C)
+        bitmap = np.zeros((x1 - x0, y1 - y0), dtype = bool)
+        for rows, cols, block in self.blocks(box):
+            bitmap[rows, cols] = block >= 0
+        return bitmap
+
+    def labels(self, box, step = 1):
+        """Returns the group id of every step-th node inside box [x0, y0, x1, y1], -1 for empty nodes."""
+        x0, y0, x1, y1 = box
+        labels = np.full((-(-(x1 - x0) // step), -(-(y1 - y0) // step)), -1, dtype = np.int32)
+        for rows, cols, block in self.blocks(box, step):
+            occupied = block >= 0
+            labels[rows, cols][occupied] = self.gid[self.find_many(block[occupied])]
+        return labels
+
+    def render_box(self, box, step = 1):
+        """Returns the RGB pixels of box [x0, y0, x1, y1], every step-th node along both axes."""
+        return render(self.labels(box, step), self.palette)
+
+    def label_box(self, box, step = 1):
+        """Returns the group id of every step-th node of box [x0, y0, x1, y1], -1 for empty nodes, see ArrayUnionFind.label_box."""
+        return self.labels(box, step)
+
+    def normalize_brightness(self):
+        """
+        Converts all colors to the same intensity, pixels are rendered from the palette.
+        """
+        normalize_brightness(self.palette[:-1], self.brightness)
+
+    def snapshot(self):
+        """Arrays that together fingerprint the drawing, see recording.digest."""
+        T = self.T
+        for key in sorted(self.tiles):
+            tx, ty = divmod(key, self.TC)
+            yield np.array([tx, ty])
+            yield self.labels([tx * T, ty * T, min(self.R, tx * T + T), min(self.C, ty * T + T)])
+
+    def state(self):
+        """Returns (meta, arrays) that describe the drawing, see storage.save.  Only allocated chunks are stored."""
+        keys = sorted(self.tiles)
+        roots = np.array(list(self.bbox), dtype = np.int32)
+        meta = {"engine": "tiled", "shape": [self.R, self.C], "tile": self.T, "group_id": self.group_id,
+                "connectivity": self.connectivity}
+        arrays = {"keys": np.array(keys, dtype = np.int64),
+                  "tiles": np.stack([self.tiles[key] for key in keys]) if keys else np.zeros((0, self.T, self.T), dtype = np.int32),
+                  "parent": self.parent[:self.sets], "size": self.size[:self.sets], "gid": self.gid[:self.sets],
+                  "roots": roots, "bbox": np.array(list(self.bbox.values()), dtype = np.int32).reshape(-1, 4),
+                  "sums": np.array([self.sums[root] for root in self.bbox], dtype = np.int64).reshape(-1, 2)}
+        return meta, arrays
+
+    def detach(self):
+        """Copies the chunks that are memory mapped from a saved drawing into memory, so the file can be replaced."""
+        self.tiles = {key: np.array(tile) if isinstance(tile, np.memmap) else tile for key, tile in self.tiles.items()}
+
+    def load_state(self, meta, arrays):
+        """
+        Replaces the drawing with a saved state.  The chunks are used as given, so when they are memory mapped
+        only the chunks that get shown or edited are ever read.
+        """
+        if meta["engine"] != "tiled" or meta["shape"] != [self.R, self.C] or meta["tile"] != self.T:
+            raise ValueError(f"the drawing was saved from a {meta['shape'][0]}x{meta['shape'][1]} {meta['engine']} canvas")
+        self.reset()
+        self.tiles = dict(zip(np.asarray(arrays["keys"]).tolist(), arrays["tiles"]))
+        self.sets = len(arrays["parent"])
+        for name in ("parent", "size", "gid"):
+            setattr(self, name, np.concatenate((arrays[name], np.zeros(max(64, self.sets), dtype = np.int32))))
+        self.group_id = meta["group_id"]
+        self.connectivity = meta.get("connectivity", 4) # saved before imports could be 8-connected
+        roots = np.asarray(arrays["roots"]).tolist()
+        self.bbox = dict(zip(roots, np.asarray(arrays["bbox"]).tolist()))
+        if "sums" in arrays:
+            self.sums = dict(zip(roots, np.asarray(arrays["sums"]).tolist()))
+        else: # saved before the sums were kept, every chunk has to be read
+            x, y = self.nodes().T
+            self.sums = {root: [int(x[i].sum()), int(y[i].sum())] for root, i in journal.by_root(self.find_many(self.lookup(x, y)))}
+        for root, box in self.bbox.items():
+            self.invalidate(box)
+            self.groups.grew(root)
+        self.update_arr()
+        self.journal.clear()
+
+    def load_labels(self, labels, connectivity = 4):
+        """
+        Replaces the drawing with one group per label of a label image (see raster.label), labels[0][0] at node (0, 0).
+        Every label becomes one set, stamped chunk by chunk, see ArrayUnionFind.load_labels.
+        """
+        if labels.shape[0] > self.R or labels.shape[1] > self.C:
+            raise ValueError(f"a {labels.shape[0]}x{labels.shape[1]} image does not fit on the {self.R}x{self.C} canvas")
+        self.reset()
+        self.connectivity = connectivity
+        self.sets = 0
+        x, y, starts, sizes, boxes, sums = labelled_groups(labels)
+        count = len(starts)
+        for name in ("parent", "size", "gid"):
+            setattr(self, name, np.zeros(max(64, 2 * count), dtype = np.int32))
+        self.sets = count
+        self.parent[:count] = self.gid[:count] = np.arange(count)
+        self.size[:count] = sizes
+        self.stamp(x, y, np.repeat(np.arange(count, dtype = np.int32), sizes))
+        self.group_id = count
+        self.bbox = dict(zip(range(count), boxes.tolist()))
+        self.sums = dict(zip(range(count), sums.tolist()))
+        self.groups.rebuild()
+        self.invalidate([0, 0, labels.shape[0], labels.shape[1]])
+        self.update_arr()
+        self.journal.clear()
+
+    def find(self, s):
+        """Returns the root of set s, pointing every set on the path directly at the root, see ArrayUnionFind.find."""
+        parent = self.parent
+        root, up = s, parent.item(s)
+        while up != root:
+            root, up = up, parent.item(up)
+        up = parent.item(s)
+        while up != root:
+            parent[s] = root
+            s, up = up, parent.item(up)
+        return root
+
+    def find_many(self, sets):
+        """Vectorized find for an array of set ids, compresses their paths."""
+        roots = self.parent[sets]
+        while True:
+            grand_parents = self.parent[roots]
+            if np.array_equal(grand_parents, roots):
+                break
+            roots = grand_parents
+        self.parent[sets] = roots
+        return roots
+
+    def root_of(self, node):
+        """Returns the root set of node (x, y) or None if it is empty or off the drawing plane."""
+        x, y = int(node[0]), int(node[1])
+        if not (0 <= x < self.R and 0 <= y < self.C):
+            return None
+        tile = self.tile_at(x, y)
+        if tile is None or tile[x % self.T, y % self.T] < 0:
+            return None
+        return int(self.find(tile[x % self.T, y % self.T]))
+
+    def group_of(self, node):
+        """Returns the group id of node (x, y) or None if it is empty or off the drawing plane."""
+        root = self.root_of(node)
+        return None if root is None else int(self.gid[root])
+
+    def node_count(self):
+        return int(sum(self.size[root] for root in self.bbox))
+
+    def nodes(self):
+        """Returns every occupied node as an N x 2 array of (x, y)."""
+        nodes = [np.argwhere(tile >= 0) + np.array(divmod(key, self.TC)) * self.T for key, tile in self.tiles.items()]
+        return np.concatenate(nodes) if nodes else np.zeros((0, 2), dtype = np.intp)
+
+    def new_set(self):
+        """Returns the id of a new set, growing the set arrays when they are full."""
+        if self.sets == len(self.parent):
+            for name in ("parent", "size", "gid"):
+                setattr(self, name, np.concatenate((getattr(self, name), np.zeros_like(getattr(self, name)))))
+        self.sets += 1
+        return self.sets - 1
+
+    def delete_group(self, node):
+        x, y = int(node[0]), int(node[1])
+        root = self.find(self.tile_at(x, y)[x % self.T, y % self.T])
+        x0, y0, x1, y1 = box = self.bbox.pop(root)
+        del self.sums[root]
+        # True for the sets of the group, indexed by a chunk it gives the group's nodes (the extra False is for -1)
+        member = np.zeros(self.sets + 1, dtype = bool)
+        member[:-1] = self.find_many(np.arange(self.sets)) == root
+        self.journal.begin()
+        if self.journal.recording:
+            sets = np.full((x1 - x0, y1 - y0), -1, dtype = np.int32)
+            for rows, cols, block in self.blocks(box):
+                sets[rows, cols] = block
+            erase = member[sets]
+            self.record_delete(root, journal.encode_mask(erase, box, self.C), sets[erase], box)
+        self.journal.end()
+        T = self.T
+        for tx in range(x0 // T, (x1 - 1) // T + 1):
+            for ty in range(y0 // T, (y1 - 1) // T + 1):
+                key = tx * self.TC + ty
+                tile = self.tiles.get(key)
+                if tile is None:
+                    continue
+                np.copyto(tile, -1, where = member[tile])
+                if not (tile >= 0).any():
+                    del self.tiles[key] # free chunks that became empty
+        self.dirty.append(box)
+        self.update_arr()
+
+    def roots(self, box):
+        """Returns the root set of every node inside box [x0, y0, x1, y1], -1 for empty nodes."""
+        x0, y0, x1, y1 = box
+        roots = np.full((x1 - x0, y1 - y0), -1, dtype = np.int32)
+        for rows, cols, block in self.blocks(box):
+            occupied = block >= 0
+            roots[rows, cols][occupied] = self.find_many(block[occupied])
+        return roots
+
+    def erase_nodes(self, nodes):
+        """
+        Erases nodes (a Shape, a raster.Mask or an N x 2 array of (x, y)) from their groups and splits the groups they
+        cut apart, see ArrayUnionFind.erase_nodes.  A piece that breaks off is stamped with a new set, which becomes its root.
+        Returns the number of erased nodes.
+        """
+        x, y = np.divmod(plane_indices(nodes, self.R, self.C)[0], self.C)
+        sets = self.lookup(x, y)
+        x, y, sets = x[sets >= 0], y[sets >= 0], sets[sets >= 0]
+        if not len(sets):
+            return 0
+        self.journal.begin()
+        for root, i in journal.by_root(self.find_many(sets)):
+            erased = x[i] * self.C + y[i]
+            if len(erased) == self.size[root]:
+                if self.journal.recording:
+                    self.record_delete(root, journal.encode(x[i] * self.C + y[i]), sets[i])
+                self.stamp(x[i], y[i], -1)
+                self.dirty.append(self.bbox.pop(root))
+                del self.sums[root]
+                continue
+            self.apply(("unstamp", root, journal.encode(erased), journal.encode_values(sets[i])))
+            x0, y0, x1, y1 = box_of(erased, self.C)
+            pieces = find_splits(self, root, [x0 - 1, y0 - 1, x1 + 1, y1 + 1])
+            for piece in pieces:
+                px, py = np.divmod(piece, self.C)
+                self.apply(("split", root, journal.encode(piece), self.sets, journal.encode_values(self.lookup(px, py)), self.group_id))
+            box = self.bbox[root]
+            if pieces or not (box[0] < x0 and box[1] < y0 and x1 < box[2] and y1 < box[3]):
+                self.apply(("bbox", root, box, shrink_box(self, root, box)))
+        self.journal.end()
+        self.update_arr()
+        return len(sets)
+
+    def apply(self, step):
+        """Records a journal step and applies it, for edits that are replayed exactly as they are made."""
+        if self.journal.recording:
+            self.journal.record(*step)
+        self.replay(step, forward = True)
+
+    def record_delete(self, root, runs, sets, box = None):
+        """
+        Records erasing root's group, runs of its nodes (see journal.encode) and sets the set of every node in index order.
+        Undoing a merge relies on every node still holding the set it was stamped with, so the sets are kept too
+        (run length encoded, they repeat a lot).
+        """
+        self.journal.record("delete", root, runs, journal.encode_values(sets),
+                            int(self.size[root]), int(self.gid[root]), box or self.bbox[root])
+
+    def update_arr(self, node_id = None):
+        """
+        Marks the regions affected by the most recent union, merge or delete_group as updated.
+        Nothing is rendered here, render_box renders the visible regions.
+        """
+        boxes = self.dirty
+        if self.touched[0] < self.touched[2]:
+            boxes.append(self.touched)
+        if len(boxes) > self.max_dirty:
+            boxes = [[min(b[0] for b in boxes), min(b[1] for b in boxes),
+                      max(b[2] for b in boxes), max(b[3] for b in boxes)]]
+        self.updated.extend(boxes)
+        self.touched = [self.R, self.C, 0, 0]
+        self.dirty = []
+
+    def update_surface(self):
+        self.updated.append([0, 0, self.R, self.C])
+
+    def invalidate(self, box = None):
+        """Marks box [x0, y0, x1, y1] (default: the whole canvas) to be repainted by the next update_arr."""
+        self.dirty.append(list(box) if box else [0, 0, self.R, self.C])
+
+    def take_updates(self):
+        """Returns the [x0, y0, x1, y1] boxes of the plane that changed since the last call."""
+        updated, self.updated = self.updated, []
+        return updated
+
+    def take_recolored(self):
+        """Nothing is painted here, so merged groups are reported by take_updates like every other change."""
+        return []
+
+    def tile_at(self, x, y, allocate = False):
+        """Returns the chunk holding node (x, y), or None if it is not allocated and allocate is False."""
+        key = (x // self.T) * self.TC + y // self.T
+        tile = self.tiles.get(key)
+        if tile is None and allocate:
+            tile = self.tiles[key] = np.full((self.T, self.T), -1, dtype = np.int32)
+        return tile
+
+    def union(self, a, b):
+        """
+        Union nodes a and b.  Nodes that are off the drawing plane are ignored.
+        Like ArrayUnionFind.union it works on Python ints, two nodes of one group return before the journal is touched.
+        """
+        nodes = [(int(x), int(y)) for x, y in dict.fromkeys((tuple(a), tuple(b))) if 0 <= x < self.R and 0 <= y < self.C]
+        if not nodes:
+            return None
+        sets = []
+        for x, y in nodes:
+            tile = self.tile_at(x, y)
+            sets.append(-1 if tile is None else tile.item(x % self.T, y % self.T))
+        roots = {self.find(s) for s in sets if s >= 0}
+        if len(roots) == 1 and min(sets) >= 0:
+            return self.gid.item(roots.pop())
+        self.journal.begin()
+        if roots:
+            targ = roots.pop()
+            for root in roots:
+                targ = self.merge(root, targ)
+        else:
+            targ = self.create()
+        new = [(x, y) for (x, y), s in zip(nodes, sets) if s < 0]
+        if new and self.journal.recording:
+            self.journal.record("stamp", targ, journal.encode(sorted(x * self.C + y for x, y in new)), list(self.bbox[targ]))
+        if new:
+            sums = self.sums[targ]
+            for x, y in new:
+                self.tile_at(x, y, allocate = True)[x % self.T, y % self.T] = targ
+                sums[0] += x
+                sums[1] += y
+                for box in (self.bbox[targ], self.touched):
+                    if x < box[0]: box[0] = x
+                    if y < box[1]: box[1] = y
+                    if x >= box[2]: box[2] = x + 1
+                    if y >= box[3]: box[3] = y + 1
+            self.size[targ] += len(new)
+            self.groups.grew(targ)
+        self.journal.end()
+        return self.gid.item(targ)
+
+    def union_many(self, nodes, touching = False):
+        """
+        Unions every node of a Shape (or a raster.Mask or an N x 2 array of (x, y) nodes) into one group, see
+        ArrayUnionFind.union_many.  A Mask (or the filled area of a Shape) is added one band of chunks at a time,
+        so large fills never expand into one huge array of nodes.  Returns the group id or None if no nodes were added.
+        """
+        if isinstance(nodes, Shape):
+            bands, mask = [nodes.nodes], nodes.mask
+        elif isinstance(nodes, raster.Mask):
+            bands, mask = [], nodes
+        else:
+            bands, mask = [nodes], None
+        if mask is not None:
+            x0, y0, x1, y1 = mask.box
+            bands += [mask.crop([x, y0, x + self.T, y1]) for x in range(x0, x1, self.T)]
+        targ = None
+        self.journal.begin()
+        for band in bands:
+            root = self.union_band(band, touching)
+            if root is not None:
+                # a band that touches the group of an earlier band may already have merged it into a larger root
+                targ = root if targ is None or root == self.find(targ) else self.merge(root, self.find(targ))
+        self.journal.end()
+        return None if targ is None else int(self.gid[targ])
+
+    def union_band(self, nodes, touching):
+        """Unions nodes (a raster.Mask or an N x 2 array) into one group and returns the root set, or None if no nodes are on the plane."""
+        nodes, near = plane_indices(nodes, self.R, self.C, touching)
+        if not len(nodes):
+            return None
+        x, y = np.divmod(nodes, self.C)
+        sets = self.lookup(x, y)
+
+        # existing groups to merge, largest first
+        occupied = [sets[sets >= 0]]
+        if touching:
+            neighbors = self.lookup(*np.divmod(near, self.C))
+            occupied.append(neighbors[neighbors >= 0])
+        roots = raster.unique_ints(self.find_many(np.concatenate(occupied)))
+        roots = roots[np.argsort(-self.size[roots], kind = "stable")]
+        if not len(roots):
+            targ = self.create()
+        else:
+            targ = int(roots[0])
+            for root in roots[1:]:
+                targ = self.merge(int(root), targ)
+
+        # stamp the new nodes with the root of the group
+        new = sets < 0
+        if new.any():
+            x, y = x[new], y[new]
+            if self.journal.recording:
+                self.journal.record("stamp", targ, journal.encode(x * self.C + y), list(self.bbox[targ]))
+            self.stamp(x, y, targ)
+            self.size[targ] += len(x)
+            self.sums[targ] = add_sums(self.sums[targ], [int(x.sum()), int(y.sum())], 1)
+            self.groups.grew(targ)
+            box = [int(x.min()), int(y.min()), int(x.max()) + 1, int(y.max()) + 1]
+            for targ_box in (self.bbox[targ], self.touched):
+                targ_box[:] = [min(box[0], targ_box[0]), min(box[1], targ_box[1]),
+                               max(box[2], targ_box[2]), max(box[3], targ_box[3])]
+        return targ
+
+    def merge(self, a, b):
+        """
+        Roots a and b belong to different groups, hang the smaller set under the larger root and return that root.
+        The smaller group takes the larger group's color so its bounding box must be repainted.
+        """
+        obs, targ = (a, b) if self.size.item(a) <= self.size.item(b) else (b, a)
+        if self.journal.recording:
+            members = np.flatnonzero(self.find_many(np.arange(self.sets)) == obs).astype(np.int32)
+            self.journal.record("merge", obs, members, targ, int(self.size[obs]), int(self.gid[obs]), self.bbox[obs], list(self.bbox[targ]),
+                                self.sums[obs])
+        self.parent[obs] = targ
+        self.size[targ] += self.size[obs]
+        self.groups.grew(targ)
+        self.sums[targ] = add_sums(self.sums[targ], self.sums.pop(obs), 1)
+        box, targ_box = self.bbox.pop(obs), self.bbox[targ]
+        self.bbox[targ] = [min(box[0], targ_box[0]), min(box[1], targ_box[1]),
+                           max(box[2], targ_box[2]), max(box[3], targ_box[3])]
+        self.dirty.append(box)
+        return targ
+
+    def create(self):
+        """Creates a new empty group and returns its root set."""
+        self.journal.record("create", self.sets, self.group_id)
+        s = self.new_set()
+        self.parent[s] = s
+        self.size[s] = 0
+        self.gid[s] = self.group_id
+        self.group_id += 1
+        self.bbox[s] = [self.R, self.C, 0, 0]
+        self.sums[s] = [0, 0]
+        return s
+
+    def undo(self):
+        """Reverts the last operation in the journal, returns False if there is nothing to undo."""
+        steps = self.journal.undo()
+        if steps is None:
+            return False
+        for step in reversed(steps):
+            self.replay(step, forward = False)
+        self.update_arr()
+        return True
+
+    def redo(self):
+        """Applies the last undone operation again, returns False if there is nothing to redo."""
+        steps = self.journal.redo()
+        if steps is None:
+            return False
+        for step in steps:
+            self.replay(step, forward = True)
+        self.update_arr()
+        return True
+
+    def replay(self, step, forward):
+        """Applies a journal step (forward) or reverts it, without recording anything.  See ArrayUnionFind.replay."""
+        kind = step[0]
+        if kind == "counter":
+            self.group_id = 0 if forward else step[1]
+        elif kind == "bbox":
+            _, root, before, after = step
+            self.bbox[root] = list(after if forward else before)
+        elif kind == "create":
+            _, s, group_id = step
+            if forward:
+                self.new_set()
+                self.parent[s], self.size[s], self.gid[s] = s, 0, group_id
+                self.bbox[s] = [self.R, self.C, 0, 0]
+                self.sums[s] = [0, 0]
+            else:
+                self.sets = s # operations are undone in reverse order, so s is the last set
+                del self.bbox[s], self.sums[s]
+            self.group_id = group_id + 1 if forward else group_id
+        elif kind == "merge":
+            _, obs, members, targ, size, group_id, box, targ_box, sums = step
+            if forward:
+                self.parent[obs] = targ
+                self.size[targ] += size
+                del self.bbox[obs], self.sums[obs]
+                self.bbox[targ] = join(box, targ_box)
+                self.sums[targ] = add_sums(self.sums[targ], sums, 1)
+            else:
+                self.parent[members] = obs # every set of the smaller group, obs included
+                self.size[obs] = size
+                self.gid[obs] = group_id
+                self.size[targ] -= size
+                self.bbox[obs], self.bbox[targ] = list(box), list(targ_box)
+                self.sums[obs], self.sums[targ] = list(sums), add_sums(self.sums[targ], sums, -1)
+                self.groups.grew(obs)
+            self.groups.grew(targ)
+            self.dirty.append(list(box))
+        else:
+            nodes = journal.decode(step[2])
+            x, y = np.divmod(nodes, self.C)
+            if kind == "stamp":
+                _, targ, _, box = step
+                self.stamp(x, y, targ if forward else -1)
+                self.size[targ] += len(nodes) if forward else -len(nodes)
+                self.bbox[targ] = join(box, box_of(nodes, self.C)) if forward else list(box)
+                self.sums[targ] = add_sums(self.sums[targ], sum_nodes(nodes, self.C), 1 if forward else -1)
+                self.groups.grew(targ)
+                self.dirty.append(box_of(nodes, self.C))
+            elif kind == "delete":
+                _, root, _, sets, size, group_id, box = step
+                if forward:
+                    self.stamp(x, y, -1)
+                    del self.bbox[root], self.sums[root]
+                else:
+                    self.stamp(x, y, journal.decode_values(sets))
+                    self.size[root] = size
+                    self.gid[root] = group_id
+                    self.bbox[root] = list(box)
+                    self.sums[root] = sum_nodes(nodes, self.C)
+                    self.groups.grew(root)
+                self.dirty.append(list(box))
+            elif kind == "unstamp":
+                _, root, _, sets = step
+                self.stamp(x, y, -1 if forward else journal.decode_values(sets))
+                self.size[root] += -len(nodes) if forward else len(nodes)
+                self.sums[root] = add_sums(self.sums[root], sum_nodes(nodes, self.C), -1 if forward else 1)
+                self.groups.grew(root)
+                self.dirty.append(box_of(nodes, self.C))
+            elif kind == "split":
+                _, root, _, s, sets, group_id = step
+                if forward:
+                    self.new_set()
+                    self.parent[s], self.size[s], self.gid[s] = s, len(nodes), group_id
+                    self.stamp(x, y, s)
+                    self.bbox[s] = box_of(nodes, self.C)
+                    self.sums[s] = sum_nodes(nodes, self.C)
+                    self.groups.grew(s)
+                else:
+                    self.stamp(x, y, journal.decode_values(sets)) # the sets the piece's nodes held, see record_delete
+                    self.sets = s
+                    del self.bbox[s], self.sums[s]
+                self.size[root] += -len(nodes) if forward else len(nodes)
+                self.sums[root] = add_sums(self.sums[root], sum_nodes(nodes, self.C), -1 if forward else 1)
+                self.groups.grew(root)
+                self.group_id = group_id + 1 if forward else group_id
+                self.dirty.append(box_of(nodes, self.C))
+
+
+class Shape():
+    def __init__(self, vertices, thickness = 1):
+        self.vertices = vertices      # List of vertices of the shape (order matters)
+        self.thickness = thickness    # Width of the outline in nodes (3 adds the 4 neighbors of every outline node)
+        self.edges = self.get_edges() # N x 2 array of the nodes that make the outline of the shape
+        self.nodes = self.edges       # Edge nodes and vertex nodes, nodes that fill the shape are kept in self.mask
+        self.mask = None              # raster.Mask of the nodes that fill the shape (see fill_shape / fill_region)
+    
+    @staticmethod
+    def get_line(x0, y0, x1, y1, thickness = 1):
+        """Returns all integer points that connect (x0, y0) to (x1, y1) as an N x 2 array"""
+        return raster.line(x0, y0, x1, y1, thickness = thickness)
+    
+    @staticmethod
+    def get_centroid(vertices):
+        X = Y = 0
+        for v in vertices:
+            X += v[0]
+            Y += v[1]
+        return (X / len(vertices), Y / len(vertices))
+    
+    @staticmethod
+    def get_neighbors(x, y, connectivity = 4):
+        """
+        y: int row
+        x: int column
+        returns 4-directionaly adjacent neighbors to (x, y), and the 4 diagonal ones too when connectivity is 8
+        """
+        if connectivity == 8:
+            return ((x+1, y), (x-1, y), (x, y+1), (x, y-1), (x+1, y+1), (x+1, y-1), (x-1, y+1), (x-1, y-1))
+        return ((x+1, y), (x-1, y), (x, y+1), (x, y-1))
+    
+    def coords(self):
+        """Returns all of the shape's nodes (outline and fill) as an N x 2 int array of (x, y)."""
+        if self.mask is None:
+            return self.nodes
+        return np.concatenate([self.nodes, self.mask.coords()])
+    
+    def region(self):
+        """Returns all of the shape's nodes, as the N x 2 array of the outline or as a raster.Mask once it is filled."""
+        if self.mask is None:
+            return self.nodes
+        return self.mask | raster.Mask.from_nodes(self.nodes)
+    
+    def get_edges(self):
+        """Returns all points that connect the vertices (including the vertices themselves)"""
+        if not len(self.vertices):
+            print("Shape must have vertices before edges can be drawn")
+            return np.zeros((1, 2), dtype = np.intp)
+        return raster.polyline(self.vertices, closed = True, thickness = self.thickness)
+    
+    def fill_shape(self):
+        """
+        Shapes such as stars, squares, triangles can be filled in with points.
+        fill_shape should not be called on a line or freehand shape.
+        
+        Rasterizes the inside of the outline into self.mask (nonzero winding, so the middle of the star is filled).
+        """
+        if len(self.edges) < 3:
+            raise Exception("A shape must have at least 3 edges in order to be filled")
+        elif len(self.vertices) < 3:
+            raise Exception(f"Shape has {len(self.vertices)} vertices, must have at least 3 to be filled.")
+        
+        mask, origin = raster.polygon_mask(self.vertices, rule = "nonzero")
+        if not mask.any():
+            raise ValueError("Shape is too small or thin to fill.")
+        self.mask = raster.Mask(mask, origin)
+        
+    def fill_region(self, x, y, union_find, box = None):
+        """
+        Creates a shape by spreading out from the location (x, y) until it reaches
+        a node that is already drawn or the edge of box [x0, y0, x1, y1] (default: the drawing plane).
+        The filled nodes are stored in self.mask which covers the box.
+        """
+        x0, y0, x1, y1 = box or (0, 0, union_find.R, union_find.C)
+        self.mask = raster.Mask(raster.flood_fill(union_find.occupied([x0, y0, x1, y1]), int(x) - x0, int(y) - y0), (x0, y0))
+
+def create_vertices(x0, y0, x1, y1, name = "rectangle"):
+    """
+    Fist click is position x0, y0
+    Current mouse position (or second click) is position x1, y1
+    Calculates the vertex points for the given shape
+    """
+    if name == "line":
+        return [(x0, y0), (x1, y1)]
+    
+    x0, x1 = sorted((x0, x1))
+    y0, y1 = sorted((y0, y1), reverse = False)
+    if x0 == x1: x1 += 1
+    if y0 == y1: y0 += 1
+    
+    a, b, c, d = (x0, y0), (x1, y0), (x0, y1), (x1, y1) # four corners (TL, TR, BL, BR)
+    x_midpoint = (x0 + x1) / 2
+    y_midpoint = (y0 + y1) / 2
+    
+    if name == "rectangle":
+        vertices = [a, b, d, c]
+    elif name == "triangle1":
+        vertices = [(x_midpoint, y0), c, d]
+    elif name == "triangle3":
+        vertices = [(x_midpoint, y1), a, b]
+    elif name == "triangle2":
+        vertices = [(x0, y_midpoint), b, d]
+    elif name == "triangle4":
+        vertices = [(x1, y_midpoint), a, c]
+    elif name in ["pentagon", "star"]:
+        theta = 36 * math.pi / 180
+        hy= (x_midpoint - x0) * math.tan(theta) * (y0 - y1) / (x1 - x0)
+        hx = (y_midpoint - y1) * math.tan(theta / 2) * (x1 - x0) / (y0 - y1)
+        top = (x_midpoint, y0)
+        left = (x0, y0 - hy)
+        right = (x1, y0 - hy)
+        bottom_left = (x0 + hx, y1)
+        bottom_right = (x1 - hx, y1)
+        if name == "pentagon":
+            vertices = [top, right, bottom_right, bottom_left, left]
+        else:
+            vertices = [bottom_left, top, bottom_right, left, right]
+    else:
+        vertices = [(x0, y0), (x1, y1)]
+    
+    return vertices
+
+
+def rasterize(vertices, thickness = 1, filled = False):
+    """Returns the nodes of the shape with these vertices as an N x 2 array, safe to run in a worker thread."""
+    shape = Shape(vertices, thickness = thickness)
+    if filled:
+        try: shape.fill_shape()
+        except: pass # Shape is too small/thin do not fill
+    return shape.coords()
+
+
+class ShapeTemplates():
+    """
+    LRU cache of rasterized shapes.  A shape made by create_vertices only depends on the tool and the size of its box
+    (the signed extent for a line), so the nodes of every shape are rasterized once with the box at (0, 0) and drawing
+    the same shape elsewhere adds the offset of its box.  Entries are keyed by (tool, width, height, thickness, filled)
+    and the least recently used ones are evicted past budget bytes.  Safe to use from the rasterization threads.
+    hits and misses count the lookups.
+    A shape is always stamped from its template, also on a miss, so where a midpoint of an odd sized box is rounded
+    does not depend on where the box is and drawing stays deterministic whether the cache hits or not.
+    
+    params:
+        budget bytes the cached nodes may use
+    """
+    def __init__(self, budget = 32 << 20):
+        self.budget = budget
+        self.entries = collections.OrderedDict() # key: (N, 2) int32 nodes, most recently used last
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+    
+    def nodes(self, x0, y0, x1, y1, name, thickness = 1, filled = False):
+        """Returns the nodes of rasterize(create_vertices(x0, y0, x1, y1, name), thickness, filled), see ShapeTemplates."""
+        if name == "line":
+            (w, h), origin = (x1 - x0, y1 - y0), (x0, y0)
+        else:
+            (w, h), origin = (abs(x1 - x0), abs(y1 - y0)), (min(x0, x1), min(y0, y1))
+        key = (name, w, h, thickness, filled)
+        with self.lock:
+            template = self.entries.get(key)
+            if template is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if template is None:
+            template = rasterize(create_vertices(0, 0, w, h, name = name), thickness, filled).astype(np.int32)
+            with self.lock:
+                self.misses += 1
+                if key not in self.entries and template.nbytes <= self.budget:
+                    self.entries[key] = template
+                    self.bytes += template.nbytes
+                    while self.bytes > self.budget:
+                        self.bytes -= self.entries.popitem(last = False)[1].nbytes
+        return template + np.array(origin)
@@ -1,3 +1,8 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import threading
 import time
 import math
 import bisect 
@@ -5,7 +10,14 @@ import bisect
 import numpy as np
 import pygame
 
+import importer
+import profiler
+import raster
+import recording
 import settings
+import storage
+from export import Exporter
+from union_find import ArrayUnionFind, TiledUnionFind, Shape, ShapeTemplates, create_vertices, hit_groups
 
 # TODO:
 # Add a readme giving tutorial instructions and instructions for how to start
@@ -15,260 +27,407 @@ import settings
 #
 # Add a click map so that both up and down arrows work as well as mouse for selecting tool (maybe)
 
-class UnionFind():
+class Session():
     """
-    Non-standard implementation of union find.
-    Each shape's nodes are connected like a network.
-    When shapes overlap, their two networks merge together into a larger group (network) of nodes.
+    Drawing tools without a display.
+    Turns tool events (press, drag and release of the left mouse button, right click fill, erase, reset)
+    into Shapes and unions them into a union find engine.  Game forwards its mouse and key input here
+    and scripts or benchmarks can drive it directly, see play.
     
-    Serves a second function to create a pygame surface to display the current shapes
-    where shapes of the same color belong to the same group.
+    Released shapes are rasterized by a pool of worker threads when workers > 0 (NumPy releases the GIL)
+    and merged into uf in release order by collect, every other edit first waits for them (flush).
+    
+    With an engine that keeps an undo journal, undo and redo revert and repeat whole edits:
+    a shape, a fill, an erased group, a reset, or everything drawn or erased between press and release
+    with the freehand and eraser tools.  Shapes rasterized by workers are one edit per collect, so shapes
+    released while the previous ones were still rasterizing are undone together.
+    
+    The eraser erases in one of eraser_modes: every whole group under the brush, the pixels under the brush
+    dragged across the drawing, or the most recent shape drawn under the cursor.  The last two need an engine
+    with erase_nodes, which splits the groups they cut apart.
     
     params:
-        surface_shape (num_rows, num_cols) of the drawing plane
-        brightness int [0, 255] controls how bright the shapes are
-        color_wheel tuple of (R, G, B) tuples where R, G, B are integers [0, 255] 
+        uf UnionFind or ArrayUnionFind that stores the drawing
+        thickness int width of drawn lines in nodes
+        workers int number of rasterization threads, 0 rasterizes on release
+        eraser_size int width of the eraser brush in nodes
+        template_budget bytes of rasterized shapes to keep for reuse, see ShapeTemplates
     """
-    def __init__(self, surface_shape, brightness, color_wheel):
-        self.group_id = 0
-        self.group = {}
-        self.id = {}
-        
-        self.colors = color_wheel
-        self.R, self.C = surface_shape
-        self.arr = np.array([[(0,)*3 for _ in range(self.C)] for _ in range(self.R)]) # row, column, RGB
-        self.brightness = brightness
-        self.surface = pygame.surfarray.make_surface(self.arr)
-        
-    def reset(self):
-        self.__init__((self.R, self.C), self.brightness, self.colors)
-        
-    def delete_group(self, node):
-        node_id = self.id[node]
-        nodes = self.group[node_id]
-        for node in nodes:
-            x, y = node
-            self.arr[x][y] = (0, 0, 0)
-            del self.id[node]
-        del self.group[node_id]
-        self.update_surface()
-        
-    def update_arr(self, node_id = None):
-        """
-        Updates the array for all nodes affected by most recent union.
-        """
-        if node_id is not None:
-            color = self.colors[node_id % len(self.colors)]
-            for x, y in self.group[node_id]:
-                self.arr[x][y] = color
-        else:
-            for node_id in self.group:
-                color = self.colors[node_id % len(self.colors)]
-                for x, y in self.group[node_id]:
-                    self.arr[x][y] = color
-        self.update_surface()
+    tools = ["line", "rectangle", "triangle1", "triangle2", "triangle3", "triangle4",
+             "pentagon", "star", "freehand", "eraser"]
+    filled_tools = [] # tools whose shapes are filled on release, outlines only by default
+    eraser_modes = ["group", "brush", "shape"]
+    
+    def __init__(self, uf, thickness = 3, workers = 0, eraser_size = 9, template_budget = 32 << 20):
+        self.uf = uf
+        self.thickness = thickness
+        self.eraser_size = eraser_size
+        self.eraser = self.eraser_modes[0]
+        self.tool = self.tools[0]
+        self.anchor = None   # position of the left click (last point of the stroke for freehand)
+        self.outline = []    # vertices of the shape previewed while dragging, committed on release
+        self.corners = None  # (x0, y0, x1, y1) the previewed shape was made from
+        self.templates = ShapeTemplates(template_budget)
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers) if workers else None
+        self.jobs = collections.deque() # (future nodes, outline) of the released shapes that are not merged yet
+        self.edits = 0                  # number of edits made to the drawing, see Game.autosave
+        self.stroke = False             # a journal operation is open for the current freehand stroke or eraser drag
+        self.drawn = []                 # (vertices, tool, corners, filled) of the shapes and freehand strokes drawn, see erase_shape
+        self.path = []                  # vertices of the current freehand stroke
     
-    def update_surface(self):
+    def play(self, events):
         """
-        Creates a pygame surface of the array.
+        Applies a stream of events, each a tuple (name, *args) naming a method of Session, e.g.
+        ("select", "star"), ("press", x, y), ("drag", x, y), ("trace", [(x, y), ...]), ("release",), ("fill", x, y), ("erase", x, y), ("reset",),
+        ("select_eraser", "brush")
         """
-        self.surface = pygame.surfarray.make_surface(self.arr)
+        for name, *args in events:
+            getattr(self, name)(*args)
+    
+    def select(self, tool):
+        """Switch to one of Session.tools."""
+        self.tool = tool
     
-    def normalize_brightness(self):
+    def select_eraser(self, mode):
+        """Switch the eraser to one of Session.eraser_modes."""
+        self.eraser = mode
+    
+    def press(self, x, y):
+        """Left click down."""
+        self.anchor = (x, y)
+        self.outline = []
+        if self.tool in ("freehand", "eraser") and hasattr(self.uf, "journal"):
+            self.flush()
+            self.uf.journal.begin()
+            self.stroke = True
+        if self.tool == "freehand":
+            self.path = [self.anchor]
+            self.drawn.append((self.path, self.tool, None, False))
+        elif self.tool == "eraser" and self.eraser == "brush":
+            self.erase_brush([(x, y)])
+        elif self.tool == "eraser" and self.eraser == "group":
+            self.erase(x, y)
+        elif self.tool == "eraser" and self.eraser == "shape":
+            self.erase_shape(x, y)
+    
+    def end_stroke(self):
+        """Closes the journal operation of the current freehand stroke or eraser drag."""
+        if self.stroke:
+            self.uf.journal.end()
+            self.stroke = False
+    
+    def trace(self, points):
         """
-        Converts all pixels that are on to the same intensity.
+        Left click held along a path of mouse samples: every sample erases or extends the freehand stroke
+        (rasterized in one pass), shapes are only previewed at the last one.
         """
-        for i in range(self.R):
-            for j in range(self.C):
-                if sum(self.arr[i][j]) != 0:
-                    c = self.brightness / math.sqrt(sum(self.arr[i][j][k]**2 for k in range(3)))
-                    for k in range(3):
-                        self.arr[i][j][k] *= c
-        
-    def union(self, a, b):
-        """Union nodes a and b"""
-        A, B = a in self.id, b in self.id
-        if A and B and self.id[a] != self.id[b]:
-            self.merge(a, b)
-        elif A or B:
-            self.add(a, b)
+        if self.tool == "freehand":
+            self.flush()
+            nodes = raster.polyline([self.anchor, *points], thickness = self.thickness)
+            self.uf.union_many(nodes)
+            self.uf.update_arr()
+            self.path.extend(points)
+            self.anchor = points[-1]
+            self.edits += 1
+        elif self.tool == "eraser":
+            if self.eraser == "brush":
+                self.erase_brush(points)
+            elif self.eraser == "group":
+                for x, y in points:
+                    self.erase(x, y)
         else:
-            self.create(a, b)
-        return self.id[a] if a in self.id else self.id[b]
-    
-    def merge(self, a, b):
-        """Nodes a and b both belong to a group, merge the smaller group with the larger group."""
-        obs, targ = sorted((self.id[a], self.id[b]), key = lambda i: len(self.group[i]))
-        for node in self.group[obs]:
-            self.id[node] = targ
-        self.group[targ] |= self.group[obs]
-        del self.group[obs]
-    
-    def add(self, a, b):
-        """Node a or node b does not have a group.  Add the new node to the existing group."""
-        a, b = (a, b) if a in self.id else (b, a)
-        targ = self.id[a]
-        self.id[b] = targ
-        self.group[targ] |= {b}
-    
-    def create(self, a, b):
-        """Neither node a nor b belong to a group.  Create a new group {a, b}."""
-        self.group[self.group_id] = {a, b}
-        self.id[a] = self.id[b] = self.group_id
-        self.group_id += 1
-
-class Shape():
-    def __init__(self, vertices):
-        self.vertices = vertices      # List of vertices of the shape (order matters)
-        self.edges = self.get_edges() # Set of nodes that make the outline of the shape
-        self.nodes = self.edges       # Set of edge nodes, vertex nodes, and nodes to fill in the shape
-    
-    @staticmethod
-    def get_line(x0, y0, x1, y1):
-        """Recursively finds all integer points that connect (x0, y0) to (x1, y1)"""
-        def helper(x0, y0, x1, y1):
-            nonlocal seen, points
-            a, b, c, d = int(round(x0, 0)), int(round(y0, 0)), int(round(x1, 0)), int(round(y1, 0))
-            h = (a, b, c, d)
-            if h not in seen:
-                seen.add(h)
-                points |= {(a, b), (c, d)}
-                if a == c and b == d:
-                    return None
-                xm, ym = (x0 + x1) / 2, (y0 + y1) / 2
-                helper(x0, y0, xm, ym)
-                helper(xm, ym, x1, y1)
-        seen = set()
-        points = {(x0, y0), (x1, y1)}
-        helper(x0, y0, x1, y1)
-        return points
-    
-    @staticmethod
-    def get_centroid(vertices):
-        X = Y = 0
-        for v in vertices:
-            X += v[0]
-            Y += v[1]
-        return (X / len(vertices), Y / len(vertices))
-    
-    @staticmethod
-    def get_neighbors(x, y):
-        """
-        y: int row
-        x: int column
-        returns 4-directionaly adjacent neighbors to (x, y)
-        """
-        return ((x+1, y), (x-1, y), (x, y+1), (x, y-1))
-    
-    def get_edges(self):
-        """Returns all points that connect the vertices (including the vertices themselves)"""
-        if not self.vertices:
-            print("Shape must have vertices before edges can be drawn")
-            return [(0, 0)]
-        edges = set()
-        for (x0, y0), (x1, y1) in zip(self.vertices, self.vertices[1:] + [self.vertices[0]]):
-            edges |= self.get_line(x0, y0, x1, y1)
-        return edges
-    
-    def fill_shape(self):
-        """
-        Shapes such as stars, squares, triangles can be filled in with points.
-        fill_shape should not be called on a line or freehand shape.
+            self.drag(*points[-1])
+    
+    def drag(self, x, y):
+        """Left click held at (x, y): erase, extend the freehand stroke or preview the shape."""
+        if self.tool == "eraser":
+            if self.eraser == "brush":
+                self.erase_brush([(x, y)])
+            elif self.eraser == "group":
+                self.erase(x, y)
+        elif self.tool == "freehand":
+            self.flush()
+            self.uf.union_many(Shape([self.anchor, (x, y)], thickness = self.thickness))
+            self.uf.update_arr()
+            self.path.append((x, y))
+            self.anchor = (x, y)
+            self.edits += 1
+        else:
+            x1 = max(0, min(self.uf.R - 2, x))
+            y1 = max(0, min(self.uf.C - 2, y))
+            self.outline = create_vertices(*self.anchor, x1, y1, name = self.tool)
+            self.corners = (*self.anchor, x1, y1)
+    
+    def release(self, *pos):
+        """Left click released: commit the previewed shape."""
+        self.end_stroke()
+        outline, self.outline = self.outline, []
+        if not outline:
+            return
         
-        Performs BFS from the central point of the shape (average of all vertices).
-        Returns all visited points, never going outside of the edge boundary.
+        # The outline is thickness nodes wide, a line one node wide steps diagonally and
+        # the extra layer ensures that the pixels of each shape are fully connected
+        filled = self.tool in self.filled_tools
+        self.drawn.append((outline, self.tool, self.corners, filled))
+        self.edits += 1
+        if self.pool is None:
+            self.uf.union_many(self.templates.nodes(*self.corners, self.tool, self.thickness, filled))
+            self.uf.update_arr()
+        else:
+            self.jobs.append((self.pool.submit(self.templates.nodes, *self.corners, self.tool, self.thickness, filled), outline))
+    
+    def collect(self, block = False):
         """
-        if len(self.edges) < 3:
-            raise Exception("A shape must have at least 3 edges in order to be filled")
-        elif len(self.vertices) < 3:
-            raise Exception(f"Shape has {len(self.vertices)} vertices, must have at least 3 to be filled.")
-            
-        X, Y = self.get_centroid(self.vertices)
-        
-        if self.get_centroid in self.edges:
-            raise Exception(f"Shape is too small or thin to fill.")
-        
-        q = [(int(X), int(Y))]
-        visited = self.edges
-        while q:
-            next_level = []
-            for node in q:
-                for neighbor in self.get_neighbors(*node):
-                    if neighbor not in visited:
-                        visited.add(neighbor)
-                        next_level.append(neighbor)
-            q = next_level
-        self.nodes |= visited
-        
-    def fill_region(self, x, y, union_find):
+        Adds the shapes whose rasterization finished to the union find data structure, in release order,
+        as one journal step and repaints them in one batch.  block waits for all of them.  Returns True if any shape was added.
+        Every shape gets a union_many of its own, one call with all of them would make shapes that do not touch one group.
+        """
+        done = []
+        while self.jobs and (block or self.jobs[0][0].done()):
+            done.append(self.jobs.popleft()[0].result())
+        if not done:
+            return False
+        if hasattr(self.uf, "journal"):
+            self.uf.journal.begin()
+        for nodes in done:
+            self.uf.union_many(nodes)
+        if hasattr(self.uf, "journal"):
+            self.uf.journal.end()
+        self.uf.update_arr()
+        return True
+    
+    def flush(self):
+        """Waits for every released shape to be added."""
+        self.collect(block = True)
+    
+    def outlines(self):
+        """Vertices of the previewed shape and of the released shapes that are still rasterizing."""
+        return [outline for _, outline in self.jobs] + ([self.outline] if self.outline else [])
+    
+    def fill(self, x, y, box = None):
+        """Paint fill the region around (x, y) (right click), within box [x0, y0, x1, y1] if given."""
+        self.flush()
+        shape = Shape([(x, y)])
+        shape.fill_region(x, y, self.uf, box)
+        self.uf.union_many(shape, touching = True)
+        self.uf.update_arr()
+        self.edits += 1
+    
+    def erase(self, x, y):
+        """Erase every group with a node under the eraser brush (eraser_size wide) at (x, y)."""
+        self.flush()
+        nodes = hit_groups(self.uf, x, y, self.eraser_size // 2)
+        if not nodes:
+            return
+        if hasattr(self.uf, "journal"):
+            self.uf.journal.begin()
+        for node in nodes:
+            self.uf.delete_group(node)
+        if hasattr(self.uf, "journal"):
+            self.uf.journal.end()
+        self.edits += 1
+    
+    def erase_brush(self, points):
+        """Erase the pixels under the eraser brush along the path from the last eraser position through points."""
+        self.flush()
+        if not hasattr(self.uf, "erase_nodes"):
+            return
+        nodes = raster.polyline([self.anchor, *points], thickness = self.eraser_size)
+        self.anchor = points[-1]
+        if self.uf.erase_nodes(nodes):
+            self.edits += 1
+    
+    def erase_shape(self, x, y):
         """
-        Creates a shape by spreading out from the location (x, y) until 
+        Erase the pixels of the most recently drawn shape or freehand stroke that covers (x, y).
+        Returns True if a shape was erased.
         """
-        R, C = union_find.R, union_find.C
-        q = [(int(x), int(y))]
-        visited = set(union_find.id.keys()) | {(x, y)}
-        while q:
-            next_level = []
-            for node in q:
-                for neighbor in self.get_neighbors(*node):
-                    if neighbor not in visited and 0 <= neighbor[0] < C-1 and 0 <= neighbor[1] < R-1:
-                        visited.add(neighbor)
-                        next_level.append(neighbor)
-            q = next_level
-        self.nodes |= visited
-    
-def create_vertices(x0, y0, x1, y1, name = "rectangle"):
+        self.flush()
+        if not hasattr(self.uf, "erase_nodes"):
+            return False
+        for k in range(len(self.drawn) - 1, -1, -1):
+            vertices, tool, corners, filled = self.drawn[k]
+            v = np.asarray(vertices, dtype = float)
+            pad = self.thickness
+            if len(v) < 2 or not (v[:, 0].min() - pad <= x <= v[:, 0].max() + pad and v[:, 1].min() - pad <= y <= v[:, 1].max() + pad):
+                continue
+            if tool == "freehand":
+                nodes = raster.polyline(vertices, thickness = self.thickness)
+            else:
+                nodes = self.templates.nodes(*corners, tool, self.thickness, filled)
+            if ((nodes[:, 0] == x) & (nodes[:, 1] == y)).any():
+                del self.drawn[k]
+                if self.uf.erase_nodes(nodes):
+                    self.edits += 1
+                return True
+        return False
+    
+    def reset(self):
+        """Erase the entire board."""
+        self.flush()
+        self.uf.reset()
+        self.outline = []
+        self.drawn = []
+        self.edits += 1
+    
+    def undo(self):
+        """Revert the last edit, if the engine keeps an undo journal."""
+        self.end_stroke()
+        self.flush()
+        if hasattr(self.uf, "undo") and self.uf.undo():
+            self.edits += 1
+    
+    def redo(self):
+        """Repeat the last undone edit."""
+        self.end_stroke()
+        self.flush()
+        if hasattr(self.uf, "redo") and self.uf.redo():
+            self.edits += 1
+
+
+class Viewport():
     """
-    Fist click is position x0, y0
-    Current mouse position (or second click) is position x1, y1
-    Calculates the vertex points for the given shape
+    The part of the drawing plane shown in the window.
+    Node (x, y) is drawn at ((x - x0) * zoom, (y - y0) * zoom) in the window where (x0, y0) is origin.
+    Zoomed out only every step-th node is rendered, zoomed in every node becomes a zoom x zoom block.
+    Only boxes of the plane that changed and are visible get rendered into surface.
+    
+    params:
+        uf ArrayUnionFind or TiledUnionFind that stores the drawing
+        size (width, height) of the window
     """
-    if name == "line":
-        return [(x0, y0), (x1, y1)]
-    
-    x0, x1 = sorted((x0, x1))
-    y0, y1 = sorted((y0, y1), reverse = False)
-    if x0 == x1: x1 += 1
-    if y0 == y1: y0 += 1
-    
-    a, b, c, d = (x0, y0), (x1, y0), (x0, y1), (x1, y1) # four corners (TL, TR, BL, BR)
-    x_midpoint = (x0 + x1) / 2
-    y_midpoint = (y0 + y1) / 2
-    
-    if name == "rectangle":
-        vertices = [a, b, d, c]
-    elif name == "triangle1":
-        vertices = [(x_midpoint, y0), c, d]
-    elif name == "triangle3":
-        vertices = [(x_midpoint, y1), a, b]
-    elif name == "triangle2":
-        vertices = [(x0, y_midpoint), b, d]
-    elif name == "triangle4":
-        vertices = [(x1, y_midpoint), a, c]
-    elif name in ["pentagon", "star"]:
-        theta = 36 * math.pi / 180
-        hy= (x_midpoint - x0) * math.tan(theta) * (y0 - y1) / (x1 - x0)
-        hx = (y_midpoint - y1) * math.tan(theta / 2) * (x1 - x0) / (y0 - y1)
-        top = (x_midpoint, y0)
-        left = (x0, y0 - hy)
-        right = (x1, y0 - hy)
-        bottom_left = (x0 + hx, y1)
-        bottom_right = (x1 - hx, y1)
-        if name == "pentagon":
-            vertices = [top, right, bottom_right, bottom_left, left]
-        else:
-            vertices = [bottom_left, top, bottom_right, left, right]
-    else:
-        vertices = [(x0, y0), (x1, y1)]
+    zooms = (1 / 8, 1 / 4, 1 / 2, 1, 2, 4, 8)
+    
+    def __init__(self, uf, size):
+        self.uf = uf
+        self.W, self.H = size
+        self.surface = pygame.Surface(size)
+        # a plane the size of the window is also kept whole in plane, so at zoom 1 it is repainted with a fast blit.
+        # plane holds the palette slots of ArrayUnionFind (8 bits), merged groups only change its palette
+        self.plane = pygame.Surface((uf.R, uf.C), depth = 8) if (uf.R, uf.C) == tuple(size) else None
+        self.colormap_version = None
+        self.origin = (0, 0)
+        self.zoom = 1
+        self.stale = True # the whole window must be rendered again
+    
+    def to_plane(self, pos):
+        """Returns the node under window position pos."""
+        return (self.origin[0] + int(pos[0] / self.zoom), self.origin[1] + int(pos[1] / self.zoom))
+    
+    def to_screen(self, node):
+        """Returns the window position of node."""
+        return ((node[0] - self.origin[0]) * self.zoom, (node[1] - self.origin[1]) * self.zoom)
+    
+    def box(self):
+        """Returns the visible [x0, y0, x1, y1] box of the plane."""
+        x0, y0 = self.origin
+        return [x0, y0, min(self.uf.R, x0 + math.ceil(self.W / self.zoom)), min(self.uf.C, y0 + math.ceil(self.H / self.zoom))]
+    
+    def move(self, origin):
+        """Moves the origin, keeping the view on the plane."""
+        x0 = max(0, min(self.uf.R - int(self.W / self.zoom), origin[0]))
+        y0 = max(0, min(self.uf.C - int(self.H / self.zoom), origin[1]))
+        if (x0, y0) != self.origin:
+            self.origin = (x0, y0)
+            self.stale = True
+    
+    def scroll(self, dx, dy):
+        """Drags the plane by (dx, dy) window pixels."""
+        self.move((self.origin[0] - round(dx / self.zoom), self.origin[1] - round(dy / self.zoom)))
     
-    return vertices
+    def zoom_at(self, steps, pos):
+        """Zooms in (steps > 0) or out around window position pos."""
+        i = max(0, min(len(self.zooms) - 1, self.zooms.index(self.zoom) + steps))
+        node = self.to_plane(pos)
+        self.zoom = self.zooms[i]
+        self.stale = True
+        self.move((node[0] - int(pos[0] / self.zoom), node[1] - int(pos[1] / self.zoom)))
     
+    def refresh(self):
+        """Renders the visible boxes of the plane that changed into surface, returns the window rects to update."""
+        boxes = self.uf.take_updates()
+        if self.plane is not None:
+            pixels = pygame.surfarray.pixels2d(self.plane)
+            for x0, y0, x1, y1 in boxes:
+                pixels[x0:x1, y0:y1] = self.uf.slots[x0:x1, y0:y1]
+            del pixels # unlock the plane
+            if self.colormap_version != self.uf.colormap_version:
+                self.plane.set_palette(self.uf.colormap)
+                self.colormap_version = self.uf.colormap_version
+        boxes += self.uf.take_recolored() # same pixels, new colors
+        vx0, vy0, vx1, vy1 = self.box()
+        rects = []
+        if self.stale:
+            # the plane is black wherever there is no group
+            self.surface.fill((0, 0, 0))
+            rects.append(self.surface.get_rect())
+            boxes = list(self.uf.bbox.values())
+            if len(boxes) > self.uf.max_dirty:
+                boxes = [[min(b[0] for b in boxes), min(b[1] for b in boxes),
+                          max(b[2] for b in boxes), max(b[3] for b in boxes)]]
+            self.stale = False
+        step, scale = max(1, round(1 / self.zoom)), max(1, int(self.zoom))
+        source = self.plane if step == scale == 1 else None
+        
+        pixels = None if source is not None else pygame.surfarray.pixels3d(self.surface)
+        for x0, y0, x1, y1 in boxes:
+            # clip to the view and align to the sampled nodes
+            x0 = vx0 + -(-(max(x0, vx0) - vx0) // step) * step
+            y0 = vy0 + -(-(max(y0, vy0) - vy0) // step) * step
+            x1, y1 = min(x1, vx1), min(y1, vy1)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            if source is not None:
+                rect = pygame.Rect(x0, y0, x1 - x0, y1 - y0)
+                rects.append(self.surface.blit(source, (x0 - vx0, y0 - vy0), rect))
+                continue
+            rgb = self.uf.render_box([x0, y0, x1, y1], step)
+            if scale > 1:
+                rgb = rgb.repeat(scale, axis = 0).repeat(scale, axis = 1)
+            sx, sy = (x0 - vx0) // step * scale, (y0 - vy0) // step * scale
+            w, h = min(rgb.shape[0], self.W - sx), min(rgb.shape[1], self.H - sy)
+            pixels[sx:sx + w, sy:sy + h] = rgb[:w, :h]
+            rects.append(pygame.Rect(sx, sy, w, h))
+        del pixels # unlock the surface
+        return rects
+
 
 class Game():
-    def __init__(self, **kwargs):
+    """
+    params:
+        record path of a file to record every input event to (see recording.py)
+        replay path of a recording to read input events from instead of the mouse and keyboard
+        fast replay as fast as possible instead of at the recorded speed
+        profile None to run uninstrumented, otherwise show the profiler overlay and write its trace to this path ("" for no trace)
+        load path of a saved drawing to open (see storage.py)
+        image path of a bitmap (PNG or .npy mask) to import as the drawing (see importer.py)
+        export directory of PNG frames or video file to export the drawing to as it changes (see export.py)
+        **kwargs settings.settings
+    """
+    KEYS = {pygame.K_UP: recording.UP, pygame.K_DOWN: recording.DOWN, pygame.K_ESCAPE: recording.ESCAPE,
+            pygame.K_F5: recording.SAVE, pygame.K_F9: recording.LOAD, pygame.K_z: recording.UNDO, pygame.K_y: recording.REDO,
+            pygame.K_h: recording.STATS, pygame.K_e: recording.ERASER}
+    BUTTONS = (recording.LEFT, recording.MIDDLE, recording.RIGHT, recording.WHEEL_UP, recording.WHEEL_DOWN)
+    
+    def __init__(self, record = None, replay = None, fast = False, profile = None, load = None, image = None, export = None, **kwargs):
         pygame.init()
         for key in kwargs:
             self.__dict__[key] = kwargs[key]
+        
+        # Record or replay the input events
+        self.replay = recording.Replay(replay) if replay else None
+        if self.replay:
+            self.WIDTH, self.HEIGHT = self.replay.size
+            self.CANVAS = self.replay.canvas
+        canvas = tuple(self.CANVAS or (self.WIDTH, self.HEIGHT))
+        self.frames = iter(self.replay) if self.replay else None
+        self.pending = next(self.frames, None) if self.replay else None # next recorded event
+        self.recorder = recording.Recorder(record, (self.WIDTH, self.HEIGHT), canvas) if record else None
+        self.fast = fast
+        self.start = time.time()
+        self.now = 0 # seconds since the start of the events of this frame, recorded time when replaying
+        self.clock = pygame.time.Clock()
+        
         self.SURFACE = pygame.display.set_mode((self.WIDTH, self.HEIGHT))
         pygame.display.set_caption('Union Find Visualization')
         
@@ -278,163 +437,443 @@ class Game():
         
         self.active = True           # True when the game is running
         self.left_click_down = False # monitor status of left click
+        self.redraw = True           # draw the next frame even without input
         
         # Cycle through shape to draw
-        self.shapes = ["line", "rectangle", "triangle1", "triangle2", "triangle3", "triangle4",
-                       "pentagon", "star", "freehand", "eraser"]
+        self.shapes = Session.tools
         self.shape_id = 0
         self.icon_rect = [213, 8, 684, 50] # [x0, y0, x1, y1]
         self.shape_icons_x_loc = [212, 253, 299, 351, 396, 446, 489, 545, 600, 643] # left edge of each icon
         
         
-        self.banner = [pygame.image.load(f"./graphics/{i}.png") for i in range(len(self.shapes))]
-        banner_height = int(self.banner[0].get_height() * (self.WIDTH / self.banner[0].get_width()))
-        self.banner = [pygame.transform.scale(self.banner[i], (self.WIDTH, banner_height)) for i in range(len(self.banner))]
+        # Banners are loaded and scaled to the window width the first time they are shown
+        self.banners = {} # shape_id: scaled banner
+        first = pygame.image.load("./graphics/0.png")
+        banner_height = int(first.get_height() * (self.WIDTH / first.get_width()))
+        self.banner_rect = pygame.Rect(0, 0, self.WIDTH, banner_height)
+        self.banner_id = None # shape_id of the banner currently on screen
 
-        # Record drawn shapes in a Union Find data structure
-        self.uf = UnionFind(surface_shape = (self.WIDTH, self.HEIGHT),
-                            brightness = self.BRIGHTNESS,
-                            color_wheel = self.COLOR_WHEEL)
+        # Record drawn shapes in a Union Find data structure, planes larger than the window are stored in tiles
+        engine = ArrayUnionFind if canvas == (self.WIDTH, self.HEIGHT) else TiledUnionFind
+        self.uf = engine(surface_shape = canvas,
+                         brightness = self.BRIGHTNESS,
+                         color_wheel = self.COLOR_WHEEL,
+                         undo_budget = self.UNDO_BUDGET)
+        self.view = Viewport(self.uf, (self.WIDTH, self.HEIGHT))
+        self.pan = None # window position of the mouse while dragging the view with the middle button
+        self.session = Session(self.uf, thickness = self.THICKNESS, workers = self.WORKERS, eraser_size = self.ERASER_SIZE,
+                               template_budget = self.TEMPLATE_CACHE)
+        
+        # Screen areas covered by the outlines drawn last frame
+        self.outline_rects = []
+        
+        # Mouse positions sampled while holding left click, drawn once per frame
+        self.motion = []
+        self.cursor = (0, 0) # window position of the mouse
+        
+        # Group statistics shown in the corner (H toggles them), with the group count after each of the last edits
+        self.show_hud = self.HUD
+        self.hud_rect = None # screen area covered by the statistics last frame
+        self.font = None
+        self.group_counts = collections.deque([0], maxlen = 120)
+        self.counted = 0     # session.edits when group_counts was last appended to
+        
+        # Saved drawings, autosaves are written by a background thread every AUTOSAVE_EVERY edits
+        self.autosaved = 0       # session.edits at the last autosave
+        self.autosaving = None   # thread writing the last autosave
+        self.mapped = None       # real path of the file the loaded drawing is memory mapped from
+        if load:
+            self.load(load)
+        if image:
+            self.import_image(image)
+        
+        # Frames of the drawing written by a background thread, replays wait for it instead of dropping frames
+        self.exporter = None
+        if export:
+            self.exporter = Exporter(export, (self.WIDTH, self.HEIGHT), self.EXPORT_FPS, self.EXPORT_QUEUE,
+                                     block = bool(self.replay and fast))
         
-        # Store temporary shapes (outlined but not drawn here)
-        self.shape_outline = set()
+        # Opt-in instrumentation, nothing is wrapped unless profiling
+        self.profiler = None
+        self.overlay_rect = None # screen area covered by the profiler overlay last frame
+        if profile is not None:
+            self.profiler = profiler.Profiler(trace = profile)
+            self.instrument()
         
-        # Inputs are locked until time > input_lock
-        self.input_lock = -1
+    def instrument(self):
+        """Wraps the hot paths of a frame in profiler timers."""
+        wrap = self.profiler.wrap
+        wrap(self, "get_events", "events")
+        for name in ("get_edges", "fill_shape", "fill_region"):
+            wrap(Shape, name, "rasterize")
+        wrap(self.uf, "union")
+        wrap(self.uf, "union_many")
+        wrap(self.uf, "merge")
+        wrap(self.uf, "erase_nodes")
+        wrap(self.uf, "update_arr")
+        wrap(self.uf, "update_surface")
+        wrap(self, "draw")
+        if self.exporter:
+            wrap(self.exporter, "frame", "export")
         
-    def temporary_lock(self):
-        """Temporarily locks out keys to prevent accidental double key presses."""
-        self.input_lock = time.time() + self.LOCK_TIME
+    def banner(self, shape_id):
+        """Returns the banner of drawing tool shape_id scaled to the window."""
+        if shape_id not in self.banners:
+            image = pygame.image.load(f"./graphics/{shape_id}.png")
+            self.banners[shape_id] = pygame.transform.scale(image, self.banner_rect.size)
+        return self.banners[shape_id]
+        
+    def select(self, shape_id):
+        """Switch to drawing tool shape_id."""
+        self.shape_id = shape_id % len(self.shapes)
+        self.session.select(self.shapes[self.shape_id])
+        print(self.shapes[self.shape_id])
         
     def run(self):
         
         while self.active:
-            time.sleep(self.SLEEP_TIME)
-            self.get_events()
-            keys = pygame.key.get_pressed()
-            mouse = pygame.mouse.get_pressed()
-            mouse_pos = pygame.mouse.get_pos()
-            t = time.time()
-            
-            # =============================================================================
-            # KEY INPUTS AND RIGHT CLICK FILL     
-            # =============================================================================
-            if t >= self.input_lock:
-                if keys[pygame.K_UP]:
-                    # Change to next shape
-                    self.shape_id = (self.shape_id + 1) % len(self.shapes)
-                    self.temporary_lock()
-                    print(self.shapes[self.shape_id])
-                    # TODO: update icon
-                elif keys[pygame.K_DOWN]:
-                    # Change to previous shape
-                    self.shape_id = (self.shape_id - 1) % len(self.shapes)
-                    self.temporary_lock()
-                    print(self.shapes[self.shape_id])
-                    # TODO: update shape icon
-                elif keys[pygame.K_ESCAPE]:
-                    # Erase the board
-                    self.uf.reset()
-                elif mouse[2]:
-                    # Paint fill current area (right click)
-                    self.temporary_lock()
-                    shape = Shape([mouse_pos])
-                    shape.fill_region(*mouse_pos, self.uf)
-                    for node in shape.nodes:
-                        node = (int(node[0]), int(node[1]))
-                        self.uf.union(node, node)
-                        ids = set()
-                        for neighbor in Shape.get_neighbors(*node):
-                            if neighbor in self.uf.id:
-                                ids.add(self.uf.union(node, neighbor))
-                    self.uf.update_arr()
-            
-            # =============================================================================
-            # SWITCHING TOOLS BY MOUSE AND DRAWING SHAPES
-            # =============================================================================
-            if not self.left_click_down and mouse[0]:
-                x0, y0 = mouse_pos
-                
-                #Handle switching tools by mouse
-                if self.icon_rect[0] < x0 <= self.icon_rect[2] and self.icon_rect[1] <= y0 <= self.icon_rect[3]:
-                    self.shape_id = bisect.bisect_left(self.shape_icons_x_loc, x0) - 1
-                    print(self.shapes[self.shape_id])
-                elif 12 <= x0 <= 63 and 15 <= y0 <= 44:
-                    self.uf.reset()
-                else:
-                    self.left_click_down = True
-                    self.temporary_lock()
-                    
-            elif self.left_click_down and mouse[0]:
-                if self.shapes[self.shape_id] == "eraser":
-                    if mouse_pos in self.uf.id:
-                        self.uf.delete_group(mouse_pos)
-                elif self.shapes[self.shape_id] == "freehand":
-                    vertices = [(x0, y0), mouse_pos]
-                    shape = Shape(vertices)
-                    for node in shape.nodes:
-                        self.uf.union(node, node)
-                        for neighbor in Shape.get_neighbors(*node):
-                            self.uf.union(node, neighbor)
-                    self.uf.update_arr()
-                    x0, y0 = mouse_pos
-                else:
-                    # while holding left click, preview shape
-                    x1, y1 = mouse_pos
-                    x1 = max(0, min(self.WIDTH - 2, x1))
-                    y1 = max(0, min(self.HEIGHT - 2, y1))
-                    vertices = create_vertices(x0, y0, x1, y1, name = self.shapes[self.shape_id])
-                    self.shape_outline = vertices[:]
-                    shape = Shape(vertices)
-            elif self.left_click_down and not mouse[0]:
-                # release to draw shape; use try and catch to handle errors from too small of shape
-                self.left_click_down = False
-                if self.shapes[self.shape_id] != "eraser":
-                    self.shape_outline = set()
-                    if self.shape_id <= -1: # only fill shapes do not fill star or free hand drawings
-                        try: shape.fill_shape()
-                        except: pass # Shape is too small/thin do not fill
-                        
-                    # add the shape's nodes to the union find data structure
-                    for node in shape.nodes:
-                        node = (int(node[0]), int(node[1]))
-                        self.uf.union(node, node)
-                        for neighbor in Shape.get_neighbors(*node):
-                            # Normally here we would have "if neighbor in self.uf.id" but we need to
-                            # thicken the lines a little to ensure all nodes in a shape have an edge
-                            # omitting this (and absorbing one non-shape node layer) ensures that the
-                            # pixels of each shape are fully connected
-                            self.uf.union(node, neighbor)
-                    self.uf.update_arr()
+            # nothing changes on screen without input, except the profiler overlay
+            changed = self.redraw
+            if self.redraw or self.profiler:
+                self.draw()
+                self.redraw = False
+            if self.exporter:
+                self.exporter.frame(self.now, self.view, changed)
+            if self.profiler:
+                templates = self.session.templates
+                self.profiler.frame(nodes = len(self.uf.id), groups = len(self.uf.bbox),
+                                    template_hits = templates.hits, template_misses = templates.misses)
+            self.clock.tick(0 if self.replay and self.fast else self.FPS)
             
-            self.draw()
-    
+            # apply all input that arrived since the last frame
+            events = self.get_events()
+            for event in events:
+                self.handle(event)
+            self.flush_motion()
+            self.redraw |= bool(events)
+            self.redraw |= self.session.collect()
+            if self.session.edits != self.counted and not self.session.jobs:
+                self.group_counts.append(len(self.uf.groups))
+                self.counted = self.session.edits
+            if self.AUTOSAVE_EVERY and self.session.edits - self.autosaved >= self.AUTOSAVE_EVERY:
+                self.autosave()
+        
+        self.finish()
         pygame.quit()
         
     def get_events(self):
-        """Gets key and mouse inputs.  Deactivates game if input action was quit."""
-        self.events = pygame.event.poll()
-        if self.events.type == pygame.QUIT:
+        """
+        Returns the input events of this frame as recording.Events (read from the replay when replaying).
+        Blocks until there is input so that an idle window does not use the CPU.
+        """
+        if self.replay:
+            return self.replay_events()
+        
+        # wake up regularly to add shapes rasterized in the background and to keep the profiler overlay up to date
+        if self.session.jobs:
+            first = pygame.event.wait(1000 // self.FPS)
+        elif self.profiler:
+            first = pygame.event.wait(int(self.profiler.refresh * 1000))
+        else:
+            first = pygame.event.wait()
+        t = int((time.time() - self.start) * 1e6)
+        self.now = t / 1e6
+        events = []
+        for e in [first, *pygame.event.get()]:
+            if e.type == pygame.MOUSEMOTION:
+                events.append(recording.Event(t, recording.MOTION, 0, e.pos))
+            elif e.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and e.button in self.BUTTONS:
+                kind = recording.PRESS if e.type == pygame.MOUSEBUTTONDOWN else recording.RELEASE
+                events.append(recording.Event(t, kind, e.button, e.pos))
+            elif e.type == pygame.KEYDOWN and e.key in self.KEYS:
+                events.append(recording.Event(t, recording.KEY, self.KEYS[e.key], pygame.mouse.get_pos()))
+            elif e.type == pygame.QUIT:
+                events.append(recording.Event(t, recording.QUIT, 0, pygame.mouse.get_pos()))
+            elif e.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                # the window contents were lost, repaint everything
+                self.view.stale = True
+                self.banner_id = None
+                self.redraw = True
+        if self.recorder:
+            for event in events:
+                self.recorder.write(event)
+        return events
+    
+    def replay_events(self):
+        """Returns the recorded events that are due, at the recorded pace unless fast."""
+        pygame.event.pump() # keep the window responsive
+        if self.pending is None:
             self.active = False
-        self.keys_press = pygame.key.get_pressed()
-        self.mouse_press = pygame.mouse.get_pressed()
-        self.mouse_pos = pygame.mouse.get_pos()
+            return []
+        if self.fast:
+            due = self.pending.t + 1e6 / self.FPS
+        else:
+            time.sleep(max(0, self.start + self.pending.t / 1e6 - time.time()))
+            due = (time.time() - self.start) * 1e6
+        self.now = due / 1e6
+        events = []
+        while self.pending is not None and self.pending.t <= due:
+            events.append(self.pending)
+            self.pending = next(self.frames, None)
+        return events
+        
+    def handle(self, event):
+        """Applies one input event."""
+        kind, code, pos = event.kind, event.code, event.pos
+        self.cursor = pos
+        if kind == recording.MOTION:
+            if self.pan:
+                self.view.scroll(pos[0] - self.pan[0], pos[1] - self.pan[1])
+                self.pan = pos
+            elif self.left_click_down:
+                self.motion.append(self.view.to_plane(pos))
+            return
+        
+        # every motion sample before this event is drawn first
+        self.flush_motion()
+        if kind == recording.QUIT:
+            self.active = False
+        elif kind == recording.KEY:
+            if code == recording.UP:
+                self.select(self.shape_id + 1)
+            elif code == recording.DOWN:
+                self.select(self.shape_id - 1)
+            elif code == recording.ESCAPE:
+                self.session.reset()
+            elif code == recording.SAVE:
+                self.save(self.SAVE_FILE)
+            elif code == recording.LOAD:
+                self.load(self.SAVE_FILE)
+            elif code == recording.UNDO:
+                self.session.undo()
+            elif code == recording.REDO:
+                self.session.redo()
+            elif code == recording.STATS:
+                self.show_hud = not self.show_hud
+            elif code == recording.ERASER:
+                modes = Session.eraser_modes
+                self.session.select_eraser(modes[(modes.index(self.session.eraser) + 1) % len(modes)])
+                print(f"eraser: {self.session.eraser}")
+        elif kind == recording.PRESS and code == recording.RIGHT:
+            # Paint fill current area (the visible part of it)
+            self.session.fill(*self.view.to_plane(pos), self.view.box())
+        elif kind == recording.PRESS and code in (recording.WHEEL_UP, recording.WHEEL_DOWN):
+            self.view.zoom_at(1 if code == recording.WHEEL_UP else -1, pos)
+        elif kind == recording.PRESS and code == recording.MIDDLE:
+            self.pan = pos
+        elif kind == recording.RELEASE and code == recording.MIDDLE:
+            self.pan = None
+        elif kind == recording.PRESS and code == recording.LEFT and not self.left_click_down:
+            x0, y0 = pos
+            
+            #Handle switching tools by mouse
+            if self.icon_rect[0] < x0 <= self.icon_rect[2] and self.icon_rect[1] <= y0 <= self.icon_rect[3]:
+                self.select(bisect.bisect_left(self.shape_icons_x_loc, x0) - 1)
+            elif 12 <= x0 <= 63 and 15 <= y0 <= 44:
+                self.session.reset()
+            else:
+                self.left_click_down = True
+                self.session.press(*self.view.to_plane(pos))
+        elif kind == recording.RELEASE and code == recording.LEFT and self.left_click_down:
+            # release to draw shape
+            self.left_click_down = False
+            self.session.release(*self.view.to_plane(pos))
+    
+    def flush_motion(self):
+        """Erase, draw freehand or preview the shape along the mouse path collected while holding left click."""
+        if self.motion:
+            self.session.trace(self.motion)
+            self.motion = []
+    
+    def save(self, path):
+        """Saves the drawing to path, a drawing that can not be saved is reported and the game goes on."""
+        self.session.flush()
+        self.detach_from(path)
+        try:
+            storage.save(path, *self.uf.state())
+        except OSError as e:
+            print(f"could not save {path}: {e}")
+            return
+        print(f"saved {path}")
+    
+    def load(self, path):
+        """Replaces the drawing with the one saved at path, its arrays are memory mapped and read when needed."""
+        self.session.flush()
+        try:
+            self.uf.load_state(*storage.load(path))
+        except (OSError, ValueError) as e:
+            print(f"could not load {path}: {e}")
+            return
+        self.mapped = os.path.realpath(path)
+        self.session.drawn = [] # the shapes the loaded drawing was made of are not known
+        self.view.stale = True
+        self.redraw = True
+        print(f"loaded {path}")
+    
+    def detach_from(self, path):
+        """
+        Copies the loaded drawing into memory before path is written, if it is memory mapped from path.
+        Drawings mapped from other files stay mapped and are only read when needed.
+        """
+        if self.mapped is not None and os.path.realpath(path) == self.mapped:
+            self.uf.detach()
+            self.mapped = None
+    
+    def import_image(self, path):
+        """Replaces the drawing with the connected groups of the bitmap at path."""
+        self.session.flush()
+        try:
+            count = importer.import_image(self.uf, path, connectivity = self.CONNECTIVITY)
+        except (OSError, ValueError, pygame.error) as e:
+            print(f"could not import {path}: {e}")
+            return
+        self.session.drawn = []
+        self.view.stale = True
+        self.redraw = True
+        print(f"imported {count} groups from {path}")
+    
+    def autosave(self):
+        """
+        Copies the drawing and writes it to AUTOSAVE_FILE in the user's data directory (see storage.data_path)
+        on a background thread (skipped while one is running).
+        """
+        if self.autosaving and self.autosaving.is_alive():
+            return
+        self.session.flush()
+        path = storage.data_path(self.AUTOSAVE_FILE)
+        self.detach_from(path)
+        meta, arrays = self.uf.state()
+        arrays = {name: np.array(arr) for name, arr in arrays.items()} # the thread writes a copy, the drawing goes on
+        self.autosaving = threading.Thread(target = self.write_autosave, args = (path, meta, arrays), daemon = True)
+        self.autosaving.start()
+        self.autosaved = self.session.edits
+
+    def write_autosave(self, path, meta, arrays):
+        """Runs on the autosave thread, an autosave that fails is reported like a failed save."""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            storage.save(path, meta, arrays)
+        except OSError as e:
+            print(f"could not autosave to {path}: {e}")
+    
+    def finish(self):
+        """Closes the recording, or checks that the replay reproduced the recorded canvas, and writes the profile trace."""
+        self.session.flush()
+        if self.recorder:
+            self.recorder.close(recording.digest(self.uf.snapshot()))
+        if self.replay and self.replay.digest is not None:
+            same = self.replay.digest == recording.digest(self.uf.snapshot())
+            print("replay matches the recording" if same else "replay does NOT match the recording")
+        if self.profiler:
+            self.profiler.close()
+        if self.exporter:
+            self.view.refresh() # the last frame shows the shapes flushed above
+            frames = self.exporter.close(self.now, self.view)
+            print(f"exported {frames} frames ({self.exporter.dropped} dropped) to {self.exporter.path}")
+        if self.autosaving:
+            self.autosaving.join()
 
+    def hud(self):
+        """Returns a translucent surface with the group count (and a graph of it over the last edits), the largest group and the group under the mouse."""
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, 20)
+        groups = self.uf.groups
+        lines = [f"groups {len(groups)}"]
+        for name, stats in (("largest", groups.largest()), ("cursor", groups.at(self.view.to_plane(self.cursor)))):
+            if stats is None:
+                lines.append(f"{name:<8}-")
+                continue
+            x0, y0, x1, y1 = stats.bbox
+            lines.append(f"{name:<8}#{stats.id}  {stats.size} px  {x1 - x0}x{y1 - y0} at ({x0}, {y0})  "
+                         f"centroid ({stats.centroid[0]:.0f}, {stats.centroid[1]:.0f})")
+        
+        text = [self.font.render(line, True, (230, 230, 230)) for line in lines]
+        graph = pygame.Rect(5, sum(t.get_height() for t in text) + 10, self.group_counts.maxlen, 30)
+        image = pygame.Surface((max(graph.width, *(t.get_width() for t in text)) + 10, graph.bottom + 5), pygame.SRCALPHA)
+        image.fill((0, 0, 0, 170))
+        y = 5
+        for t in text:
+            image.blit(t, (5, y))
+            y += t.get_height()
+        top = max(self.group_counts) or 1
+        points = [(graph.left + i, graph.bottom - 1 - count * (graph.height - 1) // top) for i, count in enumerate(self.group_counts)]
+        if len(points) > 1:
+            pygame.draw.lines(image, (230, 230, 230), False, points)
+        return image
+    
     def draw(self):
+        """Redraws only the parts of the window that changed since the last frame."""
+        # regions of the canvas that changed, the outlines drawn last frame and the outlines to draw now
+        # (the previewed shape and the released shapes that are still rasterizing)
+        rects = self.view.refresh()
+        rects += self.outline_rects
+        outlines = [[self.view.to_screen(vertex) for vertex in outline] for outline in self.session.outlines()]
+        self.outline_rects = []
+        for outline in outlines:
+            xs, ys = zip(*outline)
+            rect = pygame.Rect(min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+            rect.inflate_ip(10, 10) # line width
+            self.outline_rects.append(rect)
+        rects += self.outline_rects
+        
+        # the group statistics are drawn over the drawing every frame they are shown
+        if self.show_hud or self.hud_rect:
+            hud = self.hud() if self.show_hud else None
+            rect = hud.get_rect(bottomright = (self.WIDTH, self.HEIGHT)) if hud else None
+            rects.append(rect.union(self.hud_rect) if rect and self.hud_rect else rect or self.hud_rect)
+            self.hud_rect = rect
+        
+        # the profiler overlay is drawn over everything else every frame
+        if self.profiler:
+            overlay = self.profiler.overlay()
+            rect = overlay.get_rect(bottomleft = (0, self.HEIGHT))
+            rects.append(rect.union(self.overlay_rect) if self.overlay_rect else rect)
+            self.overlay_rect = rect
+        
+        # the banner is translucent so whatever is beneath it must be redrawn first
+        redraw_banner = self.banner_id != self.shape_id or self.banner_rect.collidelist(rects) != -1
+        if redraw_banner:
+            rects.append(self.banner_rect)
+            self.banner_id = self.shape_id
+        
         # blit shapes already made and merged
-        self.SURFACE.blit(self.uf.surface, (0, 0))
+        for rect in rects:
+            self.SURFACE.blit(self.view.surface, rect, rect)
         
         # blit oultine of shape being considered (use pygame.draw)
-        if self.shape_outline:
+        for outline in outlines:
             pygame.draw.lines(self.SURFACE, (200, 200, 200), True, 
-                               self.shape_outline, 5)
+                               outline, 5)
             
+        if self.hud_rect:
+            self.SURFACE.blit(hud, self.hud_rect)
+        
         # add banner indicating current setting
-        self.SURFACE.blit(self.banner[self.shape_id], (0, 0))
+        if redraw_banner:
+            self.SURFACE.blit(self.banner(self.shape_id), (0, 0))
+        
+        if self.profiler:
+            self.SURFACE.blit(overlay, self.overlay_rect)
         
-        pygame.display.flip()
+        pygame.display.update(rects)
 
 
 if __name__ == "__main__":
-    g = Game(**settings.settings)
+    parser = argparse.ArgumentParser(description = "Union find drawing demo")
+    parser.add_argument("--record", metavar = "FILE", help = "record every input frame to FILE")
+    parser.add_argument("--replay", metavar = "FILE", help = "replay a recording instead of reading the mouse and keyboard")
+    parser.add_argument("--fast", action = "store_true", help = "replay as fast as possible instead of at the recorded speed")
+    parser.add_argument("--profile", metavar = "TRACE", nargs = "?", const = "profile.csv",
+                        help = "show per stage timings and write them to TRACE (.csv or .json, default profile.csv) on exit")
+    parser.add_argument("--load", metavar = "FILE", help = "open a saved drawing")
+    parser.add_argument("--import", metavar = "FILE", dest = "image", help = "import a PNG or .npy bitmap as the drawing")
+    parser.add_argument("--export", metavar = "PATH", help = "export the drawing as it changes to a directory of PNG frames or a video file (needs ffmpeg)")
+    parser.add_argument("--headless", action = "store_true", help = "run without a window, for replays")
+    args = parser.parse_args()
+    if args.headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+    
+    g = Game(record = args.record, replay = args.replay, fast = args.fast, profile = args.profile, load = args.load,
+             image = args.image, export = args.export, **settings.settings)
     g.run()    
\ No newline at end of file